@@ -0,0 +1,1407 @@
+"""Один торговый аккаунт: свой HTTP-клиент, позиции и параметры трейлинга.
+
+Цены и параметры инструментов общие для всех аккаунтов процесса: аккаунт
+подписывается на символы через PublicFeed и читает цены из PriceCache.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, MutableMapping, Optional, Set, Tuple
+
+import numpy as np
+from pybit.unified_trading import HTTP
+from requests.adapters import HTTPAdapter
+
+import metrics
+import trailing
+from cadence import CheckSchedule, check_intervals
+from config import DEFAULT_ACCOUNT, AccountConfig, BotConfig
+from feed import WS_MESSAGES, PublicFeed, safe_float
+from instruments import InstrumentCache
+from locks import TimedLock
+from orders import OrderBatcher
+from positions import PositionKey, PositionRecord, PositionTable, format_key
+from prices import PriceCache
+from scheduler import (
+    PRIORITY_READ,
+    PRIORITY_STOP_LOSS,
+    PRIORITY_TAKE_PROFIT,
+    RATE_LIMIT_RET_CODE,
+    RestScheduler,
+)
+from state_store import SavedPosition, StateStore, saved_position
+from subscriptions import EndpointWebSocket
+
+POLL_INTERVAL = 2
+PRIVATE_STREAM_STALE_AFTER = 30
+CONTENTION_LOG_INTERVAL = 300
+# Режим exchange: не чаще чем раз во столько секунд повторно выставлять нативный трейлинг позиции
+EXCHANGE_TRAILING_RETRY = 60
+# Не чаще чем раз во столько секунд повторять неудавшуюся подгонку тейк-профита позиции
+TAKE_PROFIT_AMEND_RETRY = 10
+
+TICK_TO_STOP_LATENCY = metrics.histogram(
+    "bytrailor_tick_to_stop_seconds",
+    "Time from receiving a ticker update to the set_trading_stop response for the stop it moved",
+    ("account",),
+)
+TRAILING_PASS_DURATION = metrics.histogram(
+    "bytrailor_trailing_pass_seconds", "Duration of one trailing_loop pass, excluding the sleep", ("account",)
+)
+TRAILING_CHECKS = metrics.counter(
+    "bytrailor_trailing_checks", "Positions evaluated by the adaptive trailing scheduler", ("account",)
+)
+
+OrderKey = Tuple[str, int, str, bool]
+OrdersIndex = Dict[OrderKey, Dict[str, Dict[str, Any]]]
+OPEN_ORDERS_PAGE_LIMIT = 50
+OPEN_ORDERS_MAX_PAGES = 20
+# Условные ордера стопа тоже reduce-only, но тейк-профитом не являются
+STOP_ORDER_TYPES = {"StopLoss", "PartialStopLoss", "TrailingStop"}
+OPEN_ORDER_STATUSES = {"New", "PartiallyFilled", "Untriggered"}
+
+
+def order_key(order: Dict[str, Any]) -> OrderKey:
+    return (
+        order.get("symbol", ""),
+        int(order.get("positionIdx", 0)),
+        order.get("side", ""),
+        bool(order.get("reduceOnly", False)),
+    )
+
+
+def has_take_profit_order(
+    symbol: str,
+    position_idx: int,
+    side: str,
+    orders_index: Optional[OrdersIndex],
+) -> bool:
+    if orders_index is None:
+        return False
+    opposite_side = "Sell" if side == "Buy" else "Buy"
+    orders = orders_index.get((symbol, position_idx, opposite_side, True), {})
+    return any(order.get("stopOrderType", "") not in STOP_ORDER_TYPES for order in orders.values())
+
+
+def create_http(
+    testnet: bool, api_key: str = "", api_secret: str = "", pool_size: int = 10, endpoint: str = ""
+) -> Any:
+    # Ответ 10006 (лимит запросов) обрабатывает планировщик: pybit не должен спать
+    # внутри вызова, а заголовки X-Bapi-Limit-* нужны для token bucket
+    http = HTTP(
+        testnet=testnet,
+        api_key=api_key or None,
+        api_secret=api_secret or None,
+        retry_codes={10002},
+        ignore_codes={RATE_LIMIT_RET_CODE},
+        return_response_headers=True
+    )
+    # Пул keep-alive соединений должен вмещать все параллельные запросы,
+    # иначе лишние соединения будут открываться и закрываться на каждый запрос
+    pool_size = max(10, pool_size)
+    http.client.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    if endpoint:
+        # Локальная биржа (BYBIT_API_URL): обычно http://
+        http.endpoint = endpoint
+        http.client.mount("http://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return http
+
+
+class _AccountLog(logging.LoggerAdapter):
+    """Добавляет имя аккаунта в начало сообщений, когда аккаунтов несколько"""
+
+    def process(self, msg: Any, kwargs: MutableMapping[str, Any]) -> Tuple[Any, MutableMapping[str, Any]]:
+        return f"{self.extra['prefix']}{msg}", kwargs
+
+
+class TickTrailingEngine:
+    """Трейлинг по тикам: оценка стопа на каждое обновление цены.
+
+    Колбэк WebSocket только помечает символ как изменившийся; оценка идёт в
+    отдельном потоке, а запросы set_trading_stop объединяются по позиции:
+    не более одного запроса в полёте и не чаще одного раза в min_interval
+    секунд. Между отправками в очереди остаётся только последний стоп.
+    """
+
+    # Режим в строке лога отправки стопа
+    mode = "tick"
+
+    def __init__(self, account: "Account", min_interval: float, sender_workers: int = 4) -> None:
+        self.account = account
+        self.min_interval = min_interval
+        self.sender_workers = sender_workers
+        self._tick_cond = threading.Condition()
+        self._dirty: Set[str] = set()
+        self._send_cond = threading.Condition()
+        # (сторона, стоп, время получения тика, по которому стоп рассчитан)
+        self._pending: Dict[PositionKey, Tuple[str, float, float]] = {}
+        self._in_flight: Set[PositionKey] = set()
+        # Стоп запроса в полёте: до ответа биржи новый стоп сравнивается с ним
+        self._pending_sl: Dict[PositionKey, float] = {}
+        self._last_sent_at: Dict[PositionKey, float] = {}
+        self._last_sent_sl: Dict[PositionKey, float] = {}
+
+    def start(self) -> None:
+        name = self.account.name
+        threading.Thread(target=self._evaluate_loop, name=f"tick-trailing-{name}", daemon=True).start()
+        for i in range(self.sender_workers):
+            threading.Thread(target=self._send_loop, name=f"tick-sender-{name}-{i}", daemon=True).start()
+
+    def notify(self, symbol: str) -> None:
+        with self._tick_cond:
+            self._dirty.add(symbol)
+            self._tick_cond.notify()
+
+    def notify_many(self, symbols: List[str]) -> None:
+        with self._tick_cond:
+            self._dirty.update(symbols)
+            self._tick_cond.notify()
+
+    def forget(self, key: PositionKey) -> None:
+        """Сбрасывает состояние закрытой позиции, чтобы новая позиция с тем же ключом начала с нуля"""
+        with self._send_cond:
+            self._last_sent_sl.pop(key, None)
+            self._last_sent_at.pop(key, None)
+            self._pending.pop(key, None)
+            self._pending_sl.pop(key, None)
+
+    def submit(self, key: PositionKey, side: str, stop_loss: float, received_at: float = 0.0) -> None:
+        with self._send_cond:
+            pending = self._pending.get(key)
+            if pending:
+                reference = pending[1]
+            else:
+                reference = self._pending_sl.get(key, self._last_sent_sl.get(key))
+            if reference is not None and not trailing.is_better_stop(side, stop_loss, reference):
+                return
+            self._pending[key] = (side, stop_loss, received_at)
+            self._send_cond.notify()
+
+    def _evaluate_loop(self) -> None:
+        account = self.account
+        while True:
+            try:
+                with self._tick_cond:
+                    while not self._dirty:
+                        self._tick_cond.wait()
+                    symbols = self._dirty
+                    self._dirty = set()
+
+                updates = account.evaluate_trailing(list(symbols))
+                for key, side, new_stop_loss in updates:
+                    self.submit(key, side, new_stop_loss, account.price_cache.received_at(key[0]))
+            except Exception as e:
+                account.log.error("Error in tick trailing engine: %s", e)
+
+    def _next_ready(self, now: float) -> Tuple[Optional[PositionKey], Optional[float]]:
+        wait = None
+        for key in self._pending:
+            if key in self._in_flight:
+                continue
+            ready_at = self._last_sent_at.get(key, 0.0) + self.min_interval
+            if ready_at <= now:
+                return key, None
+            if wait is None or ready_at - now < wait:
+                wait = ready_at - now
+        return None, wait
+
+    def _send_loop(self) -> None:
+        account = self.account
+        while True:
+            try:
+                with self._send_cond:
+                    while True:
+                        key, wait = self._next_ready(time.monotonic())
+                        if key is not None:
+                            break
+                        self._send_cond.wait(wait)
+                    side, stop_loss, received_at = self._pending.pop(key)
+                    self._in_flight.add(key)
+                    self._pending_sl[key] = stop_loss
+
+                symbol, position_idx = key
+                account.log.info(
+                    "%s: Trailing stop-loss to %.6f (%s, %s)", format_key(key), stop_loss, side, self.mode
+                )
+                ok = account.send_stop_loss_update(symbol, position_idx, stop_loss)
+
+                with self._send_cond:
+                    self._in_flight.discard(key)
+                    # После ошибки сравнение снова идёт с последним принятым стопом
+                    self._pending_sl.pop(key, None)
+                    self._last_sent_at[key] = time.monotonic()
+                    if ok:
+                        self._last_sent_sl[key] = stop_loss
+                    self._send_cond.notify_all()
+
+                if ok:
+                    account.stop_moved(key, stop_loss, received_at)
+            except Exception as e:
+                account.log.error("Error in tick stop-loss sender: %s", e)
+                time.sleep(1)
+
+
+class AdaptiveTrailingEngine(TickTrailingEngine):
+    """Трейлинг по расписанию (TRAILING_MODE=adaptive).
+
+    Тики только обновляют PriceCache; позицию оценивает поток расписания,
+    когда подходит её время, и сразу переносит следующую проверку по
+    расстоянию до ближайшего события (cadence). Стопы отправляет тот же
+    отправитель, что и в режиме tick.
+    """
+
+    mode = "adaptive"
+
+    def __init__(
+        self,
+        account: "Account",
+        min_interval: float,
+        check_min_interval: float,
+        check_max_interval: float,
+        seconds_per_percent: float,
+    ) -> None:
+        super().__init__(account, min_interval)
+        self.check_min_interval = check_min_interval
+        self.check_max_interval = check_max_interval
+        self.seconds_per_percent = seconds_per_percent
+        # Под _tick_cond
+        self.schedule = CheckSchedule()
+        self._checks = TRAILING_CHECKS.labels(account.name)
+
+    def notify(self, symbol: str) -> None:
+        pass
+
+    def notify_many(self, symbols: List[str]) -> None:
+        """Позиции символов, которых ещё нет в расписании, проверяются сразу"""
+        account = self.account
+        with account.positions_lock:
+            keys = [key for symbol in symbols for key in account.positions_data.keys_for_symbol(symbol)]
+        now = time.monotonic()
+        with self._tick_cond:
+            new_keys = [key for key in keys if key not in self.schedule]
+            for key in new_keys:
+                self.schedule.schedule(key, now)
+            if new_keys:
+                self._tick_cond.notify()
+
+    def forget(self, key: PositionKey) -> None:
+        super().forget(key)
+        with self._tick_cond:
+            self.schedule.remove(key)
+
+    def _evaluate_loop(self) -> None:
+        account = self.account
+        while True:
+            try:
+                with self._tick_cond:
+                    while True:
+                        now = time.monotonic()
+                        due_at = self.schedule.next_due()
+                        if due_at is not None and due_at <= now:
+                            break
+                        self._tick_cond.wait(None if due_at is None else due_at - now)
+                    keys = self.schedule.pop_due(now)
+
+                symbols = list(dict.fromkeys(symbol for symbol, _ in keys))
+                updates, checked, gaps = account.evaluate_scheduled(symbols)
+                for key, side, new_stop_loss in updates:
+                    self.submit(key, side, new_stop_loss, account.price_cache.received_at(key[0]))
+                intervals = check_intervals(
+                    gaps, self.check_min_interval, self.check_max_interval, self.seconds_per_percent
+                )
+                self._checks.inc(len(checked))
+                now = time.monotonic()
+                with self._tick_cond:
+                    for key, interval in zip(checked, intervals.tolist()):
+                        self.schedule.schedule(key, now + interval)
+            except Exception as e:
+                # Снятые с расписания позиции вернёт следующий проход trailing_loop (notify_many)
+                account.log.error("Error in adaptive trailing engine: %s", e)
+                time.sleep(1)
+
+
+class Account:
+    def __init__(
+        self,
+        config: AccountConfig,
+        settings: BotConfig,
+        feed: PublicFeed,
+        price_cache: PriceCache,
+        instruments: InstrumentCache,
+        log_prefix: str = "",
+        state: Optional[StateStore] = None,
+    ) -> None:
+        self.config = config
+        self.settings = settings
+        self.name = config.name
+        self.feed = feed
+        self.price_cache = price_cache
+        self.instruments = instruments
+        self.state = state
+        # Снимок позиций с прошлого запуска; читается в start()
+        self.saved_positions: Dict[PositionKey, SavedPosition] = {}
+        # Последний записанный снимок (без saved_at), чтобы не писать неизменившееся состояние
+        self._saved_state: Dict[PositionKey, Tuple] = {}
+        # Позиции из снимка, защищённые стопом, но без тейк-профита на бирже; TP ставит bootstrap()
+        self._restored_without_take_profit: Dict[PositionKey, PositionRecord] = {}
+        self.log = _AccountLog(logging.getLogger(), {"prefix": log_prefix})
+
+        self.http = create_http(
+            settings.testnet, config.api_key, config.api_secret, settings.rest_workers, settings.api_url
+        )
+        # Все REST-запросы аккаунта идут через один планировщик с приоритетами и лимитами
+        self.rest = RestScheduler(self.http, workers=settings.rest_workers, name=self.name)
+        # Тейк-профиты ставятся и правятся пакетами
+        self.order_batcher = OrderBatcher(self.rest, PRIORITY_TAKE_PROFIT, self.name)
+        # Параллельная отправка начальных SL/TP для пачки новых позиций
+        self.protection_executor = ThreadPoolExecutor(
+            max_workers=settings.protection_workers, thread_name_prefix=f"protect-{self.name}"
+        )
+
+        # Позиции по ключу (symbol, positionIdx), колонки NumPy (защищено positions_lock)
+        self.positions_data = PositionTable(price_cache)
+        self.positions_lock = TimedLock("positions_lock")
+        # Позиции, для которых уже выставлены начальные SL/TP (защищено positions_lock)
+        self.protected_positions: Set[PositionKey] = set()
+        # Индекс открытых ордеров, который поддерживает приватный поток
+        self.open_orders_index: OrdersIndex = {}
+        self.reconcile_requested = threading.Event()
+        self.ws_private: Any = None
+        self.tick_engine: Optional[TickTrailingEngine] = None
+        # Когда последний раз выставляли нативный трейлинг позиции (режим exchange)
+        self._exchange_trailing_attempts: Dict[PositionKey, float] = {}
+        # Когда последний раз пытались подогнать тейк-профит позиции (защищено positions_lock)
+        self._take_profit_amend_attempts: Dict[PositionKey, float] = {}
+        self._tick_to_stop = TICK_TO_STOP_LATENCY.labels(self.name)
+        self._trailing_pass = TRAILING_PASS_DURATION.labels(self.name)
+
+    def start(self) -> None:
+        """Запускает планировщик REST и читает снимок состояния; потоки трейлинга стартуют в run()"""
+        self.rest.start()
+        self.order_batcher.start()
+        if self.state:
+            self.saved_positions = self.state.load(self.name)
+
+    def bootstrap(self) -> List[str]:
+        """Снимок позиций, подписка на их цены и защита новых сразу по получении снимка.
+
+        Начальные SL/TP отправляются в фоне, чтобы приватный поток и циклы
+        трейлинга поднимались параллельно с ними.
+        """
+        started = time.perf_counter()
+        symbols = self.initialize_positions()
+        self.log.info("Positions snapshot received in %.0f ms", (time.perf_counter() - started) * 1000)
+        self.feed.subscribe_many(symbols, self)
+        new_positions = self.claim_new_positions()
+        if new_positions:
+            self.log.info("New active symbols: %s", ", ".join(map(format_key, new_positions)))
+            threading.Thread(
+                target=self.protect_new_positions, args=(new_positions,), name=f"protect-start-{self.name}", daemon=True
+            ).start()
+        missing_take_profits, self._restored_without_take_profit = self._restored_without_take_profit, {}
+        if missing_take_profits:
+            self.log.info("Restored positions without take-profit: %s", ", ".join(map(format_key, missing_take_profits)))
+            threading.Thread(
+                target=self.place_take_profits,
+                args=(missing_take_profits,),
+                name=f"take-profit-start-{self.name}",
+                daemon=True,
+            ).start()
+        self.run()
+        return symbols
+
+    def on_price(self, symbol: str) -> None:
+        """Вызывается PublicFeed на каждый тик символа, который нужен аккаунту"""
+        if self.tick_engine and self.positions_data.has_symbol(symbol):
+            self.tick_engine.notify(symbol)
+
+    def get_open_orders_snapshot(self) -> Optional[OrdersIndex]:
+        """Один постраничный снимок всех открытых ордеров USDT-перпетуалов.
+
+        Индекс строится по (symbol, positionIdx, side, reduceOnly), поэтому число
+        запросов за цикл не зависит от количества открытых позиций.
+        """
+        index: OrdersIndex = {}
+        cursor = ""
+        try:
+            for _ in range(OPEN_ORDERS_MAX_PAGES):
+                params: Dict[str, Any] = {
+                    "category": "linear",
+                    "settleCoin": "USDT",
+                    "limit": OPEN_ORDERS_PAGE_LIMIT,
+                }
+                if cursor:
+                    params["cursor"] = cursor
+                response = self.rest.call("get_open_orders", PRIORITY_READ, **params)
+                if response.get("retCode") != 0:
+                    self.log.warning(
+                        "Failed to get open orders: %s (retCode: %s)",
+                        response.get("retMsg"),
+                        response.get("retCode")
+                    )
+                    return None
+
+                result = response.get("result", {})
+                for order in result.get("list", []):
+                    index.setdefault(order_key(order), {})[order.get("orderId", "")] = order
+
+                cursor = result.get("nextPageCursor", "")
+                if not cursor:
+                    break
+            else:
+                self.log.warning("Open orders snapshot truncated after %d pages", OPEN_ORDERS_MAX_PAGES)
+            return index
+        except Exception as e:
+            self.log.warning("Error getting open orders snapshot: %s", e)
+            return None
+
+    def build_position_entry(
+        self, pos: Dict[str, Any], orders_index: Optional[OrdersIndex]
+    ) -> Optional[PositionRecord]:
+        """Собирает запись positions_data из ответа HTTP API или сообщения приватного потока"""
+        symbol = pos.get("symbol", "")
+        qty = safe_float(pos.get("size", 0), 0.0)
+        if qty <= 0 or not symbol:
+            return None
+
+        position_idx = int(pos.get("positionIdx", 0))
+        side = pos.get("side", "")
+        # HTTP API отдаёт avgPrice, приватный поток — entryPrice
+        entry_price = safe_float(pos.get("avgPrice") or pos.get("entryPrice", 0), 0.0)
+        stop_loss = safe_float(pos.get("stopLoss", 0), 0.0)
+        unrealized_pnl = safe_float(pos.get("unrealisedPnl", 0), 0.0)
+
+        position_margin = entry_price * qty
+        if position_margin > 0:
+            unrealized_pnl_percent = (unrealized_pnl / position_margin) * 100
+        else:
+            unrealized_pnl_percent = 0
+
+        # Получаем текущую цену из WebSocket или используем цену входа
+        current_price = entry_price
+        quote = self.price_cache.read(symbol)
+        if quote is not None:
+            _, _, bid_price, ask_price = quote
+            live_price = ask_price if side == "Buy" else bid_price
+            if live_price > 0:
+                current_price = live_price
+
+        return {
+            "symbol": symbol,
+            "qty": qty,
+            "positionIdx": position_idx,
+            "side": side,
+            "entry_price": entry_price,
+            "stop_loss": stop_loss,
+            "unrealized_pnl": unrealized_pnl,
+            "unrealized_pnl_percent": unrealized_pnl_percent,
+            "current_price": current_price,
+            "has_take_profit": has_take_profit_order(symbol, position_idx, side, orders_index),
+            # Снимок позиций не ждёт загрузку инструментов: до неё трейлинг округляет стоп до 6 знаков
+            "tick_size": self.instruments.cached_tick_size(symbol),
+            "trailing_stop": safe_float(pos.get("trailingStop", 0), 0.0),
+        }
+
+    def get_active_positions(self) -> Optional[Dict[PositionKey, PositionRecord]]:
+        """Получает список активных позиций через HTTP API; None — если снимок получить не удалось"""
+        try:
+            positions_response = self.rest.call(
+                "get_positions", PRIORITY_READ, category="linear", settleCoin="USDT"
+            )
+
+            if positions_response.get("retCode") != 0:
+                self.log.warning(
+                    "Failed to get positions: %s (retCode: %s)",
+                    positions_response.get("retMsg"),
+                    positions_response.get("retCode")
+                )
+                return None
+
+            position_list = positions_response.get("result", {}).get("list", [])
+            # Снимок ордеров нужен только если есть открытые позиции
+            orders_index = None
+            if any(safe_float(pos.get("size", 0), 0.0) > 0 for pos in position_list):
+                orders_index = self.get_open_orders_snapshot()
+                if orders_index is not None:
+                    with self.positions_lock:
+                        self.open_orders_index.clear()
+                        self.open_orders_index.update(orders_index)
+            current_positions = {}
+
+            for pos in position_list:
+                entry = self.build_position_entry(pos, orders_index)
+                if entry is None:
+                    continue
+                symbol = entry["symbol"]
+                current_positions[(symbol, entry["positionIdx"])] = entry
+
+                # Добавляем подписку на цену для этого символа
+                self.feed.subscribe(symbol, self)
+
+            return current_positions
+        except Exception as e:
+            self.log.error("Error getting active positions: %s", e)
+            return None
+
+    def set_stop_loss(
+        self, symbol: str, position_idx: int, side: str, current_price: float, current_stop_loss: float = 0.0
+    ) -> bool:
+        stop_loss_percent = self.config.stop_loss_percent
+        try:
+            stop_loss_price = trailing.stop_loss_price(
+                side, current_price, stop_loss_percent, self.instruments.tick_size(symbol)
+            )
+            # Начальный стоп не должен ослаблять стоп, который уже стоит на бирже (например, подтянутый до рестарта)
+            if current_stop_loss > 0 and not trailing.is_better_stop(side, stop_loss_price, current_stop_loss):
+                self.log.info(
+                    "%s: Keeping existing stop-loss %.6f (initial stop %.6f would not tighten it)",
+                    symbol,
+                    current_stop_loss,
+                    stop_loss_price,
+                )
+                return True
+
+            response = self.rest.call(
+                "set_trading_stop",
+                PRIORITY_STOP_LOSS,
+                coalesce_key=("stop", symbol, position_idx),
+                category="linear",
+                symbol=symbol,
+                positionIdx=position_idx,
+                stopLoss=stop_loss_price
+            )
+
+            if response.get("superseded"):
+                self.log.info("%s: Initial stop-loss replaced by a newer stop before sending", symbol)
+                return response.get("retCode") == 0
+            if response.get("retCode") != 0:
+                self.log.error(
+                    "%s: Failed to set stop-loss: %s (ErrCode: %s)",
+                    symbol,
+                    response.get('retMsg'),
+                    response.get('retCode'),
+                )
+                return False
+            else:
+                self.log.info(
+                    "%s: Stop-loss set to %.6f (%s%% of current price %.6f)",
+                    symbol,
+                    stop_loss_price,
+                    stop_loss_percent,
+                    current_price,
+                )
+                return True
+        except Exception as e:
+            self.log.error("%s: Failed to set stop-loss: %s", symbol, e)
+            return False
+
+    def submit_take_profit(
+        self, symbol: str, qty: float, position_idx: int, side: str, current_price: float
+    ) -> Tuple[Future, float]:
+        """Ставит reduce-only тейк-профит в пакетную отправку; возвращает Future ответа и цену"""
+        instrument = self.instruments.get(symbol)
+        tick_size = instrument.tick_size if instrument else 0.0
+        take_profit_price = trailing.take_profit_price(side, current_price, self.config.take_profit_percent, tick_size)
+        order_side = "Sell" if side == "Buy" else "Buy"
+        if instrument and instrument.qty_step > 0:
+            qty = trailing.floor_to_step(qty, instrument.qty_step)
+        future = self.order_batcher.place({
+            "symbol": symbol,
+            "side": order_side,
+            "orderType": "Limit",
+            "qty": str(qty),
+            "price": str(take_profit_price),
+            "positionIdx": position_idx,
+            "timeInForce": "GTC",
+            "reduceOnly": True,
+        })
+        return future, take_profit_price
+
+    def place_take_profits(self, positions: Dict[PositionKey, PositionRecord]) -> List[float]:
+        """Тейк-профиты пачки позиций пакетными запросами; возвращает время до ответа по каждому"""
+        started = time.perf_counter()
+        take_profit_percent = self.config.take_profit_percent
+        submitted = []
+        for key, data in positions.items():
+            try:
+                future, price = self.submit_take_profit(
+                    key[0], data["qty"], data["positionIdx"], data["side"], data["current_price"]
+                )
+                submitted.append((key, data, future, price))
+            except Exception as e:
+                self.log.error("%s: Failed to place take-profit: %s", key[0], e)
+
+        durations = []
+        for key, data, future, price in submitted:
+            symbol = key[0]
+            try:
+                response = future.result()
+            except Exception as e:
+                self.log.error("%s: Failed to place take-profit: %s", symbol, e)
+                continue
+            durations.append(time.perf_counter() - started)
+            if response.get("retCode") != 0:
+                self.log.error(
+                    "%s: Failed to place take-profit: %s (ErrCode: %s)",
+                    symbol,
+                    response.get('retMsg'),
+                    response.get('retCode'),
+                )
+                continue
+            with self.positions_lock:
+                self.positions_data.set_has_take_profit(key, True)
+                self.positions_data.set_take_profit_basis(key, data["qty"], data["entry_price"])
+            self.log.info(
+                "%s: Take-profit placed at %.6f (%s%% of current price %.6f)",
+                symbol,
+                price,
+                take_profit_percent,
+                data["current_price"],
+            )
+        return durations
+
+    def amend_take_profits(self) -> None:
+        """Подгоняет тейк-профиты под изменившиеся размер или цену входа позиций пакетным amend.
+
+        Основание TP обновляется только после ответа биржи с retCode 0: неудачный
+        amend или ордер, которого индекс открытых ордеров ещё не видит, повторяются
+        не чаще раза в TAKE_PROFIT_AMEND_RETRY секунд на позицию.
+        """
+        now = time.monotonic()
+        amendments = []
+        with self.positions_lock:
+            for key in [k for k in self._take_profit_amend_attempts if k not in self.positions_data]:
+                del self._take_profit_amend_attempts[key]
+            for key in self.positions_data.take_profit_changes():
+                if now - self._take_profit_amend_attempts.get(key, 0.0) < TAKE_PROFIT_AMEND_RETRY:
+                    continue
+                self._take_profit_amend_attempts[key] = now
+                data = self.positions_data.get(key)
+                _, old_entry = self.positions_data.take_profit_basis(key)
+                opposite_side = "Sell" if data["side"] == "Buy" else "Buy"
+                orders = [
+                    order
+                    for order in self.open_orders_index.get((key[0], key[1], opposite_side, True), {}).values()
+                    if order.get("stopOrderType", "") not in STOP_ORDER_TYPES
+                ]
+                if len(orders) != 1:
+                    self.log.warning(
+                        "%s: Position changed but %d take-profit orders found, retrying in %ds",
+                        format_key(key),
+                        len(orders),
+                        TAKE_PROFIT_AMEND_RETRY,
+                    )
+                    continue
+                amendments.append((key, data, old_entry, orders[0]))
+
+        submitted = []
+        for key, data, old_entry, order in amendments:
+            instrument = self.instruments.get(key[0])
+            request: Dict[str, Any] = {"symbol": key[0], "orderId": order.get("orderId", "")}
+            # qty ордера включает уже исполненную часть
+            qty = data["qty"] + safe_float(order.get("cumExecQty", 0), 0.0)
+            if instrument and instrument.qty_step > 0:
+                qty = trailing.floor_to_step(qty, instrument.qty_step)
+            if qty != safe_float(order.get("qty", 0), 0.0):
+                request["qty"] = str(qty)
+            order_price = safe_float(order.get("price", 0), 0.0)
+            if data["entry_price"] != old_entry and order_price > 0:
+                # TP ставится от текущей цены, поэтому цена ордера сдвигается на изменение цены входа,
+                # а не пересчитывается от неё
+                price = trailing.snap_to_step(
+                    order_price + data["entry_price"] - old_entry, instrument.tick_size if instrument else 0.0
+                )
+                if price != order_price:
+                    request["price"] = str(price)
+            if len(request) == 2:
+                with self.positions_lock:
+                    self.positions_data.set_take_profit_basis(key, data["qty"], data["entry_price"])
+                    self._take_profit_amend_attempts.pop(key, None)
+                continue
+            self.log.info(
+                "%s: Amending take-profit (size %s, entry %.6f): %s",
+                format_key(key),
+                data["qty"],
+                data["entry_price"],
+                ", ".join(f"{name} {request[name]}" for name in ("qty", "price") if name in request),
+            )
+            submitted.append((key, data, self.order_batcher.amend(request)))
+
+        for key, data, future in submitted:
+            try:
+                response = future.result()
+            except Exception as e:
+                self.log.error("%s: Failed to amend take-profit: %s", format_key(key), e)
+                continue
+            if response.get("retCode") != 0:
+                self.log.error(
+                    "%s: Failed to amend take-profit: %s (ErrCode: %s)",
+                    format_key(key),
+                    response.get('retMsg'),
+                    response.get('retCode'),
+                )
+                continue
+            with self.positions_lock:
+                self.positions_data.set_take_profit_basis(key, data["qty"], data["entry_price"])
+                self._take_profit_amend_attempts.pop(key, None)
+
+    def set_exchange_trailing_stop(
+        self,
+        symbol: str,
+        position_idx: int,
+        side: str,
+        entry_price: float,
+        current_price: float,
+        current_stop_loss: float = 0.0,
+    ) -> bool:
+        """Одним set_trading_stop выставляет начальный стоп и нативный трейлинг Bybit (trailingStop/activePrice)"""
+        key = (symbol, position_idx)
+        with self.positions_lock:
+            self._exchange_trailing_attempts[key] = time.monotonic()
+        try:
+            tick_size = self.instruments.tick_size(symbol)
+            params = trailing.exchange_trailing_stop(
+                side,
+                entry_price,
+                current_price,
+                self.config.trailing_start_percent,
+                self.config.trailing_distance_percent,
+                tick_size,
+            )
+            if params is None:
+                self.log.warning("%s: No entry price yet, trailing stop postponed", format_key(key))
+                return False
+            distance, active_price = params
+            request: Dict[str, Any] = {"tpslMode": "Full", "trailingStop": str(distance)}
+            if active_price > 0:
+                request["activePrice"] = str(active_price)
+            # Начальный стоп отправляется тем же запросом, если он не ослабит уже стоящий на бирже
+            stop_loss_price = trailing.stop_loss_price(side, current_price, self.config.stop_loss_percent, tick_size)
+            if current_stop_loss <= 0 or trailing.is_better_stop(side, stop_loss_price, current_stop_loss):
+                request["stopLoss"] = str(stop_loss_price)
+
+            response = self.rest.call(
+                "set_trading_stop",
+                PRIORITY_STOP_LOSS,
+                coalesce_key=("stop", symbol, position_idx),
+                category="linear",
+                symbol=symbol,
+                positionIdx=position_idx,
+                **request
+            )
+
+            if response.get("retCode") != 0:
+                self.log.error(
+                    "%s: Failed to set trailing stop: %s (ErrCode: %s)",
+                    symbol,
+                    response.get('retMsg'),
+                    response.get('retCode'),
+                )
+                return False
+            with self.positions_lock:
+                self.positions_data.set_trailing_stop(key, distance)
+                if "stopLoss" in request:
+                    self.positions_data.set_stop_loss(key, stop_loss_price)
+            self.log.info(
+                "%s: Exchange trailing stop set: distance %s, activation %s%s",
+                symbol,
+                distance,
+                active_price if active_price > 0 else "immediate",
+                f", stop-loss {stop_loss_price:.6f}" if "stopLoss" in request else "",
+            )
+            return True
+        except Exception as e:
+            self.log.error("%s: Failed to set trailing stop: %s", symbol, e)
+            return False
+
+    def check_exchange_trailing(self) -> None:
+        """Повторно выставляет нативный трейлинг защищённым позициям, у которых его нет на бирже.
+
+        Трейлинг мог не выставиться из-за ошибки или быть снят вручную; снимок,
+        полученный до ответа на запрос, тоже ещё не видит его, поэтому повтор —
+        не чаще раза в EXCHANGE_TRAILING_RETRY секунд на позицию.
+        """
+        now = time.monotonic()
+        with self.positions_lock:
+            missing = [
+                self.positions_data.get(key)
+                for key in self.positions_data.without_trailing_stop()
+                if key in self.protected_positions
+                and now - self._exchange_trailing_attempts.get(key, 0.0) >= EXCHANGE_TRAILING_RETRY
+            ]
+            for key in [k for k in self._exchange_trailing_attempts if k not in self.positions_data]:
+                del self._exchange_trailing_attempts[key]
+        for data in missing:
+            self.log.warning("%s: No trailing stop on exchange, setting it again", format_key(
+                (data["symbol"], data["positionIdx"])
+            ))
+            self.set_exchange_trailing_stop(
+                data["symbol"],
+                data["positionIdx"],
+                data["side"],
+                data["entry_price"],
+                data["current_price"],
+                data["stop_loss"],
+            )
+
+    def send_stop_loss_update(self, symbol: str, position_idx: int, new_stop_loss: float) -> bool:
+        try:
+            response = self.rest.call(
+                "set_trading_stop",
+                PRIORITY_STOP_LOSS,
+                coalesce_key=("stop", symbol, position_idx),
+                category="linear",
+                symbol=symbol,
+                positionIdx=position_idx,
+                stopLoss=new_stop_loss
+            )
+            self.log.debug("    Update SL request → %.6f", new_stop_loss)
+
+            if response.get("superseded"):
+                self.log.info("%s: Stop-loss %.6f replaced by a newer stop before sending", symbol, new_stop_loss)
+                return False
+            if response.get("retCode") != 0:
+                self.log.error(
+                    "%s: Failed to update stop-loss: %s (ErrCode: %s)",
+                    symbol,
+                    response.get('retMsg'),
+                    response.get('retCode'),
+                )
+                return False
+            self.log.info("%s: Stop-loss updated to %.6f", symbol, new_stop_loss)
+            return True
+        except Exception as e:
+            self.log.error("%s: Failed to update stop-loss: %s", symbol, e)
+            return False
+
+    def evaluate_trailing(self, symbols: Optional[List[str]] = None) -> List[Tuple[PositionKey, str, float]]:
+        with self.positions_lock:
+            return self.positions_data.evaluate_trailing(
+                self.config.trailing_start_percent,
+                self.config.trailing_distance_percent,
+                symbols=symbols,
+                min_ticks=self.settings.stop_update_min_ticks,
+            )
+
+    def evaluate_scheduled(
+        self, symbols: List[str]
+    ) -> Tuple[List[Tuple[PositionKey, str, float]], List[PositionKey], np.ndarray]:
+        """Оценка трейлинга и расстояния до событий стопа за одно взятие positions_lock"""
+        config = self.config
+        min_ticks = self.settings.stop_update_min_ticks
+        with self.positions_lock:
+            updates = self.positions_data.evaluate_trailing(
+                config.trailing_start_percent, config.trailing_distance_percent, symbols=symbols, min_ticks=min_ticks
+            )
+            keys, gaps = self.positions_data.trigger_gaps(
+                config.trailing_start_percent, config.trailing_distance_percent, symbols=symbols, min_ticks=min_ticks
+            )
+        return updates, keys, gaps
+
+    def stop_moved(self, key: PositionKey, stop_loss: float, received_at: float) -> None:
+        """Биржа приняла новый стоп: фиксируем его в таблице и задержку от тика"""
+        if received_at:
+            self._tick_to_stop.observe(time.monotonic() - received_at)
+        with self.positions_lock:
+            self.positions_data.set_stop_loss(key, stop_loss)
+
+    def update_stop_loss(self, key: PositionKey, side: str, new_stop_loss: float) -> bool:
+        """Отправляет новый трейлинг-стоп и при успехе записывает его в таблицу позиций"""
+        symbol, position_idx = key
+        received_at = self.price_cache.received_at(symbol)
+        distance = self.config.trailing_distance_percent
+        if side == "Buy":
+            self.log.info(
+                "%s: Trailing stop-loss to %.6f (Buy, %s%% below current price)", format_key(key), new_stop_loss, distance
+            )
+        else:
+            self.log.info(
+                "%s: Trailing stop-loss to %.6f (Sell, %s%% above current price)", format_key(key), new_stop_loss, distance
+            )
+        ok = self.send_stop_loss_update(symbol, position_idx, new_stop_loss)
+        if ok:
+            self.stop_moved(key, new_stop_loss, received_at)
+        return ok
+
+    def claim_new_positions(self) -> Dict[PositionKey, PositionRecord]:
+        """Отбирает позиции без начальной защиты и помечает их, чтобы SL/TP не выставлялись дважды"""
+        with self.positions_lock:
+            new_positions = {
+                key: record for key, record in self.positions_data.items() if key not in self.protected_positions
+            }
+            self.protected_positions.update(new_positions)
+        return new_positions
+
+    def protect_new_positions(self, new_positions: Dict[PositionKey, PositionRecord]) -> None:
+        """Выставляет начальные SL новым позициям через пул потоков, TP — пакетными запросами"""
+        started = time.perf_counter()
+        futures = []
+        exchange_trailing = self.settings.trailing_mode == "exchange"
+        if exchange_trailing:
+            # Чтобы проверка в trailing_loop не отправила тот же запрос, пока этот в очереди
+            with self.positions_lock:
+                for key in new_positions:
+                    self._exchange_trailing_attempts[key] = time.monotonic()
+        for (symbol, _), data in new_positions.items():
+            if exchange_trailing and data["trailing_stop"] <= 0:
+                futures.append(self.protection_executor.submit(
+                    _timed_call,
+                    self.set_exchange_trailing_stop,
+                    symbol,
+                    data["positionIdx"],
+                    data["side"],
+                    data["entry_price"],
+                    data["current_price"],
+                    data["stop_loss"]
+                ))
+            else:
+                futures.append(self.protection_executor.submit(
+                    _timed_call,
+                    self.set_stop_loss,
+                    symbol,
+                    data["positionIdx"],
+                    data["side"],
+                    data["current_price"],
+                    data["stop_loss"]
+                ))
+
+        # Тейк-профиты — пакетами, пока стопы отправляются пулом
+        take_profits = {key: data for key, data in new_positions.items() if not data["has_take_profit"]}
+        durations = self.place_take_profits(take_profits) if take_profits else []
+        for future in futures:
+            try:
+                durations.append(future.result())
+            except Exception as e:
+                self.log.error("Error protecting new position: %s", e)
+
+        if durations:
+            self.log.info(
+                "Protected %d new positions with %d stop requests and %d take-profit orders in %.1f ms "
+                "(slowest request %.1f ms, %d workers)",
+                len(new_positions),
+                len(futures),
+                len(take_profits),
+                (time.perf_counter() - started) * 1000,
+                max(durations) * 1000,
+                self.settings.protection_workers,
+            )
+
+    def release_closed_positions(self, keys: List[PositionKey]) -> None:
+        with self.positions_lock:
+            for key in keys:
+                self.protected_positions.discard(key)
+            # Поток тикеров символа больше не нужен, если по нему не осталось позиций (hedge mode — две)
+            unused = {key[0] for key in keys if not self.positions_data.has_symbol(key[0])}
+        for symbol in unused:
+            self.feed.unsubscribe(symbol, self)
+        if self.tick_engine:
+            for key in keys:
+                self.tick_engine.forget(key)
+
+    def handle_position_update(self, message: Dict[str, Any]) -> None:
+        """Обновляет positions_data из приватного топика position и сразу защищает новые позиции"""
+        WS_MESSAGES.labels("position").inc()
+        try:
+            opened: Dict[PositionKey, PositionRecord] = {}
+            closed: List[PositionKey] = []
+            for pos in message.get("data", []):
+                if pos.get("category", "linear") != "linear":
+                    continue
+                symbol = pos.get("symbol", "")
+                if not symbol:
+                    continue
+                key = (symbol, int(pos.get("positionIdx", 0)))
+                entry = self.build_position_entry(pos, None)
+                with self.positions_lock:
+                    if entry is None:
+                        if self.positions_data.remove(key):
+                            closed.append(key)
+                        continue
+                    entry["has_take_profit"] = has_take_profit_order(
+                        symbol, entry["positionIdx"], entry["side"], self.open_orders_index
+                    )
+                    self.positions_data.upsert(key, entry)
+                    if key not in self.protected_positions:
+                        self.protected_positions.add(key)
+                        opened[key] = self.positions_data.get(key)
+
+            if closed:
+                self.log.debug("Positions closed (private stream): %s", ", ".join(map(format_key, closed)))
+                self.release_closed_positions(closed)
+            if opened:
+                self.log.info("New active symbols (private stream): %s", ", ".join(map(format_key, opened)))
+                threading.Thread(target=self.protect_new_positions, args=(opened,), daemon=True).start()
+                for symbol in {key[0] for key in opened}:
+                    self.feed.subscribe(symbol, self)
+        except Exception as e:
+            self.log.error("Error handling position update: %s", e)
+
+    def handle_order_update(self, message: Dict[str, Any]) -> None:
+        """Поддерживает индекс открытых ордеров по приватному топику order"""
+        WS_MESSAGES.labels("order").inc()
+        try:
+            with self.positions_lock:
+                for order in message.get("data", []):
+                    if order.get("category", "linear") != "linear":
+                        continue
+                    key = order_key(order)
+                    order_id = order.get("orderId", "")
+                    if order.get("orderStatus", "") in OPEN_ORDER_STATUSES:
+                        self.open_orders_index.setdefault(key, {})[order_id] = order
+                    else:
+                        orders = self.open_orders_index.get(key)
+                        if orders is not None:
+                            orders.pop(order_id, None)
+                            if not orders:
+                                del self.open_orders_index[key]
+
+                    position_key = (key[0], key[1])
+                    data = self.positions_data.get(position_key)
+                    if data:
+                        self.positions_data.set_has_take_profit(position_key, has_take_profit_order(
+                            key[0], key[1], data["side"], self.open_orders_index
+                        ))
+        except Exception as e:
+            self.log.error("Error handling order update: %s", e)
+
+    def handle_execution_update(self, message: Dict[str, Any]) -> None:
+        WS_MESSAGES.labels("execution").inc()
+        try:
+            for execution in message.get("data", []):
+                if execution.get("category", "linear") != "linear":
+                    continue
+                self.log.info(
+                    "%s: Execution %s %s @ %s (%s)",
+                    execution.get("symbol", ""),
+                    execution.get("side", ""),
+                    execution.get("execQty", ""),
+                    execution.get("execPrice", ""),
+                    execution.get("execType", ""),
+                )
+        except Exception as e:
+            self.log.error("Error handling execution update: %s", e)
+
+    def reconcile_positions(self, exchange_positions: Dict[PositionKey, PositionRecord]) -> None:
+        """Сверяет локальное состояние приватного потока с HTTP-снимком и принимает снимок биржи"""
+        with self.positions_lock:
+            local_positions = self.positions_data.snapshot()
+            missing = [k for k in exchange_positions if k not in local_positions]
+            stale = [k for k in local_positions if k not in exchange_positions]
+            changed = [
+                k for k, d in exchange_positions.items()
+                if k in local_positions and (
+                    d["qty"] != local_positions[k]["qty"] or d["side"] != local_positions[k]["side"]
+                )
+            ]
+            self.positions_data.replace_all(exchange_positions)
+
+        if missing or stale or changed:
+            self.log.warning(
+                "Reconciliation: missing locally: %s; closed on exchange: %s; size/side mismatch: %s",
+                ", ".join(map(format_key, missing)) or "-",
+                ", ".join(map(format_key, stale)) or "-",
+                ", ".join(map(format_key, changed)) or "-",
+            )
+        else:
+            self.log.debug("Reconciliation: local state matches exchange (%d positions)", len(exchange_positions))
+
+    def save_state(self) -> None:
+        """Записывает защищённые позиции в снимок, если они изменились с прошлой записи"""
+        if self.state is None:
+            return
+        with self.positions_lock:
+            current = {
+                key: saved_position(record)
+                for key, record in self.positions_data.items()
+                if key in self.protected_positions
+            }
+        comparable = {key: saved[:-1] for key, saved in current.items()}
+        if comparable == self._saved_state:
+            return
+        if self.state.save(self.name, current):
+            self._saved_state = comparable
+
+    def restore_protected(
+        self, saved: Dict[PositionKey, SavedPosition]
+    ) -> Tuple[int, Dict[PositionKey, PositionRecord]]:
+        """Помечает защищёнными позиции из снимка, у которых на бирже та же сторона и есть стоп.
+
+        Тейк-профит сверяется с открытыми ордерами: позиции без него возвращаются
+        для обычной установки TP. Если TP на месте, его основанием становятся
+        размер и цена входа из снимка — изменение позиции за время простоя
+        подгонит amend_take_profits. Остальные позиции (новые, перевёрнутые или
+        без стопа) защищаются как обычно.
+        """
+        restored = 0
+        missing_take_profits = {}
+        with self.positions_lock:
+            for key, record in self.positions_data.items():
+                previous = saved.get(key)
+                if previous is None or previous.side != record["side"] or record["stop_loss"] <= 0:
+                    continue
+                self.protected_positions.add(key)
+                restored += 1
+                if not record["has_take_profit"]:
+                    missing_take_profits[key] = record
+                elif previous.has_take_profit and previous.qty > 0:
+                    self.positions_data.set_take_profit_basis(key, previous.qty, previous.entry_price)
+        return restored, missing_take_profits
+
+    def log_contention_stats(self) -> None:
+        stats = self.positions_lock.stats()
+        self.log.info(
+            "Contention: %s %d acquisitions, %d waited (total %.1f ms, max %.2f ms); "
+            "price cache %d updates, %d retried reads",
+            stats.name,
+            stats.acquisitions,
+            stats.contended,
+            stats.wait_total * 1000,
+            stats.wait_max * 1000,
+            self.price_cache.updates,
+            self.price_cache.read_retries,
+        )
+
+    def trailing_loop(self) -> None:
+        """Основной цикл трейлинга стоп-лоссов"""
+        previous_keys: Set[PositionKey] = set()
+        last_reconcile = 0.0
+        last_contention_log = time.monotonic()
+        reconcile_interval = self.settings.reconcile_interval
+        while True:
+            try:
+                now = time.monotonic()
+                if now - last_contention_log >= CONTENTION_LOG_INTERVAL:
+                    self.log_contention_stats()
+                    last_contention_log = now
+                if not self.ws_private or self.reconcile_requested.is_set() or now - last_reconcile >= reconcile_interval:
+                    self.reconcile_requested.clear()
+                    exchange_positions = self.get_active_positions()
+                    if exchange_positions is None:
+                        # Без снимка не считаем позиции закрытыми, чтобы не защищать их повторно
+                        time.sleep(POLL_INTERVAL)
+                        continue
+                    last_reconcile = now
+                    if self.ws_private:
+                        self.reconcile_positions(exchange_positions)
+                    else:
+                        # Синхронизируем общее состояние позиций, с которым работают тики
+                        with self.positions_lock:
+                            self.positions_data.replace_all(exchange_positions)
+                # Иначе позиции поддерживает приватный поток, HTTP не нужен
+
+                # Выявляем новые позиции
+                new_positions = self.claim_new_positions()
+                if new_positions:
+                    self.log.info("New active symbols: %s", ", ".join(map(format_key, new_positions)))
+                    self.protect_new_positions(new_positions)
+
+                # Обновляем стоп-лоссы для всех позиций одним векторным проходом
+                if self.settings.trailing_mode == "exchange":
+                    # Стоп ведёт биржа; только проверяем, что трейлинг на месте
+                    self.check_exchange_trailing()
+                elif self.tick_engine:
+                    with self.positions_lock:
+                        symbols = self.positions_data.symbols()
+                    self.tick_engine.notify_many(symbols)
+                else:
+                    for key, side, new_stop_loss in self.evaluate_trailing():
+                        self.update_stop_loss(key, side, new_stop_loss)
+
+                # Тейк-профиты позиций, размер или цена входа которых изменились
+                self.amend_take_profits()
+
+                # Выявляем закрытые позиции
+                with self.positions_lock:
+                    current_keys = set(self.positions_data.keys())
+                removed_keys = previous_keys - current_keys
+                if removed_keys:
+                    self.log.info("Closed symbols: %s", ", ".join(map(format_key, removed_keys)))
+                    self.release_closed_positions(list(removed_keys))
+
+                previous_keys = current_keys
+                self.save_state()
+                self._trailing_pass.observe(time.monotonic() - now)
+                time.sleep(POLL_INTERVAL)
+            except Exception as e:
+                self.log.error("Error in trailing loop: %s", e)
+                time.sleep(5)
+
+    def start_private_stream(self) -> Any:
+        ws_private = EndpointWebSocket(
+            testnet=self.settings.testnet,
+            channel_type="private",
+            api_key=self.config.api_key,
+            api_secret=self.config.api_secret,
+            restart_on_error=True,
+            retries=0,
+            url=f"{self.settings.ws_url}/v5/private" if self.settings.ws_url else "",
+        )
+        ws_private.position_stream(callback=self.handle_position_update)
+        ws_private.order_stream(callback=self.handle_order_update)
+        ws_private.execution_stream(callback=self.handle_execution_update)
+        self.log.info("Subscribed to private position/order/execution streams")
+        return ws_private
+
+    def private_stream_watchdog(self) -> None:
+        """Пересоздаёт приватный WebSocket, если pybit не смог переподключиться сам.
+
+        После любого разрыва запрашивает внеочередную сверку через HTTP, так как
+        сообщения за время простоя потеряны.
+        """
+        disconnected_since = None
+        while True:
+            time.sleep(5)
+            try:
+                ws_private = self.ws_private
+                if ws_private is None:
+                    continue
+                if ws_private.is_connected():
+                    if disconnected_since is not None:
+                        self.log.info("Private stream reconnected")
+                        disconnected_since = None
+                        self.reconcile_requested.set()
+                    continue
+
+                if disconnected_since is None:
+                    disconnected_since = time.monotonic()
+                    self.log.warning("Private stream disconnected, waiting for reconnect...")
+                elif time.monotonic() - disconnected_since > PRIVATE_STREAM_STALE_AFTER:
+                    self.log.warning(
+                        "Private stream is down for %ds, recreating connection", PRIVATE_STREAM_STALE_AFTER
+                    )
+                    try:
+                        ws_private.exit()
+                    except Exception:
+                        pass
+                    self.ws_private = self.start_private_stream()
+                    disconnected_since = None
+                    self.reconcile_requested.set()
+            except Exception as e:
+                self.log.error("Error in private stream watchdog: %s", e)
+
+    def check_api_access(self) -> None:
+        """Подсказка о причине ошибки авторизации; подробный код вернёт и get_positions"""
+        try:
+            # Тестовый запрос для проверки авторизации
+            test_response = self.rest.call("get_wallet_balance", PRIORITY_READ, accountType="UNIFIED")
+            if test_response.get("retCode") != 0:
+                if test_response.get("retCode") == 10003:
+                    self.log.error("Invalid API key. Please check your API keys in .env file")
+                elif test_response.get("retCode") == 10004:
+                    self.log.error("API key does not have required permissions")
+                else:
+                    self.log.error(
+                        "API error: %s (retCode: %s)",
+                        test_response.get("retMsg"),
+                        test_response.get("retCode")
+                    )
+        except Exception as test_e:
+            self.log.warning("Could not verify API access: %s", test_e)
+
+    def initialize_positions(self) -> List[str]:
+        try:
+            self.log.info("Initializing existing positions...")
+            saved = self.saved_positions
+            positions_response = self.rest.call(
+                "get_positions", PRIORITY_READ, category="linear", settleCoin="USDT"
+            )
+
+            # Проверяем код ответа
+            if positions_response.get("retCode") != 0:
+                error_msg = positions_response.get("retMsg", "Unknown error")
+                error_code = positions_response.get("retCode")
+                if error_code == 10003:
+                    self.log.error("Invalid API key. Please check your BYBIT_API_KEY in .env file")
+                elif error_code == 10004:
+                    self.log.error("API key does not have 'Read' permission. Please enable it in Bybit settings")
+                elif error_code == 401:
+                    self.log.error("Authentication failed (401). Please verify:")
+                    self.log.error("  1. API keys are correct")
+                    self.log.error("  2. System time is synchronized")
+                    self.log.error("  3. API key has required permissions")
+                else:
+                    self.log.error("Failed to get positions: %s (retCode: %s)", error_msg, error_code)
+                return []
+
+            orders_index = self.get_open_orders_snapshot()
+            if orders_index is not None:
+                with self.positions_lock:
+                    self.open_orders_index.update(orders_index)
+            symbols_to_subscribe = []
+
+            for pos in positions_response.get("result", {}).get("list", []):
+                entry = self.build_position_entry(pos, orders_index)
+                if entry is None:
+                    continue
+                symbol = entry["symbol"]
+                key = (symbol, entry["positionIdx"])
+                # Текущую цену до первого тика считаем равной цене входа
+                entry["current_price"] = entry["entry_price"]
+                with self.positions_lock:
+                    self.positions_data.upsert(key, entry)
+
+                if symbol not in symbols_to_subscribe:
+                    symbols_to_subscribe.append(symbol)
+                self.log.info("Found active position: %s (%s)", format_key(key), entry["side"])
+
+            if saved:
+                restored, self._restored_without_take_profit = self.restore_protected(saved)
+                self.log.info(
+                    "Warm restart: %d of %d positions already protected according to saved state",
+                    restored,
+                    len(self.positions_data),
+                )
+            return symbols_to_subscribe
+        except Exception as e:
+            self.log.error("Failed to initialize positions: %s", e)
+            return []
+
+    def run(self) -> None:
+        """Поднимает трейлинг аккаунта: тиковый движок, приватный поток и основной цикл"""
+        settings = self.settings
+        if settings.trailing_mode == "tick":
+            self.tick_engine = TickTrailingEngine(self, settings.stop_update_min_interval)
+            self.tick_engine.start()
+        elif settings.trailing_mode == "adaptive":
+            self.tick_engine = AdaptiveTrailingEngine(
+                self,
+                settings.stop_update_min_interval,
+                settings.check_min_interval,
+                settings.check_max_interval,
+                settings.check_seconds_per_percent,
+            )
+            self.tick_engine.start()
+
+        if settings.private_stream:
+            try:
+                self.ws_private = self.start_private_stream()
+                threading.Thread(
+                    target=self.private_stream_watchdog, name=f"private-watchdog-{self.name}", daemon=True
+                ).start()
+            except Exception as e:
+                self.log.error("Could not start private stream, falling back to HTTP polling: %s", e)
+                self.ws_private = None
+
+        threading.Thread(target=self.trailing_loop, name=f"trailing-{self.name}", daemon=True).start()
+
+    def exit(self) -> None:
+        try:
+            self.save_state()
+        except Exception as e:
+            self.log.warning("Could not save state on exit: %s", e)
+        try:
+            if self.ws_private:
+                self.ws_private.exit()
+        except Exception:
+            pass
+
+
+def account_log_prefix(name: str, multiple: bool) -> str:
+    return f"[{name}] " if multiple or name != DEFAULT_ACCOUNT else ""
+
+
+def _timed_call(func: Any, *args: Any) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
@@ -0,0 +1,268 @@
+"""Нагрузочные прогоны бота против локальной биржи mockexchange.py.
+
+Для каждого сочетания числа позиций и частоты тиков поднимает биржу,
+запускает main.py отдельным процессом, ждёт, пока все позиции получат стоп,
+и меряет заданное время: задержку от тика до set_trading_stop (перцентили),
+запросы REST в минуту, ошибки 10006, CPU и память процесса бота.
+
+    python benchmark.py
+    python benchmark.py --positions 1 100 1000 --tick-rates 1000 10000 --duration 60
+    python benchmark.py --env TRAILING_MODE=tick PRIVATE_STREAM=true --json results.json
+
+Задержка считается на стороне биржи: от отправки тика, давшего последний
+экстремум цены по символу, до прихода запроса, который подтянул стоп.
+CPU и память читаются из /proc (Linux) и суммируются по дереву процессов
+бота (ACCOUNT_PROCESSES, INGEST_PROCESS).
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from mockexchange import MockExchange, add_market_arguments, market_options
+
+DEFAULT_POSITIONS = (1, 10, 100, 1000)
+DEFAULT_TICK_RATES = (100, 1000, 10000)
+STOP_TIMEOUT = 15.0
+
+
+@dataclass
+class BenchmarkResult:
+    positions: int
+    tick_rate: float
+    duration: float
+    ticks_per_second: float
+    stop_updates: int
+    latency_ms: Dict[str, float]
+    rest_per_minute: float
+    rest_calls: Dict[str, int]
+    rate_limited: int
+    stops_triggered: int
+    cpu_percent: Optional[float]
+    rss_mb: Optional[float]
+    warmup_seconds: float
+    protected: int
+    errors: List[str] = field(default_factory=list)
+
+
+def percentiles(samples: Sequence[float], points: Sequence[float] = (50, 90, 99)) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        index = min(len(ordered) - 1, max(0, round(point / 100 * len(ordered)) - 1))
+        result[f"p{point:g}"] = ordered[index] * 1000
+    result["max"] = ordered[-1] * 1000
+    return result
+
+
+class ProcessSampler:
+    """CPU-время и RSS процесса и его потомков из /proc; None, если /proc недоступен"""
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self._start: Optional[Tuple[float, float]] = None
+        self.max_rss: Optional[float] = None
+
+    def _pids(self) -> List[int]:
+        pids = [self.pid]
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/task/{pid}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except (OSError, ValueError):
+                pass
+        return pids
+
+    def _cpu_seconds(self) -> Optional[float]:
+        total = None
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                # utime и stime — 14-е и 15-е поля, после имени процесса — с 12-го индекса
+                total = (total or 0.0) + (int(fields[11]) + int(fields[12])) / self._ticks
+            except (OSError, IndexError, ValueError):
+                pass
+        return total
+
+    def _rss_mb(self) -> Optional[float]:
+        total = None
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total = (total or 0.0) + int(line.split()[1]) / 1024
+                            break
+            except (OSError, ValueError):
+                pass
+        return total
+
+    def start(self) -> None:
+        cpu = self._cpu_seconds()
+        self._start = (time.monotonic(), cpu) if cpu is not None else None
+        self.max_rss = None
+
+    def sample(self) -> None:
+        rss = self._rss_mb()
+        if rss is not None:
+            self.max_rss = rss if self.max_rss is None else max(self.max_rss, rss)
+
+    def cpu_percent(self) -> Optional[float]:
+        cpu = self._cpu_seconds()
+        if self._start is None or cpu is None:
+            return None
+        elapsed = time.monotonic() - self._start[0]
+        return (cpu - self._start[1]) / elapsed * 100 if elapsed > 0 else None
+
+
+def _bot_env(exchange: MockExchange, workdir: str, overrides: Sequence[str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        BYBIT_API_KEY="benchmark",
+        BYBIT_API_SECRET="benchmark",
+        BYBIT_API_URL=exchange.rest_url,
+        BYBIT_WS_URL=exchange.ws_url,
+        ACCOUNTS="",
+        LOG_DIR=os.path.join(workdir, "logs"),
+        STATE_FILE="",
+        INSTRUMENTS_CACHE_FILE=os.path.join(workdir, "instruments.json"),
+        TICK_RECORD_DIR="",
+        METRICS_PORT="0",
+    )
+    for item in overrides:
+        name, _, value = item.partition("=")
+        env[name] = value
+    return env
+
+
+def run_scenario(args: argparse.Namespace, positions: int, tick_rate: float) -> BenchmarkResult:
+    exchange = MockExchange(market_options(args, rest_port=0, ws_port=0, positions=positions, tick_rate=tick_rate))
+    exchange.start()
+    errors = []
+    with tempfile.TemporaryDirectory(prefix="bytrailor-bench-") as workdir:
+        # Консольный лог бота — в файл: непрочитанный pipe остановил бы его запись
+        console = open(os.path.join(workdir, "console.log"), "w+b")
+        bot = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")],
+            cwd=workdir,
+            env=_bot_env(exchange, workdir, args.env),
+            stdout=console,
+            stderr=subprocess.STDOUT,
+        )
+        sampler = ProcessSampler(bot.pid)
+        try:
+            # Прогрев: все позиции защищены (или истёк таймаут), затем статистика с нуля
+            started = time.monotonic()
+            while time.monotonic() - started < args.warmup_timeout and bot.poll() is None:
+                protected, open_positions = exchange.protected()
+                if protected >= open_positions:
+                    break
+                time.sleep(0.1)
+            warmup = time.monotonic() - started
+            protected, open_positions = exchange.protected()
+            if protected < open_positions:
+                errors.append(f"only {protected}/{open_positions} positions protected after {warmup:.0f}s")
+            exchange.reset_stats()
+            sampler.start()
+            deadline = time.monotonic() + args.duration
+            while time.monotonic() < deadline and bot.poll() is None:
+                sampler.sample()
+                time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+            cpu = sampler.cpu_percent()
+            stats = exchange.stats
+            elapsed = time.monotonic() - stats.started
+            protected, _ = exchange.protected()
+        finally:
+            if bot.poll() is None:
+                bot.send_signal(signal.SIGINT)
+                try:
+                    bot.wait(STOP_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    bot.kill()
+            exchange.stop()
+            console.seek(0)
+            output = console.read().decode(errors="replace")
+            console.close()
+        if bot.returncode not in (0, -signal.SIGINT) and "Traceback" in output:
+            errors.append(output.strip().splitlines()[-1])
+
+    calls = dict(stats.calls)
+    latencies = list(stats.stop_latencies)
+    return BenchmarkResult(
+        positions=positions,
+        tick_rate=tick_rate,
+        duration=round(elapsed, 2),
+        ticks_per_second=round(stats.ticks_sent / elapsed, 1) if elapsed > 0 else 0.0,
+        stop_updates=len(latencies),
+        latency_ms={k: round(v, 2) for k, v in percentiles(latencies).items()},
+        rest_per_minute=round(sum(calls.values()) / elapsed * 60, 1) if elapsed > 0 else 0.0,
+        rest_calls=calls,
+        rate_limited=sum(stats.rate_limited.values()),
+        stops_triggered=stats.stops_triggered,
+        cpu_percent=round(cpu, 1) if cpu is not None else None,
+        rss_mb=round(sampler.max_rss, 1) if sampler.max_rss is not None else None,
+        warmup_seconds=round(warmup, 2),
+        protected=protected,
+        errors=errors,
+    )
+
+
+def format_report(results: List[BenchmarkResult]) -> str:
+    lines = [
+        f"{'positions':>9}{'target/s':>9}{'tick/s':>9}{'stops':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        f"{'REST/min':>10}{'10006':>7}{'CPU %':>7}{'RSS MB':>8}"
+    ]
+    for r in results:
+        lat = r.latency_ms
+
+        def cell(value: Optional[float], width: int, fmt: str = ".1f") -> str:
+            return f"{value:>{width}{fmt}}" if value is not None else f"{'-':>{width}}"
+
+        lines.append(
+            f"{r.positions:>9}{r.tick_rate:>9.0f}{r.ticks_per_second:>9.0f}{r.stop_updates:>8}"
+            f"{cell(lat.get('p50'), 9)}{cell(lat.get('p90'), 9)}{cell(lat.get('p99'), 9)}{cell(lat.get('max'), 9)}"
+            f"{r.rest_per_minute:>10.0f}{r.rate_limited:>7}{cell(r.cpu_percent, 7)}{cell(r.rss_mb, 8)}"
+        )
+        for error in r.errors:
+            lines.append(f"{'':>9}! {error}")
+    return "\n".join(lines)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark the bot against the local mock exchange")
+    parser.add_argument("--positions", type=int, nargs="+", default=list(DEFAULT_POSITIONS))
+    parser.add_argument("--tick-rates", type=float, nargs="+", default=list(DEFAULT_TICK_RATES))
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds per scenario")
+    parser.add_argument("--warmup-timeout", type=float, default=60.0, help="Max seconds to wait for protection")
+    parser.add_argument("--env", nargs="*", default=[], metavar="NAME=VALUE", help="Extra settings for the bot")
+    parser.add_argument("--json", default="", help="Also write the results to this file")
+    add_market_arguments(parser)
+    return parser
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    results = []
+    for positions in args.positions:
+        for tick_rate in args.tick_rates:
+            print(f"Running {positions} positions at {tick_rate:g} ticks/s for {args.duration:g}s...", flush=True)
+            results.append(run_scenario(args, positions, tick_rate))
+    print()
+    print(format_report(results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Расписание проверок позиций для TRAILING_MODE=adaptive.
+
+Каждая позиция проверяется тем чаще, чем ближе цена к ближайшему событию,
+которое меняет стоп: к уровню активации трейлинга, к следующему шагу стопа
+(сдвиг на STOP_UPDATE_MIN_TICKS тиков) или к самому стопу. Расстояние
+(PositionTable.trigger_gaps) меряется в процентах цены и переводится в
+интервал линейно: CHECK_MIN_INTERVAL у самого события плюс
+CHECK_SECONDS_PER_PERCENT за каждый процент, но не больше CHECK_MAX_INTERVAL.
+Очередь — куча по времени следующей проверки с ленивым удалением.
+"""
+import heapq
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+PositionKey = Tuple[str, int]
+
+# Позиция без цены (тика ещё не было) проверяется с этим интервалом
+UNPRICED_INTERVAL = 1.0
+
+
+def check_interval(gap: float, min_interval: float, max_interval: float, seconds_per_percent: float) -> float:
+    """Интервал до следующей проверки по расстоянию до события (в процентах цены; NaN — цены нет)"""
+    if gap != gap:
+        return min(UNPRICED_INTERVAL, max_interval)
+    return min(max_interval, min_interval + max(gap, 0.0) * seconds_per_percent)
+
+
+def check_intervals(
+    gaps: "np.ndarray", min_interval: float, max_interval: float, seconds_per_percent: float
+) -> "np.ndarray":
+    """Векторный check_interval по массиву расстояний из PositionTable.trigger_gaps"""
+    intervals = (min_interval + gaps.clip(0.0, None) * seconds_per_percent).clip(min_interval, max_interval)
+    intervals[gaps != gaps] = min(UNPRICED_INTERVAL, max_interval)
+    return intervals
+
+
+class CheckSchedule:
+    """Куча (время проверки, ключ); не потокобезопасна — вызывающий держит свою блокировку"""
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, PositionKey]] = []
+        # Действующее время проверки ключа; записи кучи с другим временем устарели
+        self._due: Dict[PositionKey, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._due
+
+    def schedule(self, key: PositionKey, at: float) -> None:
+        self._due[key] = at
+        heapq.heappush(self._heap, (at, key))
+        # Устаревшие записи копятся при каждом переносе; куча пересобирается, когда их становится большинство
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(at, key) for key, at in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def remove(self, key: PositionKey) -> None:
+        self._due.pop(key, None)
+
+    def next_due(self) -> Optional[float]:
+        heap = self._heap
+        while heap and self._due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def pop_due(self, now: float) -> List[PositionKey]:
+        """Ключи, время проверки которых наступило; они снимаются с расписания до переноса"""
+        keys = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            at, key = heapq.heappop(heap)
+            if self._due.get(key) == at:
+                del self._due[key]
+                keys.append(key)
+        return keys
@@ -1,5 +1,18 @@
 import os
+import re
 from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+@dataclass(frozen=True)
+class AccountConfig:
+    name: str
+    api_key: str
+    api_secret: str
+    take_profit_percent: float
+    stop_loss_percent: float
+    trailing_start_percent: float
+    trailing_distance_percent: float
 
 
 @dataclass(frozen=True)
@@ -12,6 +25,38 @@ class BotConfig:
     trailing_distance_percent: float
     log_dir: str
     testnet: bool
+    trailing_mode: str = "poll"
+    stop_update_min_interval: float = 0.5
+    check_min_interval: float = 0.2
+    check_max_interval: float = 10.0
+    check_seconds_per_percent: float = 5.0
+    private_stream: bool = False
+    reconcile_interval: float = 60.0
+    protection_workers: int = 8
+    rest_workers: int = 8
+    tick_record_dir: str = ""
+    instruments_cache_file: str = "data/instruments.json"
+    instruments_cache_ttl: float = 86400.0
+    stop_update_min_ticks: int = 1
+    metrics_port: int = 0
+    metrics_addr: str = "127.0.0.1"
+    accounts: Tuple[AccountConfig, ...] = ()
+    account_processes: int = 1
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_rotate_when: str = ""
+    audit_log: bool = True
+    state_file: str = "data/state.db"
+    ticker_topics_per_connection: int = 500
+    ticker_unsubscribe_delay: float = 30.0
+    api_url: str = ""
+    ws_url: str = ""
+    price_source: str = "tickers"
+    ingest_process: bool = False
+    ingest_ring_size: int = 65536
+    profile_dir: str = "data/profiles"
+    profile_rate: float = 100.0
+    profile_socket: str = ""
 
 
 def _parse_float(name: str, value: str | None, default: float) -> float:
@@ -23,38 +68,240 @@ def _parse_float(name: str, value: str | None, default: float) -> float:
         raise ValueError(f"Environment variable {name} must be a number, got: {value!r}") from exc
 
 
-def from_env() -> BotConfig:
-    api_key = os.getenv("BYBIT_API_KEY", "").strip()
-    api_secret = os.getenv("BYBIT_API_SECRET", "").strip()
+def _parse_bool(value: str | None, default: bool) -> bool:
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "y"}
+
+
+def _parse_int(name: str, value: str | None, default: int) -> int:
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"Environment variable {name} must be an integer, got: {value!r}") from exc
+
+
+TRAILING_MODES = {"poll", "tick", "adaptive", "exchange"}
+PRICE_SOURCES = {"tickers", "orderbook"}
+# Значения when для TimedRotatingFileHandler; пусто — ротация по размеру
+LOG_ROTATE_WHEN = {"", "S", "M", "H", "D", "MIDNIGHT", "W0", "W1", "W2", "W3", "W4", "W5", "W6"}
+DEFAULT_ACCOUNT = "default"
+_ACCOUNT_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+def _account_from_env(name: str, prefix: str, defaults: Optional[AccountConfig]) -> AccountConfig:
+    """Аккаунт из переменных с префиксом (SUB1_BYBIT_API_KEY ...); параметры трейлинга наследуются"""
+    api_key = os.getenv(f"{prefix}BYBIT_API_KEY", "").strip()
+    api_secret = os.getenv(f"{prefix}BYBIT_API_SECRET", "").strip()
     if not api_key or not api_secret:
         raise ValueError(
-            "BYBIT_API_KEY/BYBIT_API_SECRET are not set. Create .env and provide your keys."
+            f"{prefix}BYBIT_API_KEY/{prefix}BYBIT_API_SECRET are not set. Create .env and provide your keys."
         )
 
-    take_profit_percent = _parse_float("TAKE_PROFIT_PERCENT", os.getenv("TAKE_PROFIT_PERCENT"), 5.0)
-    stop_loss_percent = _parse_float("STOP_LOSS_PERCENT", os.getenv("STOP_LOSS_PERCENT"), -2.5)
-    trailing_start_percent = _parse_float("TRAILING_START_PERCENT", os.getenv("TRAILING_START_PERCENT"), 1.6)
-    trailing_distance_percent = _parse_float("TRAILING_DISTANCE_PERCENT", os.getenv("TRAILING_DISTANCE_PERCENT"), 0.8)
+    def percent(var: str, default: float) -> float:
+        return _parse_float(f"{prefix}{var}", os.getenv(f"{prefix}{var}"), default)
+
+    take_profit_percent = percent("TAKE_PROFIT_PERCENT", defaults.take_profit_percent if defaults else 5.0)
+    stop_loss_percent = percent("STOP_LOSS_PERCENT", defaults.stop_loss_percent if defaults else -2.5)
+    trailing_start_percent = percent(
+        "TRAILING_START_PERCENT", defaults.trailing_start_percent if defaults else 1.6
+    )
+    trailing_distance_percent = percent(
+        "TRAILING_DISTANCE_PERCENT", defaults.trailing_distance_percent if defaults else 0.8
+    )
 
     if take_profit_percent <= 0:
-        raise ValueError("TAKE_PROFIT_PERCENT must be > 0")
+        raise ValueError(f"{prefix}TAKE_PROFIT_PERCENT must be > 0")
     if stop_loss_percent >= 0:
-        raise ValueError("STOP_LOSS_PERCENT must be < 0 (e.g., -2.5)")
+        raise ValueError(f"{prefix}STOP_LOSS_PERCENT must be < 0 (e.g., -2.5)")
     if trailing_start_percent <= 0:
-        raise ValueError("TRAILING_START_PERCENT must be > 0")
+        raise ValueError(f"{prefix}TRAILING_START_PERCENT must be > 0")
     if trailing_distance_percent <= 0:
-        raise ValueError("TRAILING_DISTANCE_PERCENT must be > 0")
+        raise ValueError(f"{prefix}TRAILING_DISTANCE_PERCENT must be > 0")
 
-    log_dir = os.getenv("LOG_DIR", "logs").strip() or "logs"
-    testnet = os.getenv("BYBIT_TESTNET", "false").strip().lower() in {"1", "true", "yes", "y"}
-
-    return BotConfig(
+    return AccountConfig(
+        name=name,
         api_key=api_key,
         api_secret=api_secret,
         take_profit_percent=take_profit_percent,
         stop_loss_percent=stop_loss_percent,
         trailing_start_percent=trailing_start_percent,
         trailing_distance_percent=trailing_distance_percent,
+    )
+
+
+def _accounts_from_env() -> Tuple[AccountConfig, ...]:
+    names = [n.strip() for n in os.getenv("ACCOUNTS", "").split(",") if n.strip()]
+    if not names:
+        return (_account_from_env(DEFAULT_ACCOUNT, "", None),)
+
+    for name in names:
+        if not _ACCOUNT_NAME.match(name):
+            raise ValueError(f"ACCOUNTS: invalid account name {name!r} (letters, digits and _ only)")
+    if len({n.upper() for n in names}) != len(names):
+        raise ValueError("ACCOUNTS: account names must be unique")
+
+    # Общие параметры трейлинга без префикса служат значениями по умолчанию для всех аккаунтов
+    defaults = AccountConfig(
+        name="",
+        api_key="",
+        api_secret="",
+        take_profit_percent=_parse_float("TAKE_PROFIT_PERCENT", os.getenv("TAKE_PROFIT_PERCENT"), 5.0),
+        stop_loss_percent=_parse_float("STOP_LOSS_PERCENT", os.getenv("STOP_LOSS_PERCENT"), -2.5),
+        trailing_start_percent=_parse_float("TRAILING_START_PERCENT", os.getenv("TRAILING_START_PERCENT"), 1.6),
+        trailing_distance_percent=_parse_float(
+            "TRAILING_DISTANCE_PERCENT", os.getenv("TRAILING_DISTANCE_PERCENT"), 0.8
+        ),
+    )
+    return tuple(_account_from_env(name, f"{name.upper()}_", defaults) for name in names)
+
+
+def from_env() -> BotConfig:
+    accounts = _accounts_from_env()
+    first = accounts[0]
+
+    log_dir = os.getenv("LOG_DIR", "logs").strip() or "logs"
+    log_max_bytes = _parse_int("LOG_MAX_BYTES", os.getenv("LOG_MAX_BYTES"), 10 * 1024 * 1024)
+    if log_max_bytes < 0:
+        raise ValueError("LOG_MAX_BYTES must be >= 0 (0 = no size rotation)")
+    log_backup_count = _parse_int("LOG_BACKUP_COUNT", os.getenv("LOG_BACKUP_COUNT"), 5)
+    if log_backup_count < 0:
+        raise ValueError("LOG_BACKUP_COUNT must be >= 0")
+    log_rotate_when = os.getenv("LOG_ROTATE_WHEN", "").strip().upper()
+    if log_rotate_when not in LOG_ROTATE_WHEN:
+        raise ValueError(f"LOG_ROTATE_WHEN must be empty or one of {sorted(LOG_ROTATE_WHEN - {''})}")
+    audit_log = _parse_bool(os.getenv("AUDIT_LOG"), True)
+    state_file = os.getenv("STATE_FILE", "data/state.db").strip()
+    testnet = _parse_bool(os.getenv("BYBIT_TESTNET"), False)
+
+    trailing_mode = os.getenv("TRAILING_MODE", "poll").strip().lower() or "poll"
+    if trailing_mode not in TRAILING_MODES:
+        raise ValueError(f"TRAILING_MODE must be one of {sorted(TRAILING_MODES)}, got: {trailing_mode!r}")
+    stop_update_min_interval = _parse_float(
+        "STOP_UPDATE_MIN_INTERVAL", os.getenv("STOP_UPDATE_MIN_INTERVAL"), 0.5
+    )
+    if stop_update_min_interval < 0:
+        raise ValueError("STOP_UPDATE_MIN_INTERVAL must be >= 0")
+    # Режим adaptive: интервал проверки позиции по расстоянию до ближайшего события стопа
+    check_min_interval = _parse_float("CHECK_MIN_INTERVAL", os.getenv("CHECK_MIN_INTERVAL"), 0.2)
+    check_max_interval = _parse_float("CHECK_MAX_INTERVAL", os.getenv("CHECK_MAX_INTERVAL"), 10.0)
+    check_seconds_per_percent = _parse_float(
+        "CHECK_SECONDS_PER_PERCENT", os.getenv("CHECK_SECONDS_PER_PERCENT"), 5.0
+    )
+    if check_min_interval <= 0:
+        raise ValueError("CHECK_MIN_INTERVAL must be > 0")
+    if check_max_interval < check_min_interval:
+        raise ValueError("CHECK_MAX_INTERVAL must be >= CHECK_MIN_INTERVAL")
+    if check_seconds_per_percent < 0:
+        raise ValueError("CHECK_SECONDS_PER_PERCENT must be >= 0")
+
+    private_stream = _parse_bool(os.getenv("PRIVATE_STREAM"), False)
+    reconcile_interval = _parse_float("RECONCILE_INTERVAL", os.getenv("RECONCILE_INTERVAL"), 60.0)
+    if reconcile_interval <= 0:
+        raise ValueError("RECONCILE_INTERVAL must be > 0")
+
+    protection_workers = _parse_int("PROTECTION_WORKERS", os.getenv("PROTECTION_WORKERS"), 8)
+    if protection_workers < 1:
+        raise ValueError("PROTECTION_WORKERS must be >= 1")
+    rest_workers = _parse_int("REST_WORKERS", os.getenv("REST_WORKERS"), 8)
+    if rest_workers < 1:
+        raise ValueError("REST_WORKERS must be >= 1")
+
+    tick_record_dir = os.getenv("TICK_RECORD_DIR", "").strip()
+
+    instruments_cache_file = os.getenv("INSTRUMENTS_CACHE_FILE", "").strip() or "data/instruments.json"
+    instruments_cache_ttl = _parse_float("INSTRUMENTS_CACHE_TTL", os.getenv("INSTRUMENTS_CACHE_TTL"), 86400.0)
+    if instruments_cache_ttl <= 0:
+        raise ValueError("INSTRUMENTS_CACHE_TTL must be > 0")
+    stop_update_min_ticks = _parse_int("STOP_UPDATE_MIN_TICKS", os.getenv("STOP_UPDATE_MIN_TICKS"), 1)
+    if stop_update_min_ticks < 0:
+        raise ValueError("STOP_UPDATE_MIN_TICKS must be >= 0")
+
+    metrics_port = _parse_int("METRICS_PORT", os.getenv("METRICS_PORT"), 0)
+    if not 0 <= metrics_port <= 65535:
+        raise ValueError("METRICS_PORT must be between 0 and 65535")
+    metrics_addr = os.getenv("METRICS_ADDR", "").strip() or "127.0.0.1"
+
+    ticker_topics_per_connection = _parse_int(
+        "TICKER_TOPICS_PER_CONNECTION", os.getenv("TICKER_TOPICS_PER_CONNECTION"), 500
+    )
+    if ticker_topics_per_connection < 1:
+        raise ValueError("TICKER_TOPICS_PER_CONNECTION must be >= 1")
+    ticker_unsubscribe_delay = _parse_float(
+        "TICKER_UNSUBSCRIBE_DELAY", os.getenv("TICKER_UNSUBSCRIBE_DELAY"), 30.0
+    )
+    if ticker_unsubscribe_delay < 0:
+        raise ValueError("TICKER_UNSUBSCRIBE_DELAY must be >= 0")
+    price_source = os.getenv("PRICE_SOURCE", "tickers").strip().lower() or "tickers"
+    if price_source not in PRICE_SOURCES:
+        raise ValueError(f"PRICE_SOURCE must be one of {sorted(PRICE_SOURCES)}, got: {price_source!r}")
+
+    # Адреса вместо api.bybit.com/stream.bybit.com — для локальной биржи (mockexchange.py)
+    api_url = os.getenv("BYBIT_API_URL", "").strip().rstrip("/")
+    if api_url and not api_url.startswith(("http://", "https://")):
+        raise ValueError("BYBIT_API_URL must start with http:// or https://")
+    ws_url = os.getenv("BYBIT_WS_URL", "").strip().rstrip("/")
+    if ws_url and not ws_url.startswith(("ws://", "wss://")):
+        raise ValueError("BYBIT_WS_URL must start with ws:// or wss://")
+
+    account_processes = _parse_int("ACCOUNT_PROCESSES", os.getenv("ACCOUNT_PROCESSES"), 1)
+    if account_processes < 1:
+        raise ValueError("ACCOUNT_PROCESSES must be >= 1")
+
+    # Приём цен в отдельном процессе; записи кольцевого буфера — степень двойки
+    ingest_process = _parse_bool(os.getenv("INGEST_PROCESS"), False)
+    ingest_ring_size = _parse_int("INGEST_RING_SIZE", os.getenv("INGEST_RING_SIZE"), 65536)
+    if ingest_ring_size < 1024 or ingest_ring_size & (ingest_ring_size - 1):
+        raise ValueError(f"INGEST_RING_SIZE must be a power of two >= 1024, got: {ingest_ring_size}")
+
+    # Профилировщик по запросу: SIGUSR2 или команды в PROFILE_SOCKET (пусто — сокета нет)
+    profile_dir = os.getenv("PROFILE_DIR", "data/profiles").strip() or "data/profiles"
+    profile_rate = _parse_float("PROFILE_RATE", os.getenv("PROFILE_RATE"), 100.0)
+    if not 0 < profile_rate <= 1000:
+        raise ValueError("PROFILE_RATE must be in (0, 1000]")
+    profile_socket = os.getenv("PROFILE_SOCKET", "").strip()
+
+    return BotConfig(
+        api_key=first.api_key,
+        api_secret=first.api_secret,
+        take_profit_percent=first.take_profit_percent,
+        stop_loss_percent=first.stop_loss_percent,
+        trailing_start_percent=first.trailing_start_percent,
+        trailing_distance_percent=first.trailing_distance_percent,
         log_dir=log_dir,
         testnet=testnet,
+        trailing_mode=trailing_mode,
+        stop_update_min_interval=stop_update_min_interval,
+        check_min_interval=check_min_interval,
+        check_max_interval=check_max_interval,
+        check_seconds_per_percent=check_seconds_per_percent,
+        private_stream=private_stream,
+        reconcile_interval=reconcile_interval,
+        protection_workers=protection_workers,
+        rest_workers=rest_workers,
+        tick_record_dir=tick_record_dir,
+        instruments_cache_file=instruments_cache_file,
+        instruments_cache_ttl=instruments_cache_ttl,
+        stop_update_min_ticks=stop_update_min_ticks,
+        metrics_port=metrics_port,
+        metrics_addr=metrics_addr,
+        accounts=accounts,
+        account_processes=account_processes,
+        log_max_bytes=log_max_bytes,
+        log_backup_count=log_backup_count,
+        log_rotate_when=log_rotate_when,
+        audit_log=audit_log,
+        state_file=state_file,
+        ticker_topics_per_connection=ticker_topics_per_connection,
+        ticker_unsubscribe_delay=ticker_unsubscribe_delay,
+        api_url=api_url,
+        ws_url=ws_url,
+        price_source=price_source,
+        ingest_process=ingest_process,
+        ingest_ring_size=ingest_ring_size,
+        profile_dir=profile_dir,
+        profile_rate=profile_rate,
+        profile_socket=profile_socket,
     )
@@ -0,0 +1,203 @@
+"""Общий публичный поток тикеров для всех аккаунтов процесса.
+
+Соединения WebSocket(channel_type="linear") пишут цены в общий
+PriceCache, а уведомление о тике раздаётся только аккаунтам, которым
+нужен этот символ. Подписками управляет SubscriptionManager: символ, у
+которого не осталось слушателей, отписывается.
+
+С источником цен orderbook лучшие bid/ask берутся из orderbook.1: Bybit
+присылает его чаще тикеров, а локальный верх стакана собирается из snapshot и
+delta. Тикеры остаются подписанными: из них берётся lastPrice, а если стакан
+молчит дольше ORDERBOOK_STALE_AFTER секунд — и bid/ask.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Protocol, Set, Tuple
+
+import metrics
+from prices import PriceCache
+from recorder import TickRecorder
+from subscriptions import ORDERBOOK_TOPIC, TICKER_TOPIC, SubscriptionManager
+
+WS_MESSAGES = metrics.counter("bytrailor_ws_messages", "WebSocket messages received", ("stream",))
+_ws_public_messages = WS_MESSAGES.labels("public")
+_ws_orderbook_messages = WS_MESSAGES.labels("orderbook")
+
+# Bybit повторяет снимок orderbook.1 раз в 3 с, даже если стакан не менялся
+ORDERBOOK_STALE_AFTER = 5.0
+
+
+class PriceListener(Protocol):
+    def on_price(self, symbol: str) -> None:
+        ...
+
+
+def safe_float(value: Any, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class TopOfBook:
+    """Локальный верх стакана одного символа по сообщениям orderbook.1"""
+
+    __slots__ = ("bids", "asks", "updated_at")
+
+    def __init__(self) -> None:
+        self.bids: Dict[float, float] = {}
+        self.asks: Dict[float, float] = {}
+        # time.monotonic() последнего сообщения; 0 — снимка ещё не было
+        self.updated_at = 0.0
+
+    @staticmethod
+    def _apply(levels: Dict[float, float], entries: List[List[str]]) -> None:
+        for price, size in entries:
+            value = safe_float(size, 0.0)
+            if value > 0:
+                levels[safe_float(price, 0.0)] = value
+            else:
+                levels.pop(safe_float(price, 0.0), None)
+
+    def apply(self, kind: str, data: Dict[str, Any]) -> bool:
+        """Применяет snapshot/delta; False — delta до первого снимка (её не к чему применить)"""
+        if kind == "snapshot":
+            self.bids.clear()
+            self.asks.clear()
+        elif not self.updated_at:
+            return False
+        self._apply(self.bids, data.get("b", ()))
+        self._apply(self.asks, data.get("a", ()))
+        self.updated_at = time.monotonic()
+        return True
+
+    def best(self) -> Tuple[float, float]:
+        """(bid, ask); 0 для пустой стороны"""
+        return max(self.bids, default=0.0), min(self.asks, default=0.0)
+
+    def is_fresh(self, now: float) -> bool:
+        return bool(self.updated_at) and now - self.updated_at < ORDERBOOK_STALE_AFTER
+
+
+class PublicFeed:
+    def __init__(
+        self,
+        price_cache: PriceCache,
+        testnet: bool,
+        recorder: Optional[TickRecorder] = None,
+        topics_per_connection: int = 500,
+        unsubscribe_delay: float = 30.0,
+        ws_url: str = "",
+        price_source: str = "tickers",
+        subscriptions: Optional[Any] = None,
+    ) -> None:
+        self.price_cache = price_cache
+        self.testnet = testnet
+        self.recorder = recorder
+        self.price_source = price_source
+        # Верх стакана и последняя цена сделки по символу; каждый символ обслуживает
+        # поток одного соединения, поэтому записи одного символа не пересекаются
+        self._books: Dict[str, TopOfBook] = {}
+        self._last_prices: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Кортежи заменяются целиком, поэтому колбэк читает их без блокировки
+        self._listeners: Dict[str, Tuple[PriceListener, ...]] = {}
+        # Символы без слушателя (подписка без listener): держатся до конца работы
+        self._pinned: Set[str] = set()
+        # Подписки, запрошенные до start(), менеджер отправит пачкой после подключения;
+        # свой менеджер (subscriptions) — у потока цен из другого процесса (ingest.RingFeed)
+        self.subscriptions = subscriptions or SubscriptionManager(
+            testnet,
+            self.handle_price_update,
+            max_topics_per_connection=topics_per_connection,
+            unsubscribe_delay=unsubscribe_delay,
+            url=f"{ws_url}/v5/public/linear" if ws_url else "",
+            templates=(ORDERBOOK_TOPIC, TICKER_TOPIC) if price_source == "orderbook" else (TICKER_TOPIC,),
+        )
+
+    def start(self) -> None:
+        self.subscriptions.start()
+
+    def exit(self) -> None:
+        self.subscriptions.exit()
+
+    def subscribe(self, symbol: str, listener: Optional[PriceListener] = None) -> None:
+        self.subscribe_many([symbol], listener)
+
+    def subscribe_many(self, symbols: List[str], listener: Optional[PriceListener] = None) -> None:
+        """Подписка на несколько символов; менеджер отправляет их пачками"""
+        symbols = list(dict.fromkeys(symbols))
+        with self._lock:
+            for symbol in symbols:
+                if listener is None:
+                    self._pinned.add(symbol)
+                    continue
+                listeners = self._listeners.get(symbol, ())
+                if listener not in listeners:
+                    self._listeners[symbol] = listeners + (listener,)
+            # Под той же блокировкой, что и отписка: иначе add и remove могут поменяться местами
+            self.subscriptions.add(symbols)
+
+    def unsubscribe(self, symbol: str, listener: PriceListener) -> None:
+        """Снимает слушателя; поток символа закрывается, когда слушателей не осталось"""
+        with self._lock:
+            listeners = self._listeners.get(symbol, ())
+            if listener not in listeners:
+                return
+            listeners = tuple(item for item in listeners if item is not listener)
+            if listeners:
+                self._listeners[symbol] = listeners
+                return
+            del self._listeners[symbol]
+            if symbol not in self._pinned:
+                self.subscriptions.remove([symbol])
+
+    def _publish(self, symbol: str, ts: Any, last_price: float, bid_price: float, ask_price: float) -> None:
+        ts = ts / 1000 if ts else time.time()
+        self.price_cache.update(symbol, ts, last_price, bid_price, ask_price)
+        if self.recorder:
+            self.recorder.record(symbol, ts, last_price, bid_price, ask_price)
+        for listener in self._listeners.get(symbol, ()):
+            listener.on_price(symbol)
+
+    def handle_price_update(self, message: Dict[str, Any]) -> None:
+        try:
+            topic = message.get("topic", "")
+            if topic.startswith("orderbook."):
+                self.handle_orderbook_update(message)
+            elif "tickers" in topic:
+                _ws_public_messages.inc()
+                data = message.get("data", {})
+                symbol = data.get("symbol", "")
+                if symbol:
+                    last_price = safe_float(data.get("lastPrice", 0), 0.0)
+                    self._last_prices[symbol] = last_price
+                    book = self._books.get(symbol)
+                    if book is not None and book.is_fresh(time.monotonic()):
+                        # bid/ask тикера старше стакана: берём только lastPrice
+                        bid_price, ask_price = book.best()
+                    else:
+                        bid_price = safe_float(data.get("bid1Price", 0), 0.0)
+                        ask_price = safe_float(data.get("ask1Price", 0), 0.0)
+                    self._publish(symbol, message.get("ts"), last_price, bid_price, ask_price)
+        except Exception as e:
+            logging.error("Error handling price update: %s", e)
+
+    def handle_orderbook_update(self, message: Dict[str, Any]) -> None:
+        _ws_orderbook_messages.inc()
+        data = message.get("data", {})
+        symbol = data.get("s", "")
+        if not symbol:
+            return
+        book = self._books.get(symbol)
+        if book is None:
+            book = self._books[symbol] = TopOfBook()
+        if not book.apply(message.get("type", ""), data):
+            return
+        bid_price, ask_price = book.best()
+        if bid_price <= 0 or ask_price <= 0:
+            return
+        # До первого тикера последней сделки нет: середина стакана ближе всего к ней
+        last_price = self._last_prices.get(symbol) or (bid_price + ask_price) / 2
+        self._publish(symbol, message.get("ts"), last_price, bid_price, ask_price)
@@ -0,0 +1,224 @@
+"""Отдельный процесс приёма цен и его связь с процессом аккаунтов.
+
+При INGEST_PROCESS=true публичный WebSocket, разбор JSON и верх стакана
+живут в процессе приёма (run_ingest) и не конкурируют за GIL с трейлингом
+и REST. Процесс приёма пишет цены в PriceRing, процесс аккаунтов читает их
+через RingFeed — тот же интерфейс, что у PublicFeed. Подписки передаются
+обратно командами через очередь multiprocessing:
+("reset", epoch), ("add", [(symbol, slot), ...]), ("remove", [symbol, ...]);
+slot — слот символа в PriceCache процесса аккаунтов, epoch — эпоха его
+читателя буфера (ring.RingReader).
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+from config import BotConfig
+from feed import WS_MESSAGES, PublicFeed
+from prices import PriceCache
+from recorder import TickRecorder
+from ring import CONNECTIONS, TOPICS, PriceRing, RingReader, RingWriter, latest
+
+# Опрос очереди команд; заодно и период heartbeat процесса приёма
+COMMAND_POLL_INTERVAL = 0.05
+# Пауза читателя буфера, когда новых записей нет
+RING_POLL_INTERVAL = 0.0005
+
+_ring_records = WS_MESSAGES.labels("ring")
+
+
+class _RingSink:
+    """Замена PriceCache для PublicFeed процесса приёма: цена уходит в буфер под слотом читателя"""
+
+    def __init__(self, writer: RingWriter) -> None:
+        self.writer = writer
+        self.slots: Dict[str, int] = {}
+        self.epoch = 0
+
+    def update(self, symbol: str, ts: float, last: float, bid: float, ask: float) -> None:
+        slot = self.slots.get(symbol)
+        if slot is not None:
+            self.writer.write(slot, self.epoch, ts, last, bid, ask)
+
+
+def _apply_command(feed: PublicFeed, sink: _RingSink, command: Tuple[Any, ...]) -> None:
+    op = command[0]
+    if op == "reset":
+        # Слоты читателя могли смениться (перезапуск процесса аккаунтов): набор придёт заново,
+        # а потоки, которых в нём не будет, отпишутся с обычной задержкой
+        feed.subscriptions.remove(list(sink.slots))
+        sink.slots.clear()
+        sink.epoch = command[1]
+    elif op == "add":
+        pairs = command[1]
+        sink.slots.update(pairs)
+        feed.subscriptions.add([symbol for symbol, _ in pairs])
+    elif op == "remove":
+        feed.subscriptions.remove(command[1])
+    else:
+        logging.warning("Unknown ingest command: %r", op)
+
+
+def run_ingest(cfg: BotConfig, ring_name: str, control: Any, record_ticks: bool = True) -> None:
+    """Тело процесса приёма: публичный поток -> PriceRing, команды подписки из control"""
+    ring = PriceRing(ring_name)
+    writer = RingWriter(ring)
+    sink = _RingSink(writer)
+    recorder: Optional[TickRecorder] = None
+    if record_ticks and cfg.tick_record_dir:
+        recorder = TickRecorder(cfg.tick_record_dir)
+        recorder.start()
+        logging.info("Recording ticker stream to %s", cfg.tick_record_dir)
+    feed = PublicFeed(
+        sink,  # type: ignore[arg-type]
+        cfg.testnet,
+        recorder,
+        topics_per_connection=cfg.ticker_topics_per_connection,
+        unsubscribe_delay=cfg.ticker_unsubscribe_delay,
+        ws_url=cfg.ws_url,
+        price_source=cfg.price_source,
+    )
+    feed.start()
+    logging.info("Ingest process started (generation %d, ring of %d records)", writer.generation, ring.capacity)
+    try:
+        while True:
+            # Без блокирующего get: ожидающий get держит блокировку чтения очереди, и процесс,
+            # убитый супервизором в этот момент, оставил бы её занятой для своей замены
+            while True:
+                try:
+                    command = control.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    _apply_command(feed, sink, command)
+                except Exception as e:
+                    logging.error("Error applying ingest command %r: %s", command[0], e)
+            writer.heartbeat(feed.subscriptions.topics(), feed.subscriptions.connections())
+            time.sleep(COMMAND_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        logging.info("Ingest process stopping...")
+    finally:
+        feed.exit()
+        if recorder:
+            recorder.stop()
+        ring.close()
+
+
+class _RingSubscriptions:
+    """Сторона SubscriptionManager в процессе аккаунтов: подписки уходят командами процессу приёма"""
+
+    def __init__(self, ring: PriceRing, epoch: int, control: Any, price_cache: PriceCache) -> None:
+        self._ring = ring
+        self._epoch = epoch
+        self._control = control
+        self._price_cache = price_cache
+        self._lock = threading.Lock()
+        self._wanted: Set[str] = set()
+
+    def start(self) -> None:
+        pass
+
+    def exit(self) -> None:
+        pass
+
+    def add(self, symbols: Iterable[str]) -> None:
+        pairs = [(symbol, self._price_cache.slot(symbol)) for symbol in symbols]
+        if not pairs:
+            return
+        with self._lock:
+            self._wanted.update(symbol for symbol, _ in pairs)
+            self._control.put(("add", pairs))
+
+    def remove(self, symbols: Iterable[str]) -> None:
+        symbols = list(symbols)
+        with self._lock:
+            self._wanted.difference_update(symbols)
+            self._control.put(("remove", symbols))
+
+    def resync(self) -> None:
+        """Полный набор подписок заново: процесс приёма перезапущен или ещё не видел этот процесс"""
+        with self._lock:
+            pairs = [(symbol, self._price_cache.slot(symbol)) for symbol in sorted(self._wanted)]
+            self._control.put(("reset", self._epoch))
+            if pairs:
+                self._control.put(("add", pairs))
+
+    def topics(self) -> int:
+        return int(self._ring.header[TOPICS])
+
+    def connections(self) -> int:
+        return int(self._ring.header[CONNECTIONS])
+
+
+class RingFeed(PublicFeed):
+    """PublicFeed процесса аккаунтов: цены читаются из PriceRing, а не из WebSocket.
+
+    Поток чтения забирает все новые записи разом и по каждому символу
+    применяет только последнюю, поэтому работа на проход зависит от числа
+    символов, а не от частоты тиков.
+    """
+
+    def __init__(self, price_cache: PriceCache, ring_name: str, control: Any) -> None:
+        self.ring = PriceRing(ring_name)
+        self._reader = RingReader(self.ring)
+        subscriptions = _RingSubscriptions(self.ring, self._reader.epoch, control, price_cache)
+        super().__init__(price_cache, testnet=False, subscriptions=subscriptions)
+        self._stopped = threading.Event()
+        self._generation: Optional[int] = None
+
+    @property
+    def overruns(self) -> int:
+        """Записи, пропущенные из-за того, что писатель обогнал читателя на круг"""
+        return self._reader.overruns
+
+    def start(self) -> None:
+        threading.Thread(target=self._read_loop, name="price-ring-reader", daemon=True).start()
+
+    def exit(self) -> None:
+        self._stopped.set()
+
+    def _read_loop(self) -> None:
+        reader = self._reader
+        while not self._stopped.is_set():
+            try:
+                generation = self.ring.generation
+                if generation != self._generation:
+                    if self._generation is not None:
+                        logging.warning("Ingest process restarted (generation %d), resubscribing", generation)
+                    self._generation = generation
+                    self.subscriptions.resync()
+                chunks = reader.read()
+                if not chunks:
+                    time.sleep(RING_POLL_INTERVAL)
+                    continue
+                batch = latest(chunks, reader.epoch)
+                records = sum(len(chunk) for chunk in chunks)
+                _ring_records.inc(records)
+                if reader.lapped():
+                    # Пока разбирали, писатель перезаписал эти записи; свежие возьмёт следующее чтение
+                    reader.overruns += records
+                    continue
+                self._apply(*batch)
+            except Exception as e:
+                logging.error("Error reading price ring: %s", e)
+                time.sleep(1)
+
+    def _apply(
+        self,
+        slots: np.ndarray,
+        ts: np.ndarray,
+        last: np.ndarray,
+        bid: np.ndarray,
+        ask: np.ndarray,
+        received: np.ndarray,
+    ) -> None:
+        self.price_cache.update_many(slots, ts, last, bid, ask, received)
+        symbol_at = self.price_cache.symbol_at
+        for slot in slots.tolist():
+            symbol = symbol_at(slot)
+            for listener in self._listeners.get(symbol, ()):
+                listener.on_price(symbol)
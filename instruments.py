@@ -0,0 +1,234 @@
+"""Кэш параметров инструментов (шаг цены, шаг количества, минимальный объём).
+
+Загружается одним постраничным запросом get_instruments_info при старте,
+хранится на диске с TTL и обновляется лениво: по истечении TTL — в фоне,
+для неизвестного символа (новый листинг) — точечным запросом.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Set
+
+INSTRUMENTS_PAGE_LIMIT = 1000
+INSTRUMENTS_MAX_PAGES = 10
+# Не повторяем неудачную загрузку (и запрос символа, которого нет на бирже) чаще раза в минуту
+RETRY_INTERVAL = 60.0
+# Сколько ждать первую загрузку, прежде чем запрашивать неизвестный символ отдельно
+LOAD_WAIT_TIMEOUT = 5.0
+
+
+class Instrument(NamedTuple):
+    symbol: str
+    tick_size: float
+    qty_step: float
+    min_qty: float
+    min_notional: float
+
+
+def _float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_instrument(item: Dict[str, Any]) -> Optional[Instrument]:
+    symbol = item.get("symbol", "")
+    tick_size = _float(item.get("priceFilter", {}).get("tickSize", 0))
+    if not symbol or tick_size <= 0:
+        return None
+    lot = item.get("lotSizeFilter", {})
+    return Instrument(
+        symbol=symbol,
+        tick_size=tick_size,
+        qty_step=_float(lot.get("qtyStep", 0)),
+        min_qty=_float(lot.get("minOrderQty", 0)),
+        min_notional=_float(lot.get("minNotionalValue", 0)),
+    )
+
+
+class InstrumentCache:
+    def __init__(self, path: str, ttl: float, fetch: Callable[..., Dict[str, Any]]) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._fetch = fetch
+        self._instruments: Dict[str, Instrument] = {}
+        self._loaded_at = 0.0
+        self._missing: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._refreshing = False
+        self._refresh_attempted_at = -RETRY_INTERVAL
+        # load() идёт параллельно со снимком позиций: до его завершения неизвестные
+        # символы ждут общей загрузки, а не запрашиваются по одному
+        self._loaded = threading.Event()
+        # Символы, которые cached_tick_size ищет в фоне
+        self._lookups: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._instruments)
+
+    def load(self) -> None:
+        """Берёт свежий файл с диска, иначе загружает всё с биржи"""
+        with self._lock:
+            self._refreshing = True
+        try:
+            if self._read_file() and not self._expired():
+                logging.info("Loaded %d instruments from %s", len(self._instruments), self.path)
+                return
+            if not self.refresh() and self._instruments:
+                logging.warning("Using expired instrument cache from %s", self.path)
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._refresh_attempted_at = time.monotonic()
+            self._loaded.set()
+
+    def _expired(self) -> bool:
+        return time.time() - self._loaded_at > self.ttl
+
+    def refresh(self) -> bool:
+        instruments: Dict[str, Instrument] = {}
+        cursor = ""
+        try:
+            for _ in range(INSTRUMENTS_MAX_PAGES):
+                params: Dict[str, Any] = {"category": "linear", "limit": INSTRUMENTS_PAGE_LIMIT}
+                if cursor:
+                    params["cursor"] = cursor
+                response = self._fetch(**params)
+                if response.get("retCode") != 0:
+                    logging.error(
+                        "Failed to load instruments: %s (retCode: %s)",
+                        response.get("retMsg"),
+                        response.get("retCode"),
+                    )
+                    return False
+                result = response.get("result", {})
+                for item in result.get("list", []):
+                    instrument = parse_instrument(item)
+                    if instrument:
+                        instruments[instrument.symbol] = instrument
+                cursor = result.get("nextPageCursor", "")
+                if not cursor:
+                    break
+        except Exception as e:
+            logging.error("Failed to load instruments: %s", e)
+            return False
+
+        with self._lock:
+            self._instruments = instruments
+            self._loaded_at = time.time()
+            self._missing.clear()
+        self._write_file()
+        logging.info("Loaded %d instruments from exchange", len(instruments))
+        return True
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self, symbol: str) -> Optional[Instrument]:
+        instrument = self._instruments.get(symbol)
+        if self._expired() and self._loaded.is_set():
+            now = time.monotonic()
+            with self._lock:
+                start = not self._refreshing and now - self._refresh_attempted_at >= RETRY_INTERVAL
+                if start:
+                    self._refreshing = True
+                    self._refresh_attempted_at = now
+            if start:
+                threading.Thread(target=self._refresh_in_background, name="instruments", daemon=True).start()
+        if instrument is None and not self._loaded.is_set():
+            self._loaded.wait(LOAD_WAIT_TIMEOUT)
+            instrument = self._instruments.get(symbol)
+        if instrument is None:
+            instrument = self._fetch_symbol(symbol)
+        return instrument
+
+    def tick_size(self, symbol: str) -> float:
+        """Шаг цены символа или 0, если он неизвестен (тогда цены округляются до 6 знаков)"""
+        instrument = self.get(symbol)
+        return instrument.tick_size if instrument else 0.0
+
+    def cached_tick_size(self, symbol: str) -> float:
+        """Шаг цены без ожидания: из памяти (файла на диске) или 0.
+
+        Неизвестный символ ищется в фоне тем же get(); значение подхватит
+        следующий снимок позиций. Запросы, которым цену нужно округлить
+        (начальные SL/TP), по-прежнему вызывают tick_size() и ждут загрузку.
+        """
+        instrument = self._instruments.get(symbol)
+        if instrument is not None:
+            return instrument.tick_size
+        with self._lock:
+            start = symbol not in self._lookups
+            self._lookups.add(symbol)
+        if start:
+            threading.Thread(target=self._lookup, args=(symbol,), name="instruments-lookup", daemon=True).start()
+        return 0.0
+
+    def _lookup(self, symbol: str) -> None:
+        try:
+            self.get(symbol)
+        finally:
+            with self._lock:
+                self._lookups.discard(symbol)
+
+    def _fetch_symbol(self, symbol: str) -> Optional[Instrument]:
+        now = time.monotonic()
+        if now - self._missing.get(symbol, -RETRY_INTERVAL) < RETRY_INTERVAL:
+            return None
+        try:
+            response = self._fetch(category="linear", symbol=symbol)
+            items = response.get("result", {}).get("list", []) if response.get("retCode") == 0 else []
+            instrument = parse_instrument(items[0]) if items else None
+        except Exception as e:
+            logging.error("%s: Failed to load instrument info: %s", symbol, e)
+            instrument = None
+        with self._lock:
+            if instrument is None:
+                self._missing[symbol] = now
+                return None
+            self._instruments = dict(self._instruments, **{symbol: instrument})
+        self._write_file()
+        return instrument
+
+    def _read_file(self) -> bool:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            instruments = {
+                symbol: Instrument(symbol, *values) for symbol, values in payload["instruments"].items()
+            }
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning("Ignoring unreadable instrument cache %s: %s", self.path, e)
+            return False
+        with self._lock:
+            self._instruments = instruments
+            self._loaded_at = float(payload.get("saved_at", 0))
+        return True
+
+    def _write_file(self) -> None:
+        with self._lock:
+            payload = {
+                "saved_at": self._loaded_at,
+                "instruments": {symbol: list(i[1:]) for symbol, i in self._instruments.items()},
+            }
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with self._file_lock:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, separators=(",", ":"))
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning("Could not save instrument cache to %s: %s", self.path, e)
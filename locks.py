@@ -0,0 +1,96 @@
+"""Блокировки со счётчиками ожидания, чтобы конкуренцию потоков можно было измерить."""
+import threading
+import time
+from typing import NamedTuple
+
+
+class LockStats(NamedTuple):
+    name: str
+    acquisitions: int
+    contended: int
+    wait_total: float
+    wait_max: float
+    # Время удержания: копится, только пока включён TimedLock.track_hold (профилировщик)
+    hold_total: float = 0.0
+    hold_max: float = 0.0
+
+
+class TimedLock:
+    """Замена threading.Lock, считающая захваты и время ожидания.
+
+    Незанятая блокировка берётся без замера времени; perf_counter вызывается
+    только когда поток действительно ждёт. Счётчики меняются под самой
+    блокировкой, поэтому отдельная синхронизация для них не нужна.
+    Время удержания замеряется, только пока track_hold включён.
+    """
+
+    # Общий переключатель для всех блокировок; включает профилировщик (profiler.py)
+    track_hold = False
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._acquisitions = 0
+        self._contended = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._acquired_at = 0.0
+        self._hold_total = 0.0
+        self._hold_max = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self._acquisitions += 1
+            if self.track_hold:
+                self._acquired_at = time.perf_counter()
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        if not self._lock.acquire(True, timeout):
+            return False
+        waited = time.perf_counter() - started
+        self._acquisitions += 1
+        self._contended += 1
+        self._wait_total += waited
+        if waited > self._wait_max:
+            self._wait_max = waited
+        if self.track_hold:
+            self._acquired_at = time.perf_counter()
+        return True
+
+    def release(self) -> None:
+        acquired_at = self._acquired_at
+        if acquired_at:
+            self._acquired_at = 0.0
+            held = time.perf_counter() - acquired_at
+            self._hold_total += held
+            if held > self._hold_max:
+                self._hold_max = held
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *args: object) -> None:
+        self.release()
+
+    def reset_hold(self) -> None:
+        """Обнуляет счётчики удержания перед новым замером"""
+        with self._lock:
+            self._hold_total = 0.0
+            self._hold_max = 0.0
+
+    def stats(self) -> LockStats:
+        return LockStats(
+            self.name,
+            self._acquisitions,
+            self._contended,
+            self._wait_total,
+            self._wait_max,
+            self._hold_total,
+            self._hold_max,
+        )
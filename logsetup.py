@@ -0,0 +1,126 @@
+"""Неблокирующее логирование и журнал аудита ордеров.
+
+Все обработчики логгеров — QueueHandler: поток, который двигает стопы,
+только кладёт запись в очередь. Запись на диск и в консоль выполняет
+QueueListener в фоновом потоке, файлы ротируются по размеру или по времени.
+
+Журнал аудита (audit.jsonl) — отдельный поток записей JSON по одной на
+каждый вызов set_trading_stop/place_order (и пакетных place/amend):
+параметры, retCode и задержка.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+AUDIT_LOGGER = "bytrailor.audit"
+
+_listeners: List[logging.handlers.QueueListener] = []
+_audit = logging.getLogger(AUDIT_LOGGER)
+_audit.propagate = False
+_audit.setLevel(logging.INFO)
+
+
+def _file_handler(path: Path, max_bytes: int, backup_count: int, rotate_when: str) -> logging.Handler:
+    if rotate_when:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=rotate_when, backupCount=backup_count, encoding="utf-8"
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+
+
+def _attach(logger: logging.Logger, *handlers: logging.Handler) -> None:
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+def setup_logging(
+    log_dir: str,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    rotate_when: str = "",
+    audit: bool = True,
+    suffix: str = "",
+) -> str:
+    """Настраивает корневой логгер и журнал аудита; повторный вызов заменяет обработчики.
+
+    suffix отделяет файлы дочерних процессов: ротация одного файла из
+    нескольких процессов небезопасна. Возвращает путь к основному логу.
+    """
+    stop_logging()
+    Path(log_dir).mkdir(parents=True, exist_ok=True)
+    log_path = Path(log_dir) / f"trading_bot{suffix}.log"
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = _file_handler(log_path, max_bytes, backup_count, rotate_when)
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    _attach(root, file_handler, console_handler)
+
+    for handler in list(_audit.handlers):
+        _audit.removeHandler(handler)
+    if audit:
+        audit_handler = _file_handler(Path(log_dir) / f"audit{suffix}.jsonl", max_bytes, backup_count, rotate_when)
+        audit_handler.setFormatter(logging.Formatter("%(message)s"))
+        _attach(_audit, audit_handler)
+    return str(log_path)
+
+
+def stop_logging() -> None:
+    """Дописывает очереди на диск; вызывается при завершении процесса"""
+    while _listeners:
+        try:
+            _listeners.pop().stop()
+        except Exception:
+            pass
+
+
+def audit(
+    account: str,
+    method: str,
+    params: Dict[str, Any],
+    latency: float,
+    response: Optional[Dict[str, Any]] = None,
+    error: Optional[BaseException] = None,
+) -> None:
+    """Одна строка JSONL на запрос к бирже; сериализация идёт в вызывающем потоке, запись — в фоне"""
+    if not _audit.handlers:
+        return
+    record: Dict[str, Any] = {
+        "ts": round(time.time(), 3),
+        "account": account,
+        "method": method,
+        "params": params,
+        "latency_ms": round(latency * 1000, 3),
+    }
+    if response is not None:
+        record["retCode"] = response.get("retCode")
+        record["retMsg"] = response.get("retMsg")
+        result = response.get("result")
+        if isinstance(result, dict) and result.get("orderId"):
+            record["orderId"] = result["orderId"]
+        elif isinstance(result, dict) and isinstance(result.get("list"), list):
+            # Пакетный запрос: orderId и код ответа каждого ордера
+            infos = (response.get("retExtInfo") or {}).get("list") or []
+            record["orders"] = [
+                {"orderId": item.get("orderId", ""), "code": info.get("code")}
+                for item, info in zip(result["list"], infos)
+            ]
+    if error is not None:
+        record["error"] = f"{type(error).__name__}: {error}"
+    _audit.info(json.dumps(record, default=str, separators=(",", ":")))
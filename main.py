@@ -1,534 +1,318 @@
+import os
+import signal
 import time
 import logging
-from pathlib import Path
-import threading
-from typing import Any, Dict, List
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 from dotenv import load_dotenv
-from pybit.unified_trading import HTTP, WebSocket
-from config import from_env as load_config
-
-load_dotenv()
-
-try:
-    _cfg = load_config()
-except Exception as e:
-    print(f"Configuration error: {e}")
-    raise SystemExit(1) from e
-
-Path(_cfg.log_dir).mkdir(parents=True, exist_ok=True)
-LOG_FILE_PATH = str(Path(_cfg.log_dir) / "trading_bot.log")
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE_PATH),
-        logging.StreamHandler()
-    ]
-)
-
-BYBIT_API_KEY = _cfg.api_key
-BYBIT_API_SECRET = _cfg.api_secret
-TAKE_PROFIT_PERCENT = _cfg.take_profit_percent
-STOP_LOSS_PERCENT = _cfg.stop_loss_percent
-TRAILING_START_PERCENT = _cfg.trailing_start_percent
-TRAILING_DISTANCE_PERCENT = _cfg.trailing_distance_percent
-
-logging.info("Bot settings:")
-logging.info("  Take-profit: %s%% of current price", TAKE_PROFIT_PERCENT)
-logging.info("  Stop-loss: %s%% of current price", STOP_LOSS_PERCENT)
-logging.info("  Trailing start: %s%%", TRAILING_START_PERCENT)
-logging.info("  Trailing distance: %s%%", TRAILING_DISTANCE_PERCENT)
-
-# Проверка синхронизации времени
-try:
-    server_time_response = HTTP(testnet=False).get_server_time()
-    result = server_time_response.get("result", {})
-    # Обрабатываем разные форматы ответа
-    server_timestamp = result.get("timeSecond", 0)
-    if isinstance(server_timestamp, str):
-        server_timestamp = int(server_timestamp)
-    elif not isinstance(server_timestamp, int):
-        # Пробуем получить из другого поля
-        server_timestamp = result.get("time", 0)
-        if isinstance(server_timestamp, str):
-            server_timestamp = int(server_timestamp)
-
-    local_timestamp = int(time.time())
-    if isinstance(server_timestamp, int) and server_timestamp > 0:
-        time_diff = abs(server_timestamp - local_timestamp)
-        if time_diff > 60:
-            logging.warning(
-                "System time difference detected: %d seconds. "
-                "Please synchronize your system time. This may cause authentication errors.",
-                time_diff
-            )
-        else:
-            logging.info("System time synchronized (difference: %d seconds)", time_diff)
-    else:
-        logging.debug("Could not parse server time from response: %s", result)
-except Exception as e:
-    logging.warning("Could not check server time: %s", e)
-
-http = HTTP(
-    testnet=_cfg.testnet,
-    api_key=BYBIT_API_KEY,
-    api_secret=BYBIT_API_SECRET
-)
-
-positions_data: Dict[str, Dict[str, Any]] = {}
-prices_data: Dict[str, Dict[str, float]] = {}
-positions_lock = threading.Lock()
-prices_lock = threading.Lock()
-ws_public_ref = None
-
-
-def safe_float(value: Any, default: float = 0.0) -> float:
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return default
-
-
-def has_take_profit_order(symbol: str, position_idx: int, side: str) -> bool:
+from pybit.unified_trading import HTTP
+from account import Account, account_log_prefix, create_http
+from config import AccountConfig, BotConfig, from_env as load_config
+from feed import PublicFeed
+from ingest import RingFeed, run_ingest
+import logsetup
+import metrics
+from instruments import InstrumentCache
+from prices import PriceCache
+from profiler import SamplingProfiler
+from recorder import TickRecorder
+from ring import PriceRing
+from scheduler import PRIORITY_READ, RestScheduler
+from state_store import open_store
+
+# Расхождение часов, после которого подписанные запросы начинают отклоняться
+MAX_TIME_DIFF = 60
+# Перезапуск упавшего дочернего процесса: пауза удваивается от 1 до 30 с и
+# сбрасывается, если процесс проработал дольше RESTART_RESET_AFTER
+RESTART_BACKOFF_MIN = 1.0
+RESTART_BACKOFF_MAX = 30.0
+RESTART_RESET_AFTER = 60.0
+# Процесс приёма без heartbeat дольше этого считается зависшим и перезапускается
+INGEST_STALE_AFTER = 30.0
+# SIGUSR2 пересылается только процессам, проработавшим дольше этого: до установки
+# обработчика сигнал завершил бы процесс
+PROFILE_SIGNAL_GRACE = 10.0
+
+
+def load_settings() -> BotConfig:
+    load_dotenv()
     try:
-        orders = http.get_open_orders(
-            category="linear",
-            symbol=symbol,
-            positionIdx=position_idx
-        )
-        order_list = orders.get("result", {}).get("list", [])
-        opposite_side = "Sell" if side == "Buy" else "Buy"
-        for order in order_list:
-            order_side = order.get("side", "")
-            reduce_only = order.get("reduceOnly", False)
-            if order_side == opposite_side and reduce_only:
-                return True
-        return False
+        return load_config()
     except Exception as e:
-        logging.debug("%s: Error checking take-profit orders: %s", symbol, e)
-        return False
-
-
-subscribed_symbols = set()
-symbols_lock = threading.Lock()
-
-
-def subscribe_to_symbol_price(ws_public: Any, symbol: str) -> None:
-    with symbols_lock:
-        if symbol not in subscribed_symbols:
-            try:
-                ws_public.ticker_stream(
-                    callback=handle_price_update,
-                    symbol=symbol
-                )
-                subscribed_symbols.add(symbol)
-                logging.info("Subscribed to tickers for %s", symbol)
-            except Exception as e:
-                logging.error("Error subscribing to tickers for %s: %s", symbol, e)
-
-# Функция handle_position_update удалена - позиции теперь получаем через HTTP API
+        print(f"Configuration error: {e}")
+        raise SystemExit(1) from e
+
+
+def configure_logging(cfg: BotConfig, suffix: str = "") -> str:
+    return logsetup.setup_logging(
+        cfg.log_dir,
+        max_bytes=cfg.log_max_bytes,
+        backup_count=cfg.log_backup_count,
+        rotate_when=cfg.log_rotate_when,
+        audit=cfg.audit_log,
+        suffix=suffix,
+    )
 
 
-def handle_price_update(message: Dict[str, Any]) -> None:
+def log_settings(cfg: BotConfig) -> None:
+    accounts = cfg.accounts
+    logging.info("Bot settings:")
+    for account in accounts:
+        prefix = account_log_prefix(account.name, len(accounts) > 1)
+        logging.info("  %sTake-profit: %s%% of current price", prefix, account.take_profit_percent)
+        logging.info("  %sStop-loss: %s%% of current price", prefix, account.stop_loss_percent)
+        logging.info("  %sTrailing start: %s%%", prefix, account.trailing_start_percent)
+        logging.info("  %sTrailing distance: %s%%", prefix, account.trailing_distance_percent)
+    logging.info(
+        "  Trailing mode: %s (min stop update interval: %ss)", cfg.trailing_mode, cfg.stop_update_min_interval
+    )
+    logging.info("  Price source: %s", cfg.price_source)
+    logging.info("  Private stream: %s (reconcile every %ss)", cfg.private_stream, cfg.reconcile_interval)
+    logging.info("  Protection workers: %d, REST workers: %d", cfg.protection_workers, cfg.rest_workers)
+    logging.info("  Min stop move: %d ticks", cfg.stop_update_min_ticks)
+    if len(accounts) > 1:
+        logging.info("  Accounts: %s (%d processes)", ", ".join(a.name for a in accounts), cfg.account_processes)
+    if cfg.ingest_process:
+        logging.info("  Ingest process: enabled (ring of %d records)", cfg.ingest_ring_size)
+
+
+def check_server_time(testnet: bool, endpoint: str = "") -> None:
+    """Проверка синхронизации времени с сервером той же сети, что и торговля"""
     try:
-        topic = message.get("topic", "")
-        if "tickers" in topic:
-            data = message.get("data", {})
-            symbol = data.get("symbol", "")
-            if symbol:
-                with prices_lock:
-                    prices_data[symbol] = {
-                        "lastPrice": safe_float(data.get("lastPrice", 0), 0.0),
-                        "bidPrice": safe_float(data.get("bid1Price", 0), 0.0),
-                        "askPrice": safe_float(data.get("ask1Price", 0), 0.0)
-                    }
-                with positions_lock:
-                    if symbol in positions_data:
-                        pos_data = positions_data[symbol]
-                        side = pos_data["side"]
-                        if side == "Buy":
-                            positions_data[symbol]["current_price"] = prices_data[symbol]["askPrice"]
-                        else:
-                            positions_data[symbol]["current_price"] = prices_data[symbol]["bidPrice"]
+        http = HTTP(testnet=testnet)
+        if endpoint:
+            http.endpoint = endpoint
+        server_time_response = http.get_server_time()
+        result = server_time_response.get("result", {})
+        # Обрабатываем разные форматы ответа
+        server_timestamp = result.get("timeSecond", 0)
+        if isinstance(server_timestamp, str):
+            server_timestamp = int(server_timestamp)
+        elif not isinstance(server_timestamp, int):
+            # Пробуем получить из другого поля
+            server_timestamp = result.get("time", 0)
+            if isinstance(server_timestamp, str):
+                server_timestamp = int(server_timestamp)
+
+        local_timestamp = int(time.time())
+        if isinstance(server_timestamp, int) and server_timestamp > 0:
+            time_diff = abs(server_timestamp - local_timestamp)
+            if time_diff > MAX_TIME_DIFF:
+                logging.warning(
+                    "System time difference detected: %d seconds. "
+                    "Please synchronize your system time. This may cause authentication errors.",
+                    time_diff
+                )
+            else:
+                logging.info("System time synchronized (difference: %d seconds)", time_diff)
+        else:
+            logging.debug("Could not parse server time from response: %s", result)
     except Exception as e:
-        logging.error("Error handling price update: %s", e)
+        logging.warning("Could not check server time: %s", e)
 
 
-def get_active_positions() -> Dict[str, Dict[str, Any]]:
-    """Получает список активных позиций через HTTP API"""
-    try:
-        positions_response = http.get_positions(category="linear", settleCoin="USDT")
-
-        if positions_response.get("retCode") != 0:
-            logging.warning(
-                "Failed to get positions: %s (retCode: %s)",
-                positions_response.get("retMsg"),
-                positions_response.get("retCode")
-            )
-            return {}
-
-        current_positions = {}
-
-        for pos in positions_response.get("result", {}).get("list", []):
-            symbol = pos.get("symbol", "")
-            qty = safe_float(pos.get("size", 0), 0.0)
-
-            if qty > 0 and symbol:
-                position_idx = int(pos.get("positionIdx", 0))
-                side = pos.get("side", "")
-                entry_price = safe_float(pos.get("avgPrice", 0), 0.0)
-                stop_loss = safe_float(pos.get("stopLoss", 0), 0.0)
-                unrealized_pnl = safe_float(pos.get("unrealisedPnl", 0), 0.0)
-
-                position_margin = entry_price * qty
-                if position_margin > 0:
-                    unrealized_pnl_percent = (unrealized_pnl / position_margin) * 100
-                else:
-                    unrealized_pnl_percent = 0
-
-                # Получаем текущую цену из WebSocket или используем цену входа
-                current_price = entry_price
-                with prices_lock:
-                    if symbol in prices_data:
-                        if side == "Buy":
-                            current_price = prices_data[symbol].get("askPrice", entry_price)
-                        else:
-                            current_price = prices_data[symbol].get("bidPrice", entry_price)
-
-                has_tp = has_take_profit_order(symbol, position_idx, side)
-
-                current_positions[symbol] = {
-                    "qty": qty,
-                    "positionIdx": position_idx,
-                    "side": side,
-                    "entry_price": entry_price,
-                    "stop_loss": stop_loss,
-                    "unrealized_pnl": unrealized_pnl,
-                    "unrealized_pnl_percent": unrealized_pnl_percent,
-                    "current_price": current_price,
-                    "has_take_profit": has_tp
-                }
-
-                # Добавляем подписку на цену для этого символа
-                if ws_public_ref:
-                    subscribe_to_symbol_price(ws_public_ref, symbol)
-
-        return current_positions
-    except Exception as e:
-        logging.error("Error getting active positions: %s", e)
-        return {}
-
+def register_metrics(
+    accounts: List[Account], price_cache: PriceCache, public_rest: RestScheduler, feed: PublicFeed
+) -> None:
+    """Gauge-метрики читают состояние всех аккаунтов процесса в момент запроса"""
 
-def set_stop_loss(symbol: str, position_idx: int, side: str, current_price: float) -> bool:
-    try:
-        if side == "Buy":
-            stop_loss_price = round(current_price * (1 + STOP_LOSS_PERCENT / 100), 6)
-        else:
-            stop_loss_price = round(current_price * (1 - STOP_LOSS_PERCENT / 100), 6)
+    def lock_stats(field: str) -> List[Tuple[Tuple[str, ...], float]]:
+        samples = []
+        for account in accounts:
+            stats = account.positions_lock.stats()
+            samples.append(((account.name, stats.name), getattr(stats, field)))
+        return samples
 
-        response = http.set_trading_stop(
-            category="linear",
-            symbol=symbol,
-            positionIdx=position_idx,
-            stopLoss=stop_loss_price
+    metrics.gauge(
+        "bytrailor_lock_acquisitions", "Lock acquisitions", lambda: lock_stats("acquisitions"),
+        ("account", "lock"), kind="counter",
+    )
+    metrics.gauge(
+        "bytrailor_lock_contended", "Lock acquisitions that had to wait", lambda: lock_stats("contended"),
+        ("account", "lock"), kind="counter",
+    )
+    metrics.gauge(
+        "bytrailor_lock_wait_seconds", "Total time spent waiting for a lock", lambda: lock_stats("wait_total"),
+        ("account", "lock"), kind="counter",
+    )
+    metrics.gauge(
+        "bytrailor_lock_wait_max_seconds", "Longest single wait for a lock", lambda: lock_stats("wait_max"),
+        ("account", "lock"),
+    )
+    metrics.gauge(
+        "bytrailor_price_cache_retried_reads", "Price cache reads that hit a concurrent write",
+        lambda: [((), price_cache.read_retries)], kind="counter",
+    )
+    metrics.gauge(
+        "bytrailor_positions", "Open positions tracked",
+        lambda: [((a.name,), len(a.positions_data)) for a in accounts], ("account",),
+    )
+    metrics.gauge(
+        "bytrailor_rest_queue", "REST requests waiting in the scheduler",
+        lambda: [((a.name,), a.rest.pending()) for a in accounts] + [((public_rest.name,), public_rest.pending())],
+        ("account",),
+    )
+    metrics.gauge(
+        "bytrailor_ticker_topics", "Ticker topics subscribed on the public stream",
+        lambda: [((), feed.subscriptions.topics())],
+    )
+    metrics.gauge(
+        "bytrailor_ticker_connections", "Public WebSocket connections carrying ticker topics",
+        lambda: [((), feed.subscriptions.connections())],
+    )
+    if isinstance(feed, RingFeed):
+        ring_feed = feed
+        metrics.gauge(
+            "bytrailor_price_ring_overruns", "Price ring records dropped because the reader fell a lap behind",
+            lambda: [((), ring_feed.overruns)], kind="counter",
         )
-
-        if response.get("retCode") != 0:
-            logging.error(
-                "%s: Failed to set stop-loss: %s (ErrCode: %s)",
-                symbol,
-                response.get('retMsg'),
-                response.get('retCode'),
-            )
-            return False
-        else:
-            logging.info(
-                "%s: Stop-loss set to %.6f (%s%% of current price %.6f)",
-                symbol,
-                stop_loss_price,
-                STOP_LOSS_PERCENT,
-                current_price,
-            )
-            return True
-    except Exception as e:
-        logging.error("%s: Failed to set stop-loss: %s", symbol, e)
-        return False
-
-
-def set_take_profit_order(symbol: str, qty: float, position_idx: int, side: str, current_price: float) -> bool:
-    try:
-        if side == "Buy":
-            take_profit_price = round(current_price * (1 + TAKE_PROFIT_PERCENT / 100), 6)
-            order_side = "Sell"
-        else:
-            take_profit_price = round(current_price * (1 - TAKE_PROFIT_PERCENT / 100), 6)
-            order_side = "Buy"
-
-        response = http.place_order(
-            category="linear",
-            symbol=symbol,
-            side=order_side,
-            orderType="Limit",
-            qty=str(qty),
-            price=str(take_profit_price),
-            positionIdx=position_idx,
-            timeInForce="GTC",
-            reduceOnly=True
+        metrics.gauge(
+            "bytrailor_ingest_heartbeat_age_seconds", "Seconds since the ingest process last reported",
+            lambda: [((), ring_feed.ring.heartbeat_age())],
         )
 
-        if response.get("retCode") != 0:
-            logging.error(
-                "%s: Failed to place take-profit: %s (ErrCode: %s)",
-                symbol,
-                response.get('retMsg'),
-                response.get('retCode'),
-            )
-            return False
-        else:
-            logging.info(
-                "%s: Take-profit placed at %.6f (%s%% of current price %.6f)",
-                symbol,
-                take_profit_price,
-                TAKE_PROFIT_PERCENT,
-                current_price,
-            )
-            return True
-    except Exception as e:
-        logging.error("%s: Failed to place take-profit: %s", symbol, e)
-        return False
-
-
-def update_stop_loss(
-    symbol: str,
-    position_idx: int,
-    side: str,
-    entry_price: float,
-    current_stop_loss: float,
-    unrealized_pnl_percent: float,
-    current_price: float,
-) -> float:
-    try:
-        logging.debug("%s | Side: %s", symbol, side)
-        logging.debug("    Current price: %s", current_price)
-        logging.debug("    Entry price: %s", entry_price)
-        logging.debug("    Current stop-loss: %s", current_stop_loss)
-        logging.debug("    PnL: %.2f%%", unrealized_pnl_percent)
-
-        new_stop_loss = current_stop_loss
-        updated = False
-
-        if side == "Buy":
-            price_change_percent = ((current_price - entry_price) / entry_price) * 100
-        else:
-            price_change_percent = ((entry_price - current_price) / entry_price) * 100
-
-        logging.debug("    Price change from entry: %.2f%%", price_change_percent)
-
-        if price_change_percent >= TRAILING_START_PERCENT:
-            trailing_factor = 1 - (TRAILING_DISTANCE_PERCENT / 100) if side == "Buy" else 1 + (TRAILING_DISTANCE_PERCENT / 100)
-
-            if side == "Buy":
-                sl_candidate = round(current_price * trailing_factor, 6)
-                if sl_candidate > current_stop_loss:
-                    new_stop_loss = sl_candidate
-                    updated = True
-                    logging.info("%s: Trailing stop-loss to %.6f (Buy, %s%% below current price)", symbol, new_stop_loss, TRAILING_DISTANCE_PERCENT)
-            else:
-                sl_candidate = round(current_price * trailing_factor, 6)
-                if current_stop_loss == 0.0 or sl_candidate < current_stop_loss:
-                    new_stop_loss = sl_candidate
-                    updated = True
-                    logging.info("%s: Trailing stop-loss to %.6f (Sell, %s%% above current price)", symbol, new_stop_loss, TRAILING_DISTANCE_PERCENT)
-
-            if updated and new_stop_loss != current_stop_loss:
-                response = http.set_trading_stop(
-                    category="linear",
-                    symbol=symbol,
-                    positionIdx=position_idx,
-                    stopLoss=new_stop_loss
-                )
-                logging.debug("    Update SL request → %.6f", new_stop_loss)
 
-                if response.get("retCode") != 0:
-                    logging.error("%s: Failed to update stop-loss: %s (ErrCode: %s)", symbol, response.get('retMsg'), response.get('retCode'))
-                else:
-                    logging.info("%s: Stop-loss updated to %.6f", symbol, new_stop_loss)
-
-        return unrealized_pnl_percent
-
-    except Exception as e:
-        logging.error("%s: Failed to update stop-loss: %s", symbol, e)
-        return unrealized_pnl_percent
-
-
-def trailing_loop() -> None:
-    """Основной цикл трейлинга стоп-лоссов"""
-    previous_positions = {}
-    while True:
+def start_profiler(cfg: BotConfig, name: str = "") -> SamplingProfiler:
+    """Профилировщик процесса: SIGUSR2 и управляющий сокет PROFILE_SOCKET (у дочерних — с суффиксом)"""
+    profiler = SamplingProfiler(cfg.profile_dir, cfg.profile_rate, name)
+    profiler.install_signal()
+    if cfg.profile_socket:
+        root, ext = os.path.splitext(cfg.profile_socket)
+        path = f"{root}-{name}{ext}" if name else cfg.profile_socket
         try:
-            current_positions = get_active_positions()
-
-            # Выявляем новые позиции
-            new_positions = {s: d for s, d in current_positions.items() if s not in previous_positions}
-            if new_positions:
-                logging.info("New active symbols: %s", ", ".join(new_positions.keys()))
-                for symbol, data in new_positions.items():
-                    set_stop_loss(
-                        symbol,
-                        data["positionIdx"],
-                        data["side"],
-                        data["current_price"]
-                    )
-                    if not data["has_take_profit"]:
-                        set_take_profit_order(
-                            symbol,
-                            data["qty"],
-                            data["positionIdx"],
-                            data["side"],
-                            data["current_price"]
-                        )
-
-            # Обновляем стоп-лоссы для всех позиций
-            for symbol, data in current_positions.items():
-                update_stop_loss(
-                    symbol,
-                    data["positionIdx"],
-                    data["side"],
-                    data["entry_price"],
-                    data["stop_loss"],
-                    data["unrealized_pnl_percent"],
-                    data["current_price"]
-                )
-
-            # Выявляем закрытые позиции
-            removed_positions = {s: d for s, d in previous_positions.items() if s not in current_positions}
-            if removed_positions:
-                logging.info("Closed symbols: %s", ", ".join(removed_positions.keys()))
+            profiler.serve(path)
+        except OSError as e:
+            logging.error("Could not open profiler socket %s: %s", path, e)
+    return profiler
 
-            previous_positions = current_positions.copy()
-            time.sleep(2)
-        except Exception as e:
-            logging.error("Error in trailing loop: %s", e)
-            time.sleep(5)
 
-
-def initialize_positions() -> List[str]:
+def _preflight(name: str, func: Callable[..., Any], *args: Any) -> None:
+    started = time.perf_counter()
     try:
-        logging.info("Initializing existing positions...")
-        # Проверяем доступность API перед запросом позиций
-        try:
-            # Тестовый запрос для проверки авторизации
-            test_response = http.get_wallet_balance(accountType="UNIFIED")
-            if test_response.get("retCode") != 0:
-                if test_response.get("retCode") == 10003:
-                    logging.error("Invalid API key. Please check your API keys in .env file")
-                elif test_response.get("retCode") == 10004:
-                    logging.error("API key does not have required permissions")
-            else:
-                logging.error(
-                    "API error: %s (retCode: %s)",
-                    test_response.get("retMsg"),
-                    test_response.get("retCode")
-                )
-                return []
-        except Exception as test_e:
-            logging.warning("Could not verify API access: %s", test_e)
-
-        positions_response = http.get_positions(category="linear", settleCoin="USDT")
-
-        # Проверяем код ответа
-        if positions_response.get("retCode") != 0:
-            error_msg = positions_response.get("retMsg", "Unknown error")
-            error_code = positions_response.get("retCode")
-            if error_code == 10003:
-                logging.error("Invalid API key. Please check your BYBIT_API_KEY in .env file")
-            elif error_code == 10004:
-                logging.error("API key does not have 'Read' permission. Please enable it in Bybit settings")
-            elif error_code == 401:
-                logging.error("Authentication failed (401). Please verify:")
-                logging.error("  1. API keys are correct")
-                logging.error("  2. System time is synchronized")
-                logging.error("  3. API key has required permissions")
-            else:
-                logging.error("Failed to get positions: %s (retCode: %s)", error_msg, error_code)
-            return []
-
-        symbols_to_subscribe = []
-
-        for pos in positions_response.get("result", {}).get("list", []):
-            symbol = pos.get("symbol", "")
-            qty = safe_float(pos.get("size", 0), 0.0)
-
-            if qty > 0 and symbol:
-                position_idx = int(pos.get("positionIdx", 0))
-                side = pos.get("side", "")
-                entry_price = safe_float(pos.get("avgPrice", 0), 0.0)
-                stop_loss = safe_float(pos.get("stopLoss", 0), 0.0)
-                unrealized_pnl = safe_float(pos.get("unrealisedPnl", 0), 0.0)
-
-                position_margin = entry_price * qty
-                if position_margin > 0:
-                    unrealized_pnl_percent = (unrealized_pnl / position_margin) * 100
-                else:
-                    unrealized_pnl_percent = 0
-
-                has_tp = has_take_profit_order(symbol, position_idx, side)
-
-                with positions_lock:
-                    positions_data[symbol] = {
-                        "qty": qty,
-                        "positionIdx": position_idx,
-                        "side": side,
-                        "entry_price": entry_price,
-                        "stop_loss": stop_loss,
-                        "unrealized_pnl": unrealized_pnl,
-                        "unrealized_pnl_percent": unrealized_pnl_percent,
-                        "current_price": entry_price,
-                        "has_take_profit": has_tp
-                    }
-
-                symbols_to_subscribe.append(symbol)
-                logging.info("Found active position: %s (%s)", symbol, side)
-
-        return symbols_to_subscribe
+        func(*args)
+        logging.info("Startup: %s done in %.0f ms", name, (time.perf_counter() - started) * 1000)
     except Exception as e:
-        logging.error("Failed to initialize positions: %s", e)
-        return []
-
-
-def main() -> None:
+        logging.error("Startup: %s failed: %s", name, e)
+
+
+def run_accounts(
+    cfg: BotConfig,
+    account_configs: Sequence[AccountConfig],
+    metrics_port: int,
+    record_ticks: bool,
+    ring_name: str = "",
+    control: Any = None,
+    process_name: str = "",
+) -> None:
+    """Запускает аккаунты в текущем процессе над одним публичным потоком цен.
+
+    Предстартовые проверки (время сервера, ключи API, справочник инструментов,
+    подключение публичного потока) идут параллельно со снимком позиций, и
+    защита позиций начинается сразу по его получении. С ring_name цены
+    приходят из процесса приёма через кольцевой буфер (ingest.RingFeed).
+    """
     logging.info("Starting WebSocket monitoring of active symbols...")
+    started = time.perf_counter()
+    profiler = start_profiler(cfg, process_name)
+
+    # Цены пишет только колбэк публичного WebSocket, читатели не блокируются
+    price_cache = PriceCache()
+
+    # Справочник инструментов публичный: свой клиент без ключей и свой лимит запросов
+    public_rest = RestScheduler(create_http(cfg.testnet, endpoint=cfg.api_url), workers=1, name="public")
+    public_rest.start()
+    instruments = InstrumentCache(
+        cfg.instruments_cache_file,
+        cfg.instruments_cache_ttl,
+        fetch=lambda **params: public_rest.call("get_instruments_info", PRIORITY_READ, **params),
+    )
 
-    # Инициализируем существующие позиции при запуске
-    active_symbols = initialize_positions()
+    tick_recorder: Optional[TickRecorder] = None
+    # С процессом приёма тики пишет он
+    if record_ticks and cfg.tick_record_dir and not ring_name:
+        tick_recorder = TickRecorder(cfg.tick_record_dir)
+        tick_recorder.start()
+        logging.info("Recording ticker stream to %s", cfg.tick_record_dir)
 
-    # Инициализируем публичный WebSocket для получения цен
-    # Приватный WebSocket отключен из-за проблем с авторизацией
-    # Позиции будем получать через HTTP API в основном цикле
-    global ws_public_ref
-    ws_public_ref = WebSocket(
-        testnet=_cfg.testnet,
-        channel_type="linear"
-    )
+    # Снимок состояния для тёплого перезапуска (STATE_FILE пуст — отключён)
+    state = open_store(cfg.state_file)
 
-    # Подписываемся на цены для активных позиций
-    if active_symbols:
-        for symbol in active_symbols:
-            subscribe_to_symbol_price(ws_public_ref, symbol)
-        logging.info("Subscribed to price streams for %d active positions", len(active_symbols))
+    feed: PublicFeed
+    if ring_name:
+        feed = RingFeed(price_cache, ring_name, control)
     else:
-        # Если нет активных позиций, подписываемся на дефолтные символы
-        default_symbols = ["BTCUSDT", "ETHUSDT"]
-        for symbol in default_symbols:
-            subscribe_to_symbol_price(ws_public_ref, symbol)
-        logging.info("No active positions found. Subscribed to default symbols: %s", ", ".join(default_symbols))
+        feed = PublicFeed(
+            price_cache,
+            cfg.testnet,
+            tick_recorder,
+            topics_per_connection=cfg.ticker_topics_per_connection,
+            unsubscribe_delay=cfg.ticker_unsubscribe_delay,
+            ws_url=cfg.ws_url,
+            price_source=cfg.price_source,
+        )
+    multiple = len(cfg.accounts) > 1
+    accounts = [
+        Account(config, cfg, feed, price_cache, instruments, account_log_prefix(config.name, multiple), state)
+        for config in account_configs
+    ]
+    register_metrics(accounts, price_cache, public_rest, feed)
+    for account in accounts:
+        profiler.add_lock(account.positions_lock, account.name)
+
+    if metrics_port:
+        try:
+            metrics.start_http_server(metrics_port, cfg.metrics_addr)
+            logging.info("Serving Prometheus metrics on http://%s:%d/metrics", cfg.metrics_addr, metrics_port)
+        except OSError as e:
+            logging.error("Could not start metrics endpoint on %s:%d: %s", cfg.metrics_addr, metrics_port, e)
+
+    for account in accounts:
+        account.start()
+
+    # Инициализируем публичный WebSocket для получения цен.
+    # Позиции получаем через HTTP API в основном цикле, либо (PRIVATE_STREAM=true)
+    # из приватного WebSocket со сверкой через HTTP раз в RECONCILE_INTERVAL.
+    # Подписки, запрошенные до подключения, уходят пачками после него
+    bootstraps: Dict[Account, Future] = {}
+    with ThreadPoolExecutor(max_workers=3 + 2 * len(accounts), thread_name_prefix="startup") as pool:
+        # Позиции — первыми: их защита не ждёт необязательных проверок
+        for account in accounts:
+            bootstraps[account] = pool.submit(account.bootstrap)
+        pool.submit(_preflight, "server time", check_server_time, cfg.testnet, cfg.api_url)
+        pool.submit(_preflight, "instruments", instruments.load)
+        pool.submit(_preflight, "public stream", feed.start)
+        for account in accounts:
+            # При тёплом старте ключи проверены прошлым запуском, ошибку авторизации покажет get_positions
+            if not account.saved_positions:
+                pool.submit(_preflight, f"{account.name} API check", account.check_api_access)
+
+        subscribed = 0
+        for account, future in bootstraps.items():
+            try:
+                subscribed += len(future.result())
+            except Exception as e:
+                account.log.error("Startup failed: %s", e)
 
-    # Запускаем основной цикл трейлинга
-    trailing_thread = threading.Thread(target=trailing_loop, daemon=True)
-    trailing_thread.start()
+    if subscribed:
+        logging.info("Subscribed to price streams for %d active positions", subscribed)
+    else:
+        # Потоки тикеров открываются только под позиции: без них публичный поток простаивает
+        logging.info("No active positions found. Ticker streams will be subscribed when positions open")
+
+    if cfg.trailing_mode == "tick":
+        logging.info("Tick-driven trailing enabled (min stop update interval: %ss)", cfg.stop_update_min_interval)
+    elif cfg.trailing_mode == "adaptive":
+        logging.info(
+            "Adaptive trailing enabled (checks every %s-%ss, +%ss per 1%% to the next trigger)",
+            cfg.check_min_interval, cfg.check_max_interval, cfg.check_seconds_per_percent,
+        )
 
-    logging.info("Bot started. Using public WebSocket for prices and HTTP API for positions.")
+    if all(account.ws_private for account in accounts):
+        logging.info("Bot started. Using public WebSocket for prices and private WebSocket for positions.")
+    else:
+        logging.info("Bot started. Using public WebSocket for prices and HTTP API for positions.")
+    logging.info("Startup finished in %.0f ms", (time.perf_counter() - started) * 1000)
     logging.info("Press Ctrl+C to stop...")
 
     try:
@@ -537,11 +321,188 @@ def main() -> None:
     except KeyboardInterrupt:
         logging.info("Shutdown signal received. Exiting...")
     finally:
+        profiler.close()
+        for account in accounts:
+            account.exit()
         try:
-            if ws_public_ref:
-                ws_public_ref.exit()
+            feed.exit()
         except Exception:
             pass
+        if tick_recorder:
+            tick_recorder.stop()
+        for account in accounts:
+            account.log_contention_stats()
+        if isinstance(feed, RingFeed) and feed.overruns:
+            logging.warning("Price ring: %d records dropped by overruns", feed.overruns)
+        if state:
+            state.close()
+        logsetup.stop_logging()
+
+
+def _account_process(names: List[str], index: int, ring_name: str = "", control: Any = None) -> None:
+    """Точка входа дочернего процесса: свой публичный поток, свои аккаунты и порт метрик"""
+    cfg = load_settings()
+    # Свои файлы логов у каждого процесса: ротация общего файла из нескольких процессов небезопасна
+    configure_logging(cfg, f"-{index}")
+    account_configs = [a for a in cfg.accounts if a.name in names]
+    metrics_port = cfg.metrics_port + index if cfg.metrics_port else 0
+    run_accounts(
+        cfg,
+        account_configs,
+        metrics_port,
+        record_ticks=index == 0,
+        ring_name=ring_name,
+        control=control,
+        process_name=f"accounts-{index}",
+    )
+
+
+def _ingest_process(index: int, ring_name: str, control: Any) -> None:
+    """Точка входа процесса приёма цен для группы аккаунтов index"""
+    cfg = load_settings()
+    configure_logging(cfg, f"-ingest-{index}")
+    profiler = start_profiler(cfg, f"ingest-{index}")
+    run_ingest(cfg, ring_name, control, record_ticks=index == 0)
+    profiler.close()
+
+
+class _Child:
+    """Дочерний процесс под надзором: перезапуск с нарастающей паузой"""
+
+    def __init__(self, context: Any, name: str, target: Callable[..., None], args: Tuple[Any, ...]) -> None:
+        self.context = context
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process: Any = None
+        self.started = 0.0
+        self.backoff = RESTART_BACKOFF_MIN
+        self.restart_at = 0.0
+
+    def start(self) -> None:
+        self.process = self.context.Process(target=self.target, args=self.args, name=self.name)
+        self.process.start()
+        self.started = time.monotonic()
+        self.restart_at = 0.0
+
+    def stop(self, timeout: float = 10.0) -> None:
+        if self.process is None or not self.process.is_alive():
+            return
+        self.process.terminate()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+    def check(self, now: float) -> None:
+        """Упавший процесс перезапускается после паузы; пауза растёт, пока он падает быстро"""
+        if self.process.is_alive():
+            return
+        if not self.restart_at:
+            uptime = now - self.started
+            if uptime >= RESTART_RESET_AFTER:
+                self.backoff = RESTART_BACKOFF_MIN
+            logging.error(
+                "Process %s (pid %s) exited with code %s after %.0fs, restarting in %.0fs",
+                self.name, self.process.pid, self.process.exitcode, uptime, self.backoff,
+            )
+            self.restart_at = now + self.backoff
+            self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+        elif now >= self.restart_at:
+            self.start()
+            logging.info("Restarted process %s (pid %s)", self.name, self.process.pid)
+
+
+def supervise(cfg: BotConfig, groups: List[List[str]]) -> None:
+    """Дочерние процессы по группам аккаунтов и их перезапуск.
+
+    С INGEST_PROCESS=true у каждой группы два процесса: приём цен и аккаунты,
+    между ними кольцевой буфер в разделяемой памяти (его владелец —
+    супервизор, поэтому буфер переживает перезапуск любого из них) и очередь
+    команд подписки. Процесс приёма без heartbeat дольше INGEST_STALE_AFTER
+    перезапускается, как упавший.
+    """
+    context = multiprocessing.get_context("spawn")
+    children: List[_Child] = []
+    rings: List[PriceRing] = []
+    ingests: List[Tuple[_Child, PriceRing]] = []
+
+    def forward_profile_signal(signum: int, _frame: Any) -> None:
+        now = time.monotonic()
+        for child in children:
+            if child.process is not None and child.process.is_alive() and now - child.started > PROFILE_SIGNAL_GRACE:
+                os.kill(child.process.pid, signum)
+
+    # Замер профилировщика переключается в дочерних процессах: сам супервизор только ждёт
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, forward_profile_signal)
+    try:
+        for index, names in enumerate(groups):
+            ring_name = ""
+            control = None
+            if cfg.ingest_process:
+                ring = PriceRing(capacity=cfg.ingest_ring_size, create=True)
+                rings.append(ring)
+                ring_name = ring.name
+                control = context.Queue()
+                ingest = _Child(context, f"ingest-{index}", _ingest_process, (index, ring_name, control))
+                children.append(ingest)
+                ingests.append((ingest, ring))
+            children.append(
+                _Child(context, f"accounts-{index}", _account_process, (names, index, ring_name, control))
+            )
+        for child in children:
+            child.start()
+            logging.info("Started process %s (pid %s)", child.name, child.process.pid)
+        for index, names in enumerate(groups):
+            logging.info("Process group %d accounts: %s", index, ", ".join(names))
+
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for ingest, ring in ingests:
+                # Heartbeat проверяется после разгона: до первого подключения его ещё нет
+                if (
+                    ingest.process.is_alive()
+                    and now - ingest.started > INGEST_STALE_AFTER
+                    and ring.heartbeat_age(now) > INGEST_STALE_AFTER
+                ):
+                    logging.error("Process %s has not reported for %.0fs, killing it", ingest.name, INGEST_STALE_AFTER)
+                    ingest.stop()
+            for child in children:
+                child.check(now)
+    except KeyboardInterrupt:
+        logging.info("Shutdown signal received. Waiting for child processes...")
+        # SIGINT от терминала уже дошёл до детей; ждём их штатной остановки
+        deadline = time.monotonic() + 10
+        for child in children:
+            if child.process is not None:
+                child.process.join(max(0.0, deadline - time.monotonic()))
+    finally:
+        for child in children:
+            child.stop()
+        for ring in rings:
+            ring.close()
+            ring.unlink()
+        logsetup.stop_logging()
+
+
+def main() -> None:
+    cfg = load_settings()
+    configure_logging(cfg)
+    log_settings(cfg)
+
+    processes = min(cfg.account_processes, len(cfg.accounts))
+    if processes <= 1 and not cfg.ingest_process:
+        run_accounts(cfg, cfg.accounts, cfg.metrics_port, record_ticks=True)
+        return
+
+    # Аккаунты распределяются по процессам по кругу; каждый процесс держит
+    # свой публичный поток, чтобы тики не передавались между процессами
+    groups: List[List[str]] = [[] for _ in range(max(processes, 1))]
+    for i, account in enumerate(cfg.accounts):
+        groups[i % len(groups)].append(account.name)
+    supervise(cfg, groups)
 
 
 if __name__ == "__main__":
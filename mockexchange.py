@@ -0,0 +1,910 @@
+"""Локальная имитация биржи Bybit для нагрузочных прогонов бота без аккаунта.
+
+REST v5 (позиции, открытые ордера, set_trading_stop, ордера, баланс, время
+сервера, справочник инструментов) и WebSocket (тикеры linear и приватные
+топики position/order/execution) на localhost. Задержка ответов, ошибки
+лимита запросов (retCode 10006) и траектория цен задаются параметрами.
+Стоп или тейк-профит, который пересекла цена, закрывает позицию, как на
+бирже; через --reopen-after секунд позиция по символу открывается снова.
+
+    python mockexchange.py --positions 100 --tick-rate 1000 --latency-ms 20
+    BYBIT_API_URL=http://127.0.0.1:8080 BYBIT_WS_URL=ws://127.0.0.1:8081 python main.py
+
+Подписи запросов не проверяются: подойдут любые ключи. Позиции и ордера
+отдаются одной страницей.
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import random
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+RATE_LIMIT_RET_CODE = 10006
+INVALID_PARAMS_RET_CODE = 10001
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Сколько раз в секунду поток тикеров отправляет накопившиеся сообщения
+TICK_BATCHES_PER_SECOND = 200
+MAX_LATENCY_SAMPLES = 200_000
+
+REST_METHODS = {
+    ("GET", "/v5/market/time"): "get_server_time",
+    ("GET", "/v5/market/instruments-info"): "get_instruments_info",
+    ("GET", "/v5/position/list"): "get_positions",
+    ("POST", "/v5/position/trading-stop"): "set_trading_stop",
+    ("GET", "/v5/order/realtime"): "get_open_orders",
+    ("POST", "/v5/order/create"): "place_order",
+    ("POST", "/v5/order/amend"): "amend_order",
+    ("POST", "/v5/order/cancel"): "cancel_order",
+    ("POST", "/v5/order/create-batch"): "place_batch_order",
+    ("POST", "/v5/order/amend-batch"): "amend_batch_order",
+    ("GET", "/v5/account/wallet-balance"): "get_wallet_balance",
+}
+WRITE_METHODS = {
+    "set_trading_stop", "place_order", "amend_order", "cancel_order", "place_batch_order", "amend_batch_order"
+}
+# Ордеров в одном пакетном запросе linear
+BATCH_ORDER_LIMIT = 20
+
+
+@dataclass(frozen=True)
+class MockOptions:
+    host: str = "127.0.0.1"
+    # 0 — свободный порт (фактический — в rest_url/ws_url)
+    rest_port: int = 8080
+    ws_port: int = 8081
+    positions: int = 10
+    # Buy, Sell или mixed (через одну)
+    side: str = "Buy"
+    # Изменений цены в секунду на все символы; каждое уходит в orderbook.1
+    tick_rate: float = 100.0
+    # Тикер символа не чаще раза в столько мс, как у Bybit (100 мс у деривативов); 0 — на каждое изменение
+    ticker_interval_ms: float = 0.0
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    # Запросов в секунду на метод (0 — без лимита); сверх лимита — retCode 10006
+    rate_limit: float = 0.0
+    # Доля запросов записи, на которые случайно отвечается 10006
+    rate_limit_error_rate: float = 0.0
+    price: float = 100.0
+    tick_size: float = 0.01
+    qty: float = 1.0
+    # Случайное блуждание: разброс и средний сдвиг в сторону прибыли позиции за тик, б.п.
+    volatility_bps: float = 5.0
+    drift_bps: float = 0.5
+    # Записанные тики (CSV или .ticks, как у replay.py) вместо блуждания
+    ticks_paths: Tuple[str, ...] = ()
+    # Через сколько секунд открыть позицию по символу снова после закрытия (< 0 — не открывать)
+    reopen_after: float = 5.0
+    seed: int = 1
+
+
+@dataclass
+class MockStats:
+    started: float
+    calls: Counter
+    rate_limited: Counter
+    ticks_sent: int = 0
+    stops_triggered: int = 0
+    take_profits: int = 0
+    positions_opened: int = 0
+    # Секунды от тика, давшего новый экстремум цены, до прихода set_trading_stop, сдвинувшего стоп
+    stop_latencies: Optional[Deque[float]] = None
+
+    def __post_init__(self) -> None:
+        if self.stop_latencies is None:
+            self.stop_latencies = deque(maxlen=MAX_LATENCY_SAMPLES)
+
+
+def _decimals(step: float) -> int:
+    return max(0, -Decimal(str(step)).normalize().as_tuple().exponent)
+
+
+class PricePath:
+    """Следующая цена символа: случайное блуждание или повтор записанных тиков по кругу"""
+
+    def __init__(self, options: MockOptions) -> None:
+        self.options = options
+        self._rng = random.Random(options.seed)
+        self._ratios: List[float] = []
+        self._cursor: Dict[str, int] = {}
+        if options.ticks_paths:
+            import replay
+
+            for series in replay.load_series(options.ticks_paths).values():
+                self._ratios.extend(float(p) for p in series.last if p > 0)
+            if not self._ratios:
+                raise ValueError("No prices in " + ", ".join(options.ticks_paths))
+            first = self._ratios[0]
+            self._ratios = [p / first for p in self._ratios]
+
+    def next(self, symbol: str, index: int, side: str, price: float) -> float:
+        if self._ratios:
+            # Символы идут по одной записи со сдвигом, чтобы не двигаться синхронно
+            cursor = self._cursor.get(symbol, index * 997 % len(self._ratios))
+            self._cursor[symbol] = (cursor + 1) % len(self._ratios)
+            return self.options.price * self._ratios[cursor]
+        drift = self.options.drift_bps if side == "Buy" else -self.options.drift_bps
+        step = self._rng.gauss(drift, self.options.volatility_bps) / 10_000
+        return max(price * (1 + step), self.options.tick_size)
+
+
+class _Bucket:
+    """Лимит запросов метода: скользящая секунда, как X-Bapi-Limit-* у Bybit"""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self._times: Deque[float] = deque()
+
+    def take(self, now: float) -> Tuple[bool, int, float]:
+        while self._times and now - self._times[0] >= 1.0:
+            self._times.popleft()
+        limit = max(1, int(self.rate))
+        reset_at = (self._times[0] + 1.0) if self._times else now
+        if len(self._times) >= limit:
+            return False, 0, reset_at
+        self._times.append(now)
+        return True, limit - len(self._times), reset_at
+
+
+def _ws_frame(opcode: int, payload: bytes) -> bytes:
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class _WsClient:
+    _ids = itertools.count(1)
+
+    def __init__(self, sock: socket.socket, private: bool) -> None:
+        self.sock = sock
+        self.private = private
+        self.conn_id = f"mock-{next(self._ids)}"
+        self.topics: Set[str] = set()
+        self.alive = True
+        self._lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        self.send_raw(_ws_frame(0x1, json.dumps(message, separators=(",", ":")).encode()))
+
+    def send_raw(self, frame: bytes) -> None:
+        if not self.alive:
+            return
+        try:
+            with self._lock:
+                self.sock.sendall(frame)
+        except OSError:
+            self.alive = False
+
+
+class _WsHandler(socketserver.StreamRequestHandler):
+    """Минимальный сервер RFC 6455: рукопожатие, текстовые кадры, ping/pong, close"""
+
+    server: "_WsServer"
+
+    def _read_exact(self, size: int) -> bytes:
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise ConnectionError("connection closed")
+        return data
+
+    def _read_frame(self) -> Tuple[int, bytes]:
+        first, second = self._read_exact(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self._read_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._read_exact(8))[0]
+        mask = self._read_exact(4) if second & 0x80 else b""
+        payload = self._read_exact(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return first & 0x0F, payload
+
+    def handle(self) -> None:
+        request_line = self.rfile.readline().decode("latin-1")
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        parts = request_line.split()
+        key = headers.get("sec-websocket-key")
+        if len(parts) < 2 or not key:
+            self.wfile.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode(), usedforsecurity=False).digest()).decode()
+        self.wfile.write(
+            b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            + f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = _WsClient(self.request, private=urlsplit(parts[1]).path.endswith("/private"))
+        exchange = self.server.exchange
+        try:
+            while client.alive:
+                opcode, payload = self._read_frame()
+                if opcode == 0x8:
+                    client.send_raw(_ws_frame(0x8, payload[:2]))
+                    break
+                if opcode == 0x9:
+                    client.send_raw(_ws_frame(0xA, payload))
+                elif opcode == 0x1:
+                    exchange.handle_ws_message(client, json.loads(payload))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            client.alive = False
+            exchange.drop_client(client)
+
+
+class _WsServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], exchange: "MockExchange") -> None:
+        self.exchange = exchange
+        super().__init__(address, _WsHandler)
+
+
+class _RestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_RestServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _dispatch(self, verb: str) -> None:
+        url = urlsplit(self.path)
+        params: Dict[str, Any] = dict(parse_qsl(url.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length)
+            try:
+                params.update(json.loads(body))
+            except ValueError:
+                pass
+        method = REST_METHODS.get((verb, url.path))
+        if method is None:
+            status, response, headers = 404, {"retCode": 404, "retMsg": "Not Found", "result": {}}, {}
+        else:
+            status = 200
+            response, headers = self.server.exchange.handle_rest(method, params)
+        payload = json.dumps(response, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+
+class _RestServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], exchange: "MockExchange") -> None:
+        self.exchange = exchange
+        super().__init__(address, _RestHandler)
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Разрыв соединения клиентом (остановка бота) — не ошибка биржи
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+
+class MockExchange:
+    def __init__(self, options: MockOptions) -> None:
+        self.options = options
+        self.decimals = _decimals(options.tick_size)
+        self.path = PricePath(options)
+        self._rng = random.Random(options.seed + 1)
+        self._lock = threading.Lock()
+        self.symbols = [f"M{i:04d}USDT" for i in range(options.positions)]
+        self._sides = {
+            symbol: ("Sell" if options.side == "Sell" or (options.side == "mixed" and i % 2) else "Buy")
+            for i, symbol in enumerate(self.symbols)
+        }
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.prices: Dict[str, float] = dict.fromkeys(self.symbols, options.price)
+        self.positions: Dict[str, Dict[str, Any]] = {}
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        # Время (monotonic) тика, давшего последний экстремум цены в сторону прибыли позиции
+        self._extreme: Dict[str, Tuple[float, float]] = {}
+        # Последний разосланный верх стакана (bid, ask, u) и время последнего тикера по символу
+        self._books: Dict[str, Tuple[float, float, int]] = {}
+        self._ticker_sent_at: Dict[str, float] = {}
+        self._reopen_at: Dict[str, float] = {}
+        self._order_ids = itertools.count(1)
+        self._buckets: Dict[str, _Bucket] = {}
+        self._clients: Set[_WsClient] = set()
+        self.stats = MockStats(time.monotonic(), Counter(), Counter())
+        self._stopped = threading.Event()
+        self._rest: Optional[_RestServer] = None
+        self._ws: Optional[_WsServer] = None
+        for symbol in self.symbols:
+            self._open_position(symbol)
+
+    # --- жизненный цикл ---
+
+    def start(self) -> None:
+        self._rest = _RestServer((self.options.host, self.options.rest_port), self)
+        self._ws = _WsServer((self.options.host, self.options.ws_port), self)
+        threading.Thread(target=self._rest.serve_forever, name="mock-rest", daemon=True).start()
+        threading.Thread(target=self._ws.serve_forever, name="mock-ws", daemon=True).start()
+        threading.Thread(target=self._tick_loop, name="mock-ticks", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        for server in (self._rest, self._ws):
+            if server:
+                server.shutdown()
+                server.server_close()
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.alive = False
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @property
+    def rest_url(self) -> str:
+        assert self._rest is not None
+        return f"http://{self.options.host}:{self._rest.server_address[1]}"
+
+    @property
+    def ws_url(self) -> str:
+        assert self._ws is not None
+        return f"ws://{self.options.host}:{self._ws.server_address[1]}"
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = MockStats(time.monotonic(), Counter(), Counter())
+
+    def protected(self) -> Tuple[int, int]:
+        """Открытых позиций со стопом на бирже и всего открытых позиций"""
+        with self._lock:
+            return sum(1 for p in self.positions.values() if p["stopLoss"] > 0), len(self.positions)
+
+    # --- состояние ---
+
+    def _fmt(self, value: float) -> str:
+        return f"{value:.{self.decimals}f}" if value else "0"
+
+    def _position_view(self, position: Dict[str, Any]) -> Dict[str, Any]:
+        symbol = position["symbol"]
+        price = self.prices[symbol]
+        direction = 1 if position["side"] == "Buy" else -1
+        pnl = (price - position["avgPrice"]) * position["size"] * direction
+        return {
+            "category": "linear",
+            "symbol": symbol,
+            "side": position["side"] if position["size"] else "",
+            "size": str(position["size"]),
+            "positionIdx": 0,
+            "avgPrice": self._fmt(position["avgPrice"]),
+            "markPrice": self._fmt(price),
+            "stopLoss": self._fmt(position["stopLoss"]),
+            "takeProfit": "",
+            "trailingStop": self._fmt(position["trailingStop"]),
+            "unrealisedPnl": f"{pnl:.4f}",
+            "positionStatus": "Normal",
+            "updatedTime": str(int(time.time() * 1000)),
+        }
+
+    def _open_position(self, symbol: str) -> None:
+        price = round(self.prices[symbol], self.decimals)
+        self.positions[symbol] = {
+            "symbol": symbol,
+            "side": self._sides[symbol],
+            "size": self.options.qty,
+            "avgPrice": price,
+            "stopLoss": 0.0,
+            "trailingStop": 0.0,
+            "activePrice": 0.0,
+        }
+        self._extreme[symbol] = (price, time.monotonic())
+        self.stats.positions_opened += 1
+
+    def _close_position(self, symbol: str, price: float, reason: str) -> List[Tuple[str, Dict[str, Any]]]:
+        position = self.positions.pop(symbol)
+        closed = dict(position, size=0)
+        events = [("position", self._position_view(closed))]
+        close_side = "Sell" if position["side"] == "Buy" else "Buy"
+        events.append(("execution", {
+            "category": "linear",
+            "symbol": symbol,
+            "side": close_side,
+            "execQty": str(position["size"]),
+            "execPrice": self._fmt(price),
+            "execType": "Trade",
+            "stopOrderType": "StopLoss" if reason == "stop" else "",
+        }))
+        for order_id, order in list(self.orders.items()):
+            if order["symbol"] == symbol:
+                del self.orders[order_id]
+                status = "Filled" if reason == "take-profit" and order["side"] == close_side else "Cancelled"
+                events.append(("order", dict(order, orderStatus=status)))
+        if reason == "stop":
+            self.stats.stops_triggered += 1
+        else:
+            self.stats.take_profits += 1
+        if self.options.reopen_after >= 0:
+            self._reopen_at[symbol] = time.monotonic() + self.options.reopen_after
+        return events
+
+    def _on_price(self, symbol: str, price: float, now: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """Срабатывание стопа и тейк-профита по цене последней сделки"""
+        position = self.positions.get(symbol)
+        if position is None:
+            return []
+        buy = position["side"] == "Buy"
+        extreme, _ = self._extreme[symbol]
+        if (price > extreme) if buy else (price < extreme):
+            self._extreme[symbol] = (price, now)
+        distance = position["trailingStop"]
+        if distance > 0:
+            # Нативный трейлинг: после activePrice биржа сама подтягивает стоп
+            active = position["activePrice"]
+            if active > 0 and ((price >= active) if buy else (price <= active)):
+                position["activePrice"] = active = 0.0
+            if active == 0:
+                trailed = round(price - distance if buy else price + distance, self.decimals)
+                current = position["stopLoss"]
+                if current == 0 or ((trailed > current) if buy else (trailed < current)):
+                    position["stopLoss"] = trailed
+        stop = position["stopLoss"]
+        if stop > 0 and ((price <= stop) if buy else (price >= stop)):
+            return self._close_position(symbol, price, "stop")
+        for order in self.orders.values():
+            if order["symbol"] != symbol or not order["reduceOnly"]:
+                continue
+            limit = float(order["price"])
+            if (price >= limit) if buy else (price <= limit):
+                return self._close_position(symbol, limit, "take-profit")
+        return []
+
+    # --- WebSocket ---
+
+    def handle_ws_message(self, client: _WsClient, message: Dict[str, Any]) -> None:
+        op = message.get("op")
+        reply = {"success": True, "ret_msg": "", "conn_id": client.conn_id, "req_id": message.get("req_id", ""), "op": op}
+        if op == "ping":
+            reply["ret_msg"] = "pong"
+            client.send(reply)
+            return
+        if op == "auth":
+            client.send(reply)
+            return
+        if op not in ("subscribe", "unsubscribe"):
+            return
+        topics = [str(topic) for topic in message.get("args", [])]
+        with self._lock:
+            if op == "subscribe":
+                client.topics.update(topics)
+                self._clients.add(client)
+            else:
+                client.topics.difference_update(topics)
+            snapshots = []
+            for topic in topics if op == "subscribe" else ():
+                symbol = topic.rpartition(".")[2]
+                if symbol not in self.prices:
+                    continue
+                if topic.startswith("tickers."):
+                    snapshots.append(self._ticker_message(symbol, "snapshot"))
+                elif topic.startswith("orderbook.1."):
+                    snapshots.append(self._orderbook_snapshot(symbol))
+        client.send(reply)
+        for snapshot in snapshots:
+            client.send(snapshot)
+
+    def drop_client(self, client: _WsClient) -> None:
+        with self._lock:
+            self._clients.discard(client)
+
+    def _ticker_message(self, symbol: str, kind: str) -> Dict[str, Any]:
+        price = self.prices[symbol]
+        tick = self.options.tick_size
+        return {
+            "topic": f"tickers.{symbol}",
+            "type": kind,
+            "ts": int(time.time() * 1000),
+            "cs": self.stats.ticks_sent,
+            "data": {
+                "symbol": symbol,
+                "lastPrice": self._fmt(price),
+                "bid1Price": self._fmt(max(price - tick, tick)),
+                "ask1Price": self._fmt(price + tick),
+            },
+        }
+
+    def _quote(self, symbol: str) -> Tuple[float, float]:
+        price = self.prices[symbol]
+        tick = self.options.tick_size
+        return round(max(price - tick, tick), self.decimals), round(price + tick, self.decimals)
+
+    def _orderbook_message(self, symbol: str, kind: str, bids: List, asks: List, update_id: int) -> Dict[str, Any]:
+        now_ms = int(time.time() * 1000)
+        return {
+            "topic": f"orderbook.1.{symbol}",
+            "type": kind,
+            "ts": now_ms,
+            "data": {"s": symbol, "b": bids, "a": asks, "u": update_id, "seq": update_id},
+            "cts": now_ms,
+        }
+
+    def _orderbook_snapshot(self, symbol: str) -> Dict[str, Any]:
+        bid, ask, update_id = self._books.get(symbol) or (*self._quote(symbol), 1)
+        self._books[symbol] = (bid, ask, update_id)
+        size = str(self.options.qty * 10)
+        return self._orderbook_message(symbol, "snapshot", [[self._fmt(bid), size]], [[self._fmt(ask), size]], update_id)
+
+    def _orderbook_delta(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Delta от последнего разосланного верха стакана; None, если он не изменился"""
+        bid, ask = self._quote(symbol)
+        previous = self._books.get(symbol)
+        if previous is None:
+            self._books[symbol] = (bid, ask, 1)
+            return None
+        old_bid, old_ask, update_id = previous
+        if (bid, ask) == (old_bid, old_ask):
+            return None
+        size = str(self.options.qty * 10)
+        bids = [] if bid == old_bid else [[self._fmt(old_bid), "0"], [self._fmt(bid), size]]
+        asks = [] if ask == old_ask else [[self._fmt(old_ask), "0"], [self._fmt(ask), size]]
+        self._books[symbol] = (bid, ask, update_id + 1)
+        return self._orderbook_message(symbol, "delta", bids, asks, update_id + 1)
+
+    def _push_private(self, events: List[Tuple[str, Dict[str, Any]]]) -> None:
+        if not events:
+            return
+        by_topic: Dict[str, List[Dict[str, Any]]] = {}
+        for topic, data in events:
+            by_topic.setdefault(topic, []).append(data)
+        with self._lock:
+            clients = [c for c in self._clients if c.private]
+        now_ms = int(time.time() * 1000)
+        for topic, data in by_topic.items():
+            message = {"id": f"{topic}-{now_ms}", "topic": topic, "creationTime": now_ms, "data": data}
+            for client in clients:
+                if topic in client.topics:
+                    client.send(message)
+
+    def _tick_loop(self) -> None:
+        """Равномерно раздаёт tick_rate сообщений в секунду по символам по кругу"""
+        interval = 1.0 / TICK_BATCHES_PER_SECOND
+        ticker_interval = self.options.ticker_interval_ms / 1000
+        budget = 0.0
+        last = time.monotonic()
+        cursor = 0
+        while not self._stopped.is_set():
+            time.sleep(interval)
+            now = time.monotonic()
+            budget += (now - last) * self.options.tick_rate
+            last = now
+            # Если клиент не успевает читать, отправка блокируется; долг по тикам не копится дольше секунды
+            budget = min(budget, max(self.options.tick_rate, 1.0))
+            count = int(budget)
+            budget -= count
+            if not self.symbols:
+                continue
+            frames: List[Tuple[str, bytes]] = []
+            events: List[Tuple[str, Dict[str, Any]]] = []
+            with self._lock:
+                for symbol, reopen_at in list(self._reopen_at.items()):
+                    if now >= reopen_at:
+                        del self._reopen_at[symbol]
+                        self._open_position(symbol)
+                        events.append(("position", self._position_view(self.positions[symbol])))
+                for _ in range(count):
+                    symbol = self.symbols[cursor % len(self.symbols)]
+                    cursor += 1
+                    price = self.path.next(symbol, self._index[symbol], self._sides[symbol], self.prices[symbol])
+                    self.prices[symbol] = round(price, self.decimals) or self.options.tick_size
+                    self.stats.ticks_sent += 1
+                    events.extend(self._on_price(symbol, self.prices[symbol], now))
+                    book = self._orderbook_delta(symbol)
+                    if book is not None:
+                        message = json.dumps(book, separators=(",", ":"))
+                        frames.append((book["topic"], _ws_frame(0x1, message.encode())))
+                    if ticker_interval and now - self._ticker_sent_at.get(symbol, 0.0) < ticker_interval:
+                        continue
+                    self._ticker_sent_at[symbol] = now
+                    message = json.dumps(self._ticker_message(symbol, "delta"), separators=(",", ":"))
+                    frames.append((f"tickers.{symbol}", _ws_frame(0x1, message.encode())))
+                clients = [c for c in self._clients if not c.private and c.topics]
+            for topic, frame in frames:
+                for client in clients:
+                    if topic in client.topics:
+                        client.send_raw(frame)
+            self._push_private(events)
+
+    # --- REST ---
+
+    def handle_rest(self, method: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        options = self.options
+        if options.latency_ms or options.jitter_ms:
+            time.sleep(max(0.0, options.latency_ms + self._rng.uniform(-options.jitter_ms, options.jitter_ms)) / 1000)
+        now = time.monotonic()
+        headers: Dict[str, str] = {}
+        with self._lock:
+            self.stats.calls[method] += 1
+            limited = False
+            if options.rate_limit > 0:
+                bucket = self._buckets.setdefault(method, _Bucket(options.rate_limit))
+                allowed, remaining, reset_at = bucket.take(now)
+                headers = {
+                    "X-Bapi-Limit": str(max(1, int(options.rate_limit))),
+                    "X-Bapi-Limit-Status": str(remaining),
+                    "X-Bapi-Limit-Reset-Timestamp": str(int((time.time() + reset_at - now) * 1000)),
+                }
+                limited = not allowed
+            if method in WRITE_METHODS and self._rng.random() < options.rate_limit_error_rate:
+                limited = True
+            if limited:
+                self.stats.rate_limited[method] += 1
+                return self._response(RATE_LIMIT_RET_CODE, "Too many visits!"), headers
+            handler = getattr(self, f"_rest_{method}")
+            response, events = handler(params, now)
+        self._push_private(events)
+        return response, headers
+
+    @staticmethod
+    def _response(code: int = 0, message: str = "OK", result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {
+            "retCode": code,
+            "retMsg": message,
+            "result": result if result is not None else {},
+            "retExtInfo": {},
+            "time": int(time.time() * 1000),
+        }
+
+    def _rest_get_server_time(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        ns = time.time_ns()
+        return self._response(result={"timeSecond": str(ns // 10**9), "timeNano": str(ns)}), []
+
+    def _rest_get_wallet_balance(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        return self._response(result={"list": [{"accountType": "UNIFIED", "totalEquity": "100000", "coin": []}]}), []
+
+    def _page(self, items: List[Dict[str, Any]], params: Dict[str, Any], default_limit: int) -> Dict[str, Any]:
+        start = int(params.get("cursor") or 0)
+        limit = int(params.get("limit") or default_limit)
+        page = items[start:start + limit]
+        cursor = str(start + limit) if start + limit < len(items) else ""
+        return {"category": "linear", "list": page, "nextPageCursor": cursor}
+
+    def _rest_get_instruments_info(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        symbols = [params["symbol"]] if params.get("symbol") else self.symbols
+        items = [
+            {
+                "symbol": symbol,
+                "status": "Trading",
+                "priceFilter": {"tickSize": str(self.options.tick_size)},
+                "lotSizeFilter": {"qtyStep": "0.001", "minOrderQty": "0.001"},
+            }
+            for symbol in symbols
+            if symbol in self.prices
+        ]
+        return self._response(result=self._page(items, params, 500)), []
+
+    def _rest_get_positions(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        positions = [
+            self._position_view(p) for s, p in sorted(self.positions.items())
+            if not params.get("symbol") or s == params["symbol"]
+        ]
+        return self._response(result={"category": "linear", "list": positions, "nextPageCursor": ""}), []
+
+    def _rest_get_open_orders(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        orders = [o for o in self.orders.values() if not params.get("symbol") or o["symbol"] == params["symbol"]]
+        return self._response(result=self._page(orders, params, 20)), []
+
+    def _rest_set_trading_stop(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        symbol = params.get("symbol", "")
+        position = self.positions.get(symbol)
+        if position is None:
+            return self._response(INVALID_PARAMS_RET_CODE, "can not set tp/sl/ts for zero position"), []
+        price = self.prices[symbol]
+        buy = position["side"] == "Buy"
+        events = []
+        if "stopLoss" in params:
+            stop = float(params["stopLoss"] or 0)
+            if stop > 0 and ((stop >= price) if buy else (stop <= price)):
+                side = "lower" if buy else "higher"
+                return self._response(
+                    INVALID_PARAMS_RET_CODE,
+                    f"StopLoss:{int(stop * 10**self.decimals)} set for {position['side']} position "
+                    f"should {side} than base_price:{int(price * 10**self.decimals)}??LastPrice",
+                ), []
+            previous = position["stopLoss"]
+            if previous > 0 and stop > 0 and ((stop > previous) if buy else (stop < previous)):
+                self.stats.stop_latencies.append(now - self._extreme[symbol][1])
+            position["stopLoss"] = stop
+        if "trailingStop" in params:
+            position["trailingStop"] = float(params["trailingStop"] or 0)
+            position["activePrice"] = float(params.get("activePrice") or 0)
+        events.append(("position", self._position_view(position)))
+        return self._response(), events
+
+    def _order_view(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(order, category="linear", updatedTime=str(int(time.time() * 1000)))
+
+    def _rest_place_order(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        symbol = params.get("symbol", "")
+        if symbol not in self.prices:
+            return self._response(INVALID_PARAMS_RET_CODE, "symbol invalid"), []
+        order_id = f"mock-{next(self._order_ids)}"
+        order = {
+            "orderId": order_id,
+            "orderLinkId": params.get("orderLinkId", ""),
+            "symbol": symbol,
+            "side": params.get("side", ""),
+            "orderType": params.get("orderType", "Limit"),
+            "price": str(params.get("price", "0")),
+            "qty": str(params.get("qty", "0")),
+            "positionIdx": int(params.get("positionIdx", 0)),
+            "reduceOnly": bool(params.get("reduceOnly", False)),
+            "timeInForce": params.get("timeInForce", "GTC"),
+            "orderStatus": "New",
+            "stopOrderType": "",
+        }
+        self.orders[order_id] = order
+        result = {"orderId": order_id, "orderLinkId": order["orderLinkId"]}
+        return self._response(result=result), [("order", self._order_view(order))]
+
+    def _rest_amend_order(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        order = self.orders.get(params.get("orderId", ""))
+        if order is None:
+            return self._response(110001, "order not exists or too late to replace"), []
+        for field_name in ("price", "qty"):
+            if params.get(field_name):
+                order[field_name] = str(params[field_name])
+        result = {"orderId": order["orderId"], "orderLinkId": order["orderLinkId"]}
+        return self._response(result=result), [("order", self._order_view(order))]
+
+    def _rest_batch(self, method: str, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        """Пакет из до BATCH_ORDER_LIMIT ордеров: ответ каждого — в result.list и retExtInfo.list"""
+        requests = params.get("request") or []
+        if not requests or len(requests) > BATCH_ORDER_LIMIT:
+            return self._response(INVALID_PARAMS_RET_CODE, f"request must have 1..{BATCH_ORDER_LIMIT} orders"), []
+        handler = getattr(self, f"_rest_{method}")
+        items, infos, events = [], [], []
+        for request in requests:
+            response, order_events = handler(dict(request, category=params.get("category", "linear")), now)
+            result = response["result"]
+            items.append({
+                "category": "linear",
+                "symbol": request.get("symbol", ""),
+                "orderId": result.get("orderId", ""),
+                "orderLinkId": result.get("orderLinkId", ""),
+            })
+            infos.append({"code": response["retCode"], "msg": response["retMsg"]})
+            events.extend(order_events)
+        response = self._response(result={"list": items})
+        response["retExtInfo"] = {"list": infos}
+        return response, events
+
+    def _rest_place_batch_order(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        return self._rest_batch("place_order", params, now)
+
+    def _rest_amend_batch_order(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        return self._rest_batch("amend_order", params, now)
+
+    def _rest_cancel_order(self, params: Dict[str, Any], now: float) -> Tuple[Dict[str, Any], List]:
+        order = self.orders.pop(params.get("orderId", ""), None)
+        if order is None:
+            return self._response(110001, "order not exists or too late to cancel"), []
+        result = {"orderId": order["orderId"], "orderLinkId": order["orderLinkId"]}
+        return self._response(result=result), [("order", self._order_view(dict(order, orderStatus="Cancelled")))]
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Local Bybit stand-in for offline runs of the bot")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--rest-port", type=int, default=8080)
+    parser.add_argument("--ws-port", type=int, default=8081)
+    add_market_arguments(parser)
+    return parser
+
+
+def add_market_arguments(parser: argparse.ArgumentParser) -> None:
+    """Параметры рынка, общие с benchmark.py"""
+    parser.add_argument("--side", choices=("Buy", "Sell", "mixed"), default="Buy")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay before every REST response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random +/- spread of the REST delay")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests per second per method (0 = off)")
+    parser.add_argument(
+        "--rate-limit-error-rate", type=float, default=0.0, help="Share of write requests rejected with 10006"
+    )
+    parser.add_argument("--price", type=float, default=100.0, help="Starting price of every symbol")
+    parser.add_argument("--tick-size", type=float, default=0.01)
+    parser.add_argument("--volatility-bps", type=float, default=5.0, help="Random walk step deviation")
+    parser.add_argument("--drift-bps", type=float, default=0.5, help="Random walk drift towards the position's profit")
+    parser.add_argument("--ticks", nargs="*", default=[], help="Replay recorded prices (CSV or .ticks) instead")
+    parser.add_argument("--reopen-after", type=float, default=5.0, help="Seconds before a closed position reopens")
+    parser.add_argument(
+        "--ticker-interval-ms", type=float, default=0.0, help="Throttle tickers per symbol (orderbook.1 is not throttled)"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def market_options(args: argparse.Namespace, **overrides: Any) -> MockOptions:
+    values = dict(
+        side=args.side,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_limit=args.rate_limit,
+        rate_limit_error_rate=args.rate_limit_error_rate,
+        price=args.price,
+        tick_size=args.tick_size,
+        volatility_bps=args.volatility_bps,
+        drift_bps=args.drift_bps,
+        ticks_paths=tuple(args.ticks),
+        reopen_after=args.reopen_after,
+        ticker_interval_ms=args.ticker_interval_ms,
+        seed=args.seed,
+    )
+    values.update(overrides)
+    return MockOptions(**values)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = build_arg_parser()
+    parser.add_argument("--positions", type=int, default=10)
+    parser.add_argument("--tick-rate", type=float, default=100.0, help="Ticker messages per second")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    exchange = MockExchange(market_options(
+        args, host=args.host, rest_port=args.rest_port, ws_port=args.ws_port,
+        positions=args.positions, tick_rate=args.tick_rate,
+    ))
+    exchange.start()
+    logging.info("Mock exchange: BYBIT_API_URL=%s BYBIT_WS_URL=%s", exchange.rest_url, exchange.ws_url)
+    try:
+        while True:
+            time.sleep(10)
+            stats = exchange.stats
+            elapsed = time.monotonic() - stats.started
+            logging.info(
+                "%d ticks (%.0f/s), %d REST calls (%s), %d rate-limited, %d/%d positions protected, "
+                "%d stops and %d take-profits hit",
+                stats.ticks_sent, stats.ticks_sent / elapsed, sum(stats.calls.values()),
+                ", ".join(f"{m}={c}" for m, c in sorted(stats.calls.items())), sum(stats.rate_limited.values()),
+                *exchange.protected(), stats.stops_triggered, stats.take_profits,
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exchange.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Пакетная отправка ордеров через place_batch_order / amend_batch_order.
+
+Заявки, пришедшие почти одновременно (пачка новых позиций, серия
+исполнений), копятся BATCH_COALESCE секунд и уходят через RestScheduler
+запросами до BATCH_ORDER_LIMIT ордеров. Пакеты отправляются параллельно,
+каждый ордер получает свой ответ: retCode/retMsg из retExtInfo пакета и
+элемент result.list с orderId.
+"""
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+# Ордеров в одном пакетном запросе linear
+BATCH_ORDER_LIMIT = 20
+# Сколько ждать следующих заявок, чтобы отправить их одним пакетом
+BATCH_COALESCE = 0.05
+
+BATCH_METHODS = {"place": "place_batch_order", "amend": "amend_batch_order"}
+
+_Pending = List[Tuple[Dict[str, Any], Future]]
+
+
+class OrderBatcher:
+    def __init__(self, rest: Any, priority: int, name: str = "default") -> None:
+        self.rest = rest
+        self.priority = priority
+        self.name = name
+        self._cond = threading.Condition()
+        self._pending: Dict[str, _Pending] = {op: [] for op in BATCH_METHODS}
+        self._started = False
+
+    def start(self) -> None:
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name=f"order-batcher-{self.name}", daemon=True).start()
+
+    def place(self, order: Dict[str, Any]) -> Future:
+        """Новый ордер linear (поля как у place_order, без category)"""
+        return self._add("place", order)
+
+    def amend(self, order: Dict[str, Any]) -> Future:
+        """Изменение ордера linear (symbol, orderId и новые qty/price)"""
+        return self._add("amend", order)
+
+    def _add(self, op: str, order: Dict[str, Any]) -> Future:
+        future: Future = Future()
+        with self._cond:
+            self._pending[op].append((order, future))
+            self._cond.notify()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not any(self._pending.values()):
+                    self._cond.wait()
+                # Даём накопиться заявкам, пришедшим почти одновременно
+                self._cond.wait(BATCH_COALESCE)
+                pending, self._pending = self._pending, {op: [] for op in BATCH_METHODS}
+            for op, items in pending.items():
+                for i in range(0, len(items), BATCH_ORDER_LIMIT):
+                    self._send(BATCH_METHODS[op], items[i:i + BATCH_ORDER_LIMIT])
+
+    def _send(self, method: str, chunk: _Pending) -> None:
+        try:
+            future = self.rest.submit(
+                method, self.priority, category="linear", request=[order for order, _ in chunk]
+            )
+        except Exception as e:
+            for _, order_future in chunk:
+                order_future.set_exception(e)
+            return
+        future.add_done_callback(lambda done: self._resolve(method, chunk, done))
+
+    @staticmethod
+    def _resolve(method: str, chunk: _Pending, done: Future) -> None:
+        try:
+            response = done.result()
+        except Exception as e:
+            for _, order_future in chunk:
+                order_future.set_exception(e)
+            return
+        if response.get("retCode") != 0:
+            # Пакет отклонён целиком: у всех ордеров один ответ
+            for _, order_future in chunk:
+                order_future.set_result({"retCode": response.get("retCode"), "retMsg": response.get("retMsg")})
+            return
+        items = (response.get("result") or {}).get("list") or []
+        infos = (response.get("retExtInfo") or {}).get("list") or []
+        if len(items) != len(chunk) or len(infos) != len(chunk):
+            logging.warning("%s: %d results for %d orders", method, min(len(items), len(infos)), len(chunk))
+        for i, (_, order_future) in enumerate(chunk):
+            info = infos[i] if i < len(infos) else {"code": -1, "msg": "no result in batch response"}
+            order_future.set_result({
+                "retCode": info.get("code"),
+                "retMsg": info.get("msg"),
+                "result": items[i] if i < len(items) else {},
+            })
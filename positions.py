@@ -0,0 +1,340 @@
+"""Таблица позиций в колонках NumPy с векторной оценкой трейлинга.
+
+Ключ позиции — (symbol, positionIdx), поэтому в режиме хеджирования long и
+short по одному символу хранятся раздельно. Таблица не потокобезопасна:
+вызывающий код держит positions_lock. Текущие цены таблица берёт из
+PriceCache по слоту символа, поэтому тики не трогают ни таблицу, ни
+positions_lock; колонка current_price — запасная цена до первого тика.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import trailing
+from prices import PriceCache
+
+PositionKey = Tuple[str, int]
+PositionRecord = Dict[str, Any]
+
+# Допуски для векторного фильтра: строки у границы перепроверяются точным
+# скалярным правилом trailing.trailing_stop, поэтому фильтр только отсекает
+_PERCENT_TOLERANCE = 1e-9
+_PRICE_TOLERANCE = 1e-6
+
+_FLOAT_COLUMNS = (
+    "qty",
+    "entry_price",
+    "stop_loss",
+    "current_price",
+    "unrealized_pnl",
+    "unrealized_pnl_percent",
+    "tick_size",
+    "trailing_stop",
+)
+
+
+def format_key(key: PositionKey) -> str:
+    symbol, position_idx = key
+    return symbol if position_idx == 0 else f"{symbol}#{position_idx}"
+
+
+class PositionTable:
+    def __init__(self, prices: Optional[PriceCache] = None, capacity: int = 256) -> None:
+        self._prices = prices
+        self._capacity = 0
+        self._rows: Dict[PositionKey, int] = {}
+        self._symbol_rows: Dict[str, List[int]] = {}
+        self._keys: List[Optional[PositionKey]] = []
+        self._free: List[int] = []
+        self.active = np.zeros(0, dtype=bool)
+        self.sign = np.zeros(0, dtype=np.int8)
+        self.has_take_profit = np.zeros(0, dtype=bool)
+        self.price_slot = np.zeros(0, dtype=np.intp)
+        self.qty = np.zeros(0)
+        self.entry_price = np.zeros(0)
+        self.stop_loss = np.zeros(0)
+        self.current_price = np.zeros(0)
+        self.unrealized_pnl = np.zeros(0)
+        self.unrealized_pnl_percent = np.zeros(0)
+        self.tick_size = np.zeros(0)
+        # Дистанция нативного трейлинга Bybit (поле trailingStop); 0 — не выставлен
+        self.trailing_stop = np.zeros(0)
+        # Размер и цена входа, под которые выставлен тейк-профит; 0 — неизвестны.
+        # Снимки биржи их не перезаписывают
+        self.take_profit_qty = np.zeros(0)
+        self.take_profit_entry = np.zeros(0)
+        self._grow(capacity)
+
+    def _grow(self, capacity: int) -> None:
+        extra = capacity - self._capacity
+        if extra <= 0:
+            return
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        self.sign = np.concatenate([self.sign, np.zeros(extra, dtype=np.int8)])
+        self.has_take_profit = np.concatenate([self.has_take_profit, np.zeros(extra, dtype=bool)])
+        self.price_slot = np.concatenate([self.price_slot, np.zeros(extra, dtype=np.intp)])
+        for name in _FLOAT_COLUMNS + ("take_profit_qty", "take_profit_entry"):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(extra)]))
+        self._keys.extend([None] * extra)
+        self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._rows
+
+    def keys(self) -> List[PositionKey]:
+        return list(self._rows)
+
+    def symbols(self) -> List[str]:
+        return list(self._symbol_rows)
+
+    def has_symbol(self, symbol: str) -> bool:
+        """Можно вызывать без positions_lock: проверка вхождения в dict атомарна"""
+        return symbol in self._symbol_rows
+
+    def keys_for_symbol(self, symbol: str) -> List[PositionKey]:
+        return [self._keys[row] for row in self._symbol_rows.get(symbol, ())]
+
+    def get(self, key: PositionKey) -> Optional[PositionRecord]:
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        return self._record(row)
+
+    def items(self) -> Iterator[Tuple[PositionKey, PositionRecord]]:
+        for key, row in list(self._rows.items()):
+            yield key, self._record(row)
+
+    def snapshot(self) -> Dict[PositionKey, PositionRecord]:
+        return {key: self._record(row) for key, row in self._rows.items()}
+
+    def _live_price(self, row: int) -> float:
+        price = float(self.current_price[row])
+        if self._prices is None:
+            return price
+        quote = self._prices.read(self._keys[row][0])
+        if quote is None:
+            return price
+        live = quote[3] if self.sign[row] > 0 else quote[2]
+        return live if live > 0 else price
+
+    def _current_prices(self, rows: np.ndarray) -> np.ndarray:
+        """Buy оценивается по ask, Sell — по bid"""
+        price = self.current_price[rows]
+        if self._prices is None:
+            return price
+        bid, ask = self._prices.quotes(self.price_slot[rows])
+        live = np.where(self.sign[rows] > 0, ask, bid)
+        return np.where(live > 0, live, price)
+
+    def _record(self, row: int) -> PositionRecord:
+        symbol, position_idx = self._keys[row]
+        return {
+            "symbol": symbol,
+            "positionIdx": position_idx,
+            "side": "Buy" if self.sign[row] > 0 else "Sell",
+            "qty": float(self.qty[row]),
+            "entry_price": float(self.entry_price[row]),
+            "stop_loss": float(self.stop_loss[row]),
+            "current_price": self._live_price(row),
+            "unrealized_pnl": float(self.unrealized_pnl[row]),
+            "unrealized_pnl_percent": float(self.unrealized_pnl_percent[row]),
+            "has_take_profit": bool(self.has_take_profit[row]),
+            "tick_size": float(self.tick_size[row]),
+            "trailing_stop": float(self.trailing_stop[row]),
+        }
+
+    def upsert(self, key: PositionKey, record: PositionRecord, keep_price: bool = True) -> bool:
+        """Добавляет или обновляет позицию; возвращает True для новой.
+
+        При keep_price текущая цена существующей позиции той же стороны
+        сохраняется: её поддерживают тики, а не снимок HTTP.
+        """
+        row = self._rows.get(key)
+        is_new = row is None
+        sign = 1 if record["side"] == "Buy" else -1
+        if is_new:
+            if not self._free:
+                self._grow(max(16, self._capacity * 2))
+            row = self._free.pop()
+            self._rows[key] = row
+            self._keys[row] = key
+            self._symbol_rows.setdefault(key[0], []).append(row)
+            self.active[row] = True
+            if self._prices is not None:
+                self.price_slot[row] = self._prices.slot(key[0])
+        elif keep_price and self.sign[row] == sign and self.current_price[row] > 0:
+            record = dict(record, current_price=float(self.current_price[row]))
+        if is_new or self.sign[row] != sign:
+            self.take_profit_qty[row] = self.take_profit_entry[row] = 0.0
+
+        self.sign[row] = sign
+        self.has_take_profit[row] = bool(record.get("has_take_profit", False))
+        for name in _FLOAT_COLUMNS:
+            getattr(self, name)[row] = record.get(name, 0.0)
+        return is_new
+
+    def remove(self, key: PositionKey) -> bool:
+        row = self._rows.pop(key, None)
+        if row is None:
+            return False
+        symbol_rows = self._symbol_rows[key[0]]
+        symbol_rows.remove(row)
+        if not symbol_rows:
+            del self._symbol_rows[key[0]]
+        self._keys[row] = None
+        self.active[row] = False
+        self._free.append(row)
+        return True
+
+    def replace_all(self, records: Dict[PositionKey, PositionRecord]) -> None:
+        """Приводит таблицу к снимку биржи, сохраняя цены из тиков"""
+        for key in [k for k in self._rows if k not in records]:
+            self.remove(key)
+        for key, record in records.items():
+            self.upsert(key, record)
+
+    def set_stop_loss(self, key: PositionKey, stop_loss: float) -> None:
+        row = self._rows.get(key)
+        if row is not None:
+            self.stop_loss[row] = stop_loss
+
+    def set_trailing_stop(self, key: PositionKey, trailing_stop: float) -> None:
+        row = self._rows.get(key)
+        if row is not None:
+            self.trailing_stop[row] = trailing_stop
+
+    def without_trailing_stop(self) -> List[PositionKey]:
+        """Позиции, у которых на бирже нет нативного трейлинга"""
+        rows = np.flatnonzero(self.active & (self.trailing_stop <= 0))
+        return [self._keys[row] for row in rows.tolist()]
+
+    def set_take_profit_basis(self, key: PositionKey, qty: float, entry_price: float) -> None:
+        row = self._rows.get(key)
+        if row is not None:
+            self.take_profit_qty[row] = qty
+            self.take_profit_entry[row] = entry_price
+
+    def take_profit_changes(self) -> List[PositionKey]:
+        """Позиции с тейк-профитом, у которых размер или цена входа изменились с его выставления.
+
+        Тейк-профиту с неизвестным основанием (найден на бирже) основанием
+        становятся текущие размер и цена входа.
+        """
+        with_tp = self.active & self.has_take_profit
+        unknown = np.flatnonzero(with_tp & (self.take_profit_qty <= 0))
+        self.take_profit_qty[unknown] = self.qty[unknown]
+        self.take_profit_entry[unknown] = self.entry_price[unknown]
+        changed = with_tp & (
+            (np.abs(self.qty - self.take_profit_qty) > _PRICE_TOLERANCE)
+            | (np.abs(self.entry_price - self.take_profit_entry) > _PRICE_TOLERANCE)
+        )
+        return [self._keys[row] for row in np.flatnonzero(changed).tolist()]
+
+    def take_profit_basis(self, key: PositionKey) -> Tuple[float, float]:
+        row = self._rows[key]
+        return float(self.take_profit_qty[row]), float(self.take_profit_entry[row])
+
+    def set_has_take_profit(self, key: PositionKey, has_take_profit: bool) -> None:
+        row = self._rows.get(key)
+        if row is not None:
+            self.has_take_profit[row] = has_take_profit
+
+    def _select_rows(self, symbols: Optional[List[str]]) -> np.ndarray:
+        if symbols is None:
+            return np.flatnonzero(self.active)
+        return np.fromiter(
+            (row for symbol in symbols for row in self._symbol_rows.get(symbol, ())),
+            dtype=np.intp,
+        )
+
+    def evaluate_trailing(
+        self,
+        trailing_start_percent: float,
+        trailing_distance_percent: float,
+        symbols: Optional[List[str]] = None,
+        min_ticks: int = 0,
+    ) -> List[Tuple[PositionKey, str, float]]:
+        """Одним векторным шагом находит позиции, которым нужно двигать стоп.
+
+        Возвращает только строки, требующие запроса к API: (ключ, сторона, новый SL).
+        Стоп кладётся на сетку tick_size строки; сдвиг меньше min_ticks тиков не отправляется.
+        """
+        rows = self._select_rows(symbols)
+        if rows.size == 0:
+            return []
+
+        sign = self.sign[rows]
+        entry = self.entry_price[rows]
+        price = self._current_prices(rows)
+        stop = self.stop_loss[rows]
+        tick = self.tick_size[rows]
+
+        valid = (entry > 0) & (price > 0)
+        safe_entry = np.where(valid, entry, 1.0)
+        change = sign * (price - safe_entry) / safe_entry * 100
+        activated = valid & (change >= trailing_start_percent - _PERCENT_TOLERANCE)
+        candidate = price * (1 - sign * (trailing_distance_percent / 100))
+        # Округление до тика сдвигает кандидата не больше чем на полтика
+        slack = _PRICE_TOLERANCE + tick / 2
+        improvement = sign * (candidate - stop)
+        required = np.where(stop > 0, min_ticks * tick, 0.0) - slack
+        better = ((sign < 0) & (stop == 0)) | (improvement > required)
+
+        updates = []
+        for i in np.flatnonzero(activated & better).tolist():
+            row = int(rows[i])
+            side = "Buy" if sign[i] > 0 else "Sell"
+            new_stop_loss = trailing.trailing_stop(
+                side,
+                float(entry[i]),
+                float(stop[i]),
+                float(price[i]),
+                trailing_start_percent,
+                trailing_distance_percent,
+                float(tick[i]),
+                min_ticks,
+            )
+            if new_stop_loss is not None:
+                updates.append((self._keys[row], side, new_stop_loss))
+        return updates
+
+    def trigger_gaps(
+        self,
+        trailing_start_percent: float,
+        trailing_distance_percent: float,
+        symbols: Optional[List[str]] = None,
+        min_ticks: int = 0,
+    ) -> Tuple[List[PositionKey], np.ndarray]:
+        """Векторный trailing.trigger_gap: ключи строк и расстояния до ближайшего события стопа"""
+        rows = self._select_rows(symbols)
+        keys = [self._keys[row] for row in rows.tolist()]
+        if rows.size == 0:
+            return keys, np.zeros(0)
+
+        sign = self.sign[rows]
+        entry = self.entry_price[rows]
+        price = self._current_prices(rows)
+        stop = self.stop_loss[rows]
+        tick = self.tick_size[rows]
+
+        valid = (entry > 0) & (price > 0)
+        safe_entry = np.where(valid, entry, 1.0)
+        safe_price = np.where(valid, price, 1.0)
+        change = sign * (safe_price - safe_entry) / safe_entry * 100
+        activated = change >= trailing_start_percent - _PERCENT_TOLERANCE
+        # Кандидат в стоп движется вместе с ценой с коэффициентом (1 - sign * distance)
+        factor = 1 - sign * (trailing_distance_percent / 100)
+        candidate = safe_price * factor
+        required = np.where(stop > 0, min_ticks * tick, 0.0)
+        shortfall = required - sign * (candidate - stop)
+        step_gap = np.where(
+            (sign < 0) & (stop == 0), 0.0, np.maximum(shortfall, 0.0) / (safe_price * factor) * 100
+        )
+        gaps = np.where(activated, step_gap, trailing_start_percent - change)
+        stop_gap = np.where(stop > 0, sign * (safe_price - stop) / safe_price * 100, np.inf)
+        gaps = np.maximum(np.minimum(gaps, stop_gap), 0.0)
+        return keys, np.where(valid, gaps, np.nan)
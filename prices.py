@@ -0,0 +1,173 @@
+"""Кэш цен тикеров: один писатель, читатели без блокировок.
+
+Каждому символу при первой встрече выделяется постоянный слот в заранее
+выделенных массивах (ts, last, bid, ask). Писатель — колбэк WebSocket —
+обновляет слот по схеме seqlock: счётчик версии становится нечётным на время
+записи и чётным после неё. Читатель повторяет чтение, если версия изменилась
+или была нечётной, и никогда не ждёт писателя. На тик не создаются словари и
+кортежи: только запись чисел в array.array.
+
+Запись идёт под _write_lock: слот может выделить и другой поток (таблица
+позиций, подписки на кольцо цен), и при нехватке места массивы копируются в
+новые под той же блокировкой, поэтому тик не пишется в уже скопированные
+массивы. Без конкуренции блокировка почти ничего не стоит.
+"""
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Сколько раз читатель перечитывает слот, который пишется прямо сейчас
+_MAX_READ_ATTEMPTS = 8
+
+Quote = Tuple[float, float, float, float]
+
+
+class _Columns:
+    """Массивы слотов; numpy-представления разделяют с ними память"""
+
+    __slots__ = (
+        "capacity", "seq", "ts", "last", "bid", "ask", "received",
+        "seq_view", "ts_view", "last_view", "bid_view", "ask_view", "received_view",
+    )
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.seq = array("Q", bytes(8 * capacity))
+        self.ts = array("d", bytes(8 * capacity))
+        self.last = array("d", bytes(8 * capacity))
+        self.bid = array("d", bytes(8 * capacity))
+        self.ask = array("d", bytes(8 * capacity))
+        # Локальное время получения тика (time.monotonic) для метрики задержки до стопа
+        self.received = array("d", bytes(8 * capacity))
+        self.seq_view = np.frombuffer(self.seq, dtype=np.uint64)
+        self.ts_view = np.frombuffer(self.ts, dtype=np.float64)
+        self.last_view = np.frombuffer(self.last, dtype=np.float64)
+        self.bid_view = np.frombuffer(self.bid, dtype=np.float64)
+        self.ask_view = np.frombuffer(self.ask, dtype=np.float64)
+        self.received_view = np.frombuffer(self.received, dtype=np.float64)
+
+
+class PriceCache:
+    def __init__(self, capacity: int = 1024) -> None:
+        self._slots: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._register_lock = threading.Lock()
+        # Запись тиков и замена массивов в _grow
+        self._write_lock = threading.Lock()
+        self._columns = _Columns(capacity)
+        # Сколько раз читатели попали на запись; растёт без синхронизации, только для статистики
+        self.read_retries = 0
+        self.updates = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def slot_of(self, symbol: str) -> Optional[int]:
+        return self._slots.get(symbol)
+
+    def symbol_at(self, slot: int) -> str:
+        return self._symbols[slot]
+
+    def slot(self, symbol: str) -> int:
+        """Слот символа; новый выделяется под блокировкой (это бывает редко)"""
+        slot = self._slots.get(symbol)
+        if slot is not None:
+            return slot
+        with self._register_lock:
+            slot = self._slots.get(symbol)
+            if slot is None:
+                slot = len(self._slots)
+                if slot >= self._columns.capacity:
+                    self._grow(self._columns.capacity * 2)
+                self._symbols.append(symbol)
+                self._slots[symbol] = slot
+            return slot
+
+    def _grow(self, capacity: int) -> None:
+        # Под _write_lock писатель не трогает старые массивы, пока они копируются;
+        # читатели со ссылкой на старые массивы дочитывают согласованные данные
+        new = _Columns(capacity)
+        with self._write_lock:
+            old = self._columns
+            n = old.capacity
+            for name in ("seq", "ts", "last", "bid", "ask", "received"):
+                getattr(new, name)[:n] = getattr(old, name)
+            self._columns = new
+
+    def update(self, symbol: str, ts: float, last: float, bid: float, ask: float) -> None:
+        """Запись тика из колбэка публичного WebSocket"""
+        slot = self._slots.get(symbol)
+        if slot is None:
+            slot = self.slot(symbol)
+        with self._write_lock:
+            columns = self._columns
+            seq = columns.seq
+            seq[slot] += 1
+            columns.ts[slot] = ts
+            columns.last[slot] = last
+            columns.bid[slot] = bid
+            columns.ask[slot] = ask
+            columns.received[slot] = time.monotonic()
+            seq[slot] += 1
+            self.updates += 1
+
+    def update_many(
+        self,
+        slots: np.ndarray,
+        ts: np.ndarray,
+        last: np.ndarray,
+        bid: np.ndarray,
+        ask: np.ndarray,
+        received: np.ndarray,
+    ) -> None:
+        """Векторная запись пачки тиков (слоты без повторов) под той же блокировкой, что и update"""
+        with self._write_lock:
+            columns = self._columns
+            columns.seq_view[slots] += np.uint64(1)
+            columns.ts_view[slots] = ts
+            columns.last_view[slots] = last
+            columns.bid_view[slots] = bid
+            columns.ask_view[slots] = ask
+            columns.received_view[slots] = received
+            columns.seq_view[slots] += np.uint64(1)
+            self.updates += len(slots)
+
+    def read(self, symbol: str) -> Optional[Quote]:
+        """(ts, last, bid, ask) или None, если тиков по символу ещё не было"""
+        slot = self._slots.get(symbol)
+        if slot is None:
+            return None
+        columns = self._columns
+        seq = columns.seq
+        for _ in range(_MAX_READ_ATTEMPTS):
+            before = seq[slot]
+            quote = (columns.ts[slot], columns.last[slot], columns.bid[slot], columns.ask[slot])
+            if before == seq[slot] and not before & 1:
+                break
+            self.read_retries += 1
+        if quote[0] == 0.0:
+            return None
+        return quote
+
+    def received_at(self, symbol: str) -> float:
+        """Когда получен последний тик символа (time.monotonic), 0 — тиков не было"""
+        slot = self._slots.get(symbol)
+        if slot is None:
+            return 0.0
+        return self._columns.received[slot]
+
+    def quotes(self, slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Векторное чтение bid/ask по массиву слотов; нули — тиков ещё не было"""
+        columns = self._columns
+        for _ in range(_MAX_READ_ATTEMPTS):
+            before = columns.seq_view[slots]
+            bid = columns.bid_view[slots]
+            ask = columns.ask_view[slots]
+            after = columns.seq_view[slots]
+            if not ((before != after) | (before & 1).astype(bool)).any():
+                break
+            self.read_retries += 1
+        return bid, ask
@@ -0,0 +1,324 @@
+"""Сэмплирующий профилировщик, который включается на работающем боте.
+
+Сигнал SIGUSR2 или команда в локальный Unix-сокет (PROFILE_SOCKET) запускает
+и останавливает замер. Поток-сэмплер PROFILE_RATE раз в секунду снимает
+стеки всех потоков процесса через sys._current_frames() — колбэков
+WebSocket, trailing_loop, отправителей REST — и копит счётчики одинаковых
+стеков, поэтому память не растёт со временем замера. Сэмплы — по
+настенному времени: ожидание в Condition.wait или сокете видно как есть.
+
+При остановке в PROFILE_DIR пишутся три файла с общим префиксом:
+- .collapsed — строки "поток;кадр;...;кадр число" для flamegraph.pl и speedscope;
+- .speedscope.json — профиль по потокам для https://www.speedscope.app;
+- .locks.json — захваты, ожидание и время удержания каждой TimedLock за замер.
+
+Клиент сокета:
+
+    python profiler.py start [--rate 200]
+    python profiler.py stop
+    python profiler.py status
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from locks import LockStats, TimedLock
+
+DEFAULT_RATE = 100.0
+MAX_RATE = 1000.0
+# Имена потоков перечитываются не на каждом сэмпле: threading.enumerate() берёт блокировку модуля
+THREAD_NAMES_REFRESH = 1.0
+SOCKET_TIMEOUT = 5.0
+
+_Frame = Tuple[str, str, int]
+_Stack = Tuple[str, Tuple[_Frame, ...]]
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir: str, rate: float = DEFAULT_RATE, name: str = "") -> None:
+        self.output_dir = output_dir
+        self.rate = rate
+        self.name = name
+        # (владелец, блокировка): у каждого аккаунта свой positions_lock
+        self._locks: List[Tuple[str, TimedLock]] = []
+        self._control = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counts: Counter = Counter()
+        self._lock_start: List[LockStats] = []
+        self._started_at = 0.0
+        self._samples = 0
+        self._cpu = 0.0
+        self._active_rate = rate
+        self._socket_path = ""
+
+    def add_lock(self, lock: TimedLock, owner: str = "") -> None:
+        self._locks.append((owner, lock))
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, rate: Optional[float] = None) -> str:
+        with self._control:
+            if self._thread is not None:
+                return "already running"
+            rate = min(MAX_RATE, rate or self.rate)
+            if rate <= 0:
+                return "rate must be > 0"
+            self._active_rate = rate
+            self._counts = Counter()
+            self._samples = 0
+            self._cpu = 0.0
+            TimedLock.track_hold = True
+            for _, lock in self._locks:
+                lock.reset_hold()
+            self._lock_start = [lock.stats() for _, lock in self._locks]
+            self._stop.clear()
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, args=(1 / rate,), name="profiler", daemon=True)
+            self._thread.start()
+        logging.info("Profiler started at %g Hz", rate)
+        return f"started at {rate:g} Hz"
+
+    def stop(self) -> str:
+        with self._control:
+            thread = self._thread
+            if thread is None:
+                return "not running"
+            self._stop.set()
+            thread.join()
+            self._thread = None
+            TimedLock.track_hold = False
+            duration = time.monotonic() - self._started_at
+            locks = [
+                self._lock_delta(owner, start, lock.stats())
+                for (owner, lock), start in zip(self._locks, self._lock_start)
+            ]
+            try:
+                prefix = self._write(duration, locks)
+            except OSError as e:
+                logging.error("Could not write profile to %s: %s", self.output_dir, e)
+                return f"error: {e}"
+        logging.info(
+            "Profiler stopped: %d samples in %.1fs (sampler CPU %.2f%%), written to %s.*",
+            self._samples, duration, self._cpu / duration * 100 if duration > 0 else 0.0, prefix,
+        )
+        return f"written {prefix}.collapsed, {prefix}.speedscope.json, {prefix}.locks.json"
+
+    def close(self) -> None:
+        """Остановка процесса: незаконченный замер записывается, сокет удаляется"""
+        if self.running:
+            self.stop()
+        if self._socket_path:
+            try:
+                os.unlink(self._socket_path)
+            except OSError:
+                pass
+
+    def toggle(self) -> str:
+        return self.stop() if self.running else self.start()
+
+    def status(self) -> str:
+        if self._thread is None:
+            return "idle"
+        elapsed = time.monotonic() - self._started_at
+        return f"running for {elapsed:.1f}s at {self._active_rate:g} Hz, {self._samples} samples"
+
+    def _run(self, interval: float) -> None:
+        own = threading.get_ident()
+        labels: Dict[Any, _Frame] = {}
+        names: Dict[int, str] = {}
+        names_at = 0.0
+        # Верхний кадр потока с прошлого сэмпла: тот же объект кадра — тот же стек (поток
+        # ждёт или не вышел из функции), и обход цепочки f_back не нужен
+        previous: Dict[int, Tuple[Any, _Stack]] = {}
+        counts = self._counts
+        cpu_started = time.thread_time()
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now - names_at >= THREAD_NAMES_REFRESH:
+                names = {thread.ident: thread.name for thread in threading.enumerate() if thread.ident}
+                names_at = now
+            current = {}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                cached = previous.get(ident)
+                if cached is not None and cached[0] is frame:
+                    counts[cached[1]] += 1
+                    current[ident] = cached
+                    continue
+                top = frame
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = (code.co_name, code.co_filename, code.co_firstlineno)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.reverse()
+                key = (names.get(ident, f"thread-{ident}"), tuple(stack))
+                counts[key] += 1
+                current[ident] = (top, key)
+            previous = current
+            self._samples += 1
+            self._cpu = time.thread_time() - cpu_started
+            # Шаг по расписанию, а не sleep(interval): время самого сэмпла не сдвигает частоту
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay < 0:
+                next_at = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    @staticmethod
+    def _lock_delta(owner: str, start: LockStats, stats: LockStats) -> Dict[str, Any]:
+        acquisitions = stats.acquisitions - start.acquisitions
+        return {
+            "owner": owner,
+            "name": stats.name,
+            "acquisitions": acquisitions,
+            "contended": stats.contended - start.contended,
+            "wait_total_ms": (stats.wait_total - start.wait_total) * 1000,
+            "hold_total_ms": stats.hold_total * 1000,
+            "hold_max_ms": stats.hold_max * 1000,
+            "hold_mean_ms": stats.hold_total / acquisitions * 1000 if acquisitions else 0.0,
+        }
+
+    def _write(self, duration: float, locks: List[Dict[str, Any]]) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        suffix = f"-{self.name}" if self.name else ""
+        prefix = os.path.join(self.output_dir, f"profile-{stamp}{suffix}")
+        counts = self._counts
+
+        with open(f"{prefix}.collapsed", "w", encoding="utf-8") as f:
+            for (thread, stack), count in counts.most_common():
+                frames = ";".join(_frame_name(frame) for frame in stack)
+                f.write(f"{thread};{frames} {count}\n")
+
+        interval = 1 / self._active_rate
+        frame_index: Dict[_Frame, int] = {}
+        frames: List[Dict[str, Any]] = []
+        profiles: Dict[str, Dict[str, Any]] = {}
+        for (thread, stack), count in counts.items():
+            indices = []
+            for frame in stack:
+                index = frame_index.get(frame)
+                if index is None:
+                    index = frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(index)
+            profile = profiles.get(thread)
+            if profile is None:
+                profile = profiles[thread] = {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": duration,
+                    "samples": [],
+                    "weights": [],
+                }
+            profile["samples"].append(indices)
+            profile["weights"].append(count * interval)
+        with open(f"{prefix}.speedscope.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "$schema": "https://www.speedscope.app/file-format-schema.json",
+                "name": os.path.basename(prefix),
+                "exporter": "bytrailor profiler",
+                "shared": {"frames": frames},
+                "profiles": sorted(profiles.values(), key=lambda p: -sum(p["weights"])),
+            }, f)
+
+        with open(f"{prefix}.locks.json", "w", encoding="utf-8") as f:
+            json.dump({"duration": duration, "samples": self._samples, "rate": self._active_rate, "locks": locks}, f,
+                      indent=2)
+        return prefix
+
+    def install_signal(self, signum: int = getattr(signal, "SIGUSR2", 0)) -> None:
+        """SIGUSR2 переключает замер; запись файлов — в отдельном потоке, не в обработчике"""
+        if not signum:
+            return
+
+        def handler(_signum: int, _frame: Any) -> None:
+            threading.Thread(target=self.toggle, name="profiler-toggle", daemon=True).start()
+
+        signal.signal(signum, handler)
+
+    def serve(self, path: str) -> None:
+        """Команды start [rate], stop, status через Unix-сокет path (доступ только владельцу)"""
+        if os.path.exists(path):
+            os.unlink(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        os.chmod(path, 0o600)
+        server.listen(4)
+        self._socket_path = path
+        threading.Thread(target=self._serve, args=(server,), name="profiler-control", daemon=True).start()
+        logging.info("Profiler control socket: %s", path)
+
+    def _serve(self, server: socket.socket) -> None:
+        commands: Dict[str, Callable[[List[str]], str]] = {
+            "start": lambda args: self.start(float(args[0]) if args else None),
+            "stop": lambda args: self.stop(),
+            "status": lambda args: self.status(),
+        }
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    conn.settimeout(SOCKET_TIMEOUT)
+                    words = conn.recv(256).decode(errors="replace").split()
+                    command = commands.get(words[0]) if words else None
+                    reply = command(words[1:]) if command else "unknown command (start [rate] | stop | status)"
+                except Exception as e:
+                    reply = f"error: {e}"
+                try:
+                    conn.sendall((reply + "\n").encode())
+                except OSError:
+                    pass
+
+
+def _frame_name(frame: _Frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def send_command(path: str, command: str) -> str:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        # stop ждёт записи файлов
+        conn.settimeout(60)
+        conn.connect(path)
+        conn.sendall(command.encode())
+        return conn.recv(4096).decode().strip()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Control the profiler of a running bot")
+    parser.add_argument("command", choices=("start", "stop", "status"))
+    parser.add_argument("--rate", type=float, default=0.0, help="Samples per second (start)")
+    parser.add_argument("--socket", default=os.getenv("PROFILE_SOCKET", ""), help="Control socket path")
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error("set PROFILE_SOCKET or pass --socket")
+    command = args.command + (f" {args.rate:g}" if args.command == "start" and args.rate else "")
+    print(send_command(args.socket, command))
+
+
+if __name__ == "__main__":
+    main()
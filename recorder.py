@@ -0,0 +1,154 @@
+"""Запись тикеров в компактные бинарные файлы фиксированной ширины.
+
+Один файл на символ в сутки (UTC): ``<dir>/<SYMBOL>-<YYYYMMDD>.ticks``.
+Строка — 4 значения float64 little-endian (32 байта): ts (секунды Unix),
+last, bid, ask. Заголовка нет, поэтому файл читается без копирования как
+структурированный массив: ``numpy.memmap(path, dtype=TICK_DTYPE, mode="r")``,
+а колонки (``arr["bid"]``) — это представления без копирования.
+"""
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterator, Tuple
+
+ROW_FORMAT = "<dddd"
+ROW_STRUCT = struct.Struct(ROW_FORMAT)
+ROW_SIZE = ROW_STRUCT.size
+FILE_SUFFIX = ".ticks"
+TICK_COLUMNS = ("ts", "last", "bid", "ask")
+TICK_DTYPE = [(name, "<f8") for name in TICK_COLUMNS]
+
+
+def tick_file_name(symbol: str, ts: float) -> str:
+    day = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y%m%d")
+    return f"{symbol}-{day}{FILE_SUFFIX}"
+
+
+class TickRecorder:
+    """Буферизованная запись тиков в фоновом потоке.
+
+    record() вызывается из колбэка WebSocket и только кладёт кортеж в
+    SimpleQueue; упаковка и запись на диск идут в отдельном потоке пачками
+    раз в flush_interval секунд.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = 1.0, max_open_files: int = 256) -> None:
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_open_files = max_open_files
+        self._queue: "queue.SimpleQueue[Tuple[str, float, float, float, float]]" = queue.SimpleQueue()
+        self._files: Dict[str, BinaryIO] = {}
+        self._names: Dict[Tuple[str, int], str] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tick-recorder", daemon=True)
+        self.rows_written = 0
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join(timeout=5)
+
+    def record(self, symbol: str, ts: float, last: float, bid: float, ask: float) -> None:
+        self._queue.put((symbol, ts, last, bid, ask))
+
+    def _file(self, name: str) -> BinaryIO:
+        f = self._files.get(name)
+        if f is None:
+            if len(self._files) >= self.max_open_files:
+                self._close_files()
+            f = open(os.path.join(self.directory, name), "ab")
+            self._files[name] = f
+        return f
+
+    def _close_files(self) -> None:
+        for f in self._files.values():
+            try:
+                f.close()
+            except OSError:
+                pass
+        self._files.clear()
+
+    def _drain(self) -> Dict[str, bytearray]:
+        buffers: Dict[str, bytearray] = {}
+        pack = ROW_STRUCT.pack
+        while True:
+            try:
+                symbol, ts, last, bid, ask = self._queue.get_nowait()
+            except queue.Empty:
+                return buffers
+            day_key = (symbol, int(ts // 86400))
+            name = self._names.get(day_key)
+            if name is None:
+                name = self._names[day_key] = tick_file_name(symbol, ts)
+            buf = buffers.get(name)
+            if buf is None:
+                buf = buffers[name] = bytearray()
+            buf += pack(ts, last, bid, ask)
+
+    def _flush(self) -> None:
+        buffers = self._drain()
+        if not buffers:
+            return
+        # Файлы прошлых суток больше не понадобятся
+        newest_day = max(_day_of(name) for name in buffers)
+        for name in [n for n in self._files if _day_of(n) < newest_day]:
+            self._files.pop(name).close()
+        if len(self._names) > self.max_open_files * 4:
+            self._names.clear()
+        for name, buf in buffers.items():
+            f = self._file(name)
+            f.write(buf)
+            f.flush()
+            self.rows_written += len(buf) // ROW_SIZE
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            try:
+                self._flush()
+            except Exception as e:
+                logging.error("Error writing recorded ticks: %s", e)
+            self._stopped.wait(max(0.0, self.flush_interval - (time.monotonic() - started)))
+        try:
+            self._flush()
+        finally:
+            self._close_files()
+
+
+def _day_of(name: str) -> str:
+    return name[-len(FILE_SUFFIX) - 8:-len(FILE_SUFFIX)]
+
+
+def symbol_from_path(path: str) -> str:
+    return os.path.basename(path)[:-len(FILE_SUFFIX) - 9]
+
+
+def load_ticks(path: str) -> Any:
+    """Открывает файл тиков как numpy.memmap без копирования (нужен NumPy)"""
+    import numpy as np
+
+    rows = os.path.getsize(path) // ROW_SIZE
+    if rows == 0:
+        return np.zeros(0, dtype=TICK_DTYPE)
+    # Недописанная последняя строка (остановка посреди записи) отбрасывается
+    return np.memmap(path, dtype=TICK_DTYPE, mode="r", shape=(rows,))
+
+
+def iter_ticks(path: str) -> Iterator[Tuple[float, float, float, float]]:
+    """Итерация по строкам через mmap без NumPy"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size // ROW_SIZE * ROW_SIZE
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            unpack_from = ROW_STRUCT.unpack_from
+            for offset in range(0, size, ROW_SIZE):
+                yield unpack_from(mm, offset)
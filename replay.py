@@ -0,0 +1,635 @@
+"""Офлайн-воспроизведение логики трейлинга по записанным тикам.
+
+Прогоняет те же правила, что и бот (trailing.py), по записанному потоку
+тикеров с симулированными часами: обнаружение позиции опросом, начальные
+SL/TP, трейлинг в режиме poll, tick или adaptive и модель исполнения на
+стороне биржи.
+
+    python replay.py ticks.csv --side Buy --mode tick
+    python replay.py data/ticks/BTCUSDT-*.ticks
+
+Файлы .ticks пишет recorder.py (TICK_RECORD_DIR). CSV: заголовок с колонками
+ts (сек или мс), symbol, last, bid, ask (допускаются и имена полей Bybit:
+lastPrice, bid1Price, ask1Price).
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import recorder
+import trailing
+from cadence import check_interval
+from orders import BATCH_ORDER_LIMIT
+
+MODES = ("poll", "tick", "adaptive")
+API_METHODS = ("get_positions", "get_open_orders", "set_trading_stop", "place_batch_order")
+
+_COLUMN_ALIASES = {
+    "ts": ("ts", "timestamp", "time"),
+    "symbol": ("symbol",),
+    "last": ("last", "lastPrice", "price"),
+    "bid": ("bid", "bid1Price", "bidPrice"),
+    "ask": ("ask", "ask1Price", "askPrice"),
+}
+
+
+@dataclass(frozen=True)
+class ReplayParams:
+    take_profit_percent: float = 5.0
+    stop_loss_percent: float = -2.5
+    trailing_start_percent: float = 1.6
+    trailing_distance_percent: float = 0.8
+
+
+@dataclass(frozen=True)
+class ReplayOptions:
+    side: str = "Buy"
+    mode: str = "poll"
+    poll_interval: float = 2.0
+    min_interval: float = 0.5
+    private_stream: bool = False
+    reconcile_interval: float = 60.0
+    # Пауза до повторного входа после выхода; None — только одна сделка
+    reenter_after: Optional[float] = 0.0
+    slippage_bps: float = 0.0
+    fee_bps: float = 0.0
+    # Шаг цены инструмента (0 — округление до 6 знаков) и минимальный сдвиг стопа в тиках
+    tick_size: float = 0.0
+    min_ticks: int = 0
+    # Режим adaptive: интервал проверки по расстоянию до события стопа (cadence.py)
+    check_min_interval: float = 0.2
+    check_max_interval: float = 10.0
+    check_seconds_per_percent: float = 5.0
+
+
+@dataclass
+class ReplayStats:
+    ticks: int = 0
+    trades: int = 0
+    take_profits: int = 0
+    stop_outs: int = 0
+    trailed_stop_outs: int = 0
+    pnl_percent: float = 0.0
+    open_pnl_percent: float = 0.0
+    max_drawdown_percent: float = 0.0
+    # Сколько раз бот оценивал стоп позиции: цена работы трейлинга в CPU
+    checks: int = 0
+    api_calls: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(API_METHODS, 0))
+    # Тейк-профиты по номеру прохода бота (t // poll_interval): выставленные за один проход
+    # позиции разных символов уходят общими пакетами place_batch_order
+    take_profit_slots: Dict[int, int] = field(default_factory=dict)
+    # Закрытые сделки (время выхода, PnL %) по времени: из них строится общая кривая equity
+    exits: List[Tuple[float, float]] = field(default_factory=list)
+    # Диапазоны проходов (включительно), в которых бот читал позиции и — при открытой позиции — ордера;
+    # один опрос покрывает все символы аккаунта
+    read_slots: List[Tuple[int, int]] = field(default_factory=list)
+    order_slots: List[Tuple[int, int]] = field(default_factory=list)
+
+    def merge(self, other: "ReplayStats") -> None:
+        self.ticks += other.ticks
+        self.trades += other.trades
+        self.take_profits += other.take_profits
+        self.stop_outs += other.stop_outs
+        self.trailed_stop_outs += other.trailed_stop_outs
+        self.pnl_percent += other.pnl_percent
+        self.open_pnl_percent += other.open_pnl_percent
+        # Просадка — по общей кривой equity всех символов, а не худшая из символов
+        if self.exits and other.exits:
+            self.exits = sorted(self.exits + other.exits, key=lambda exit_: exit_[0])
+            self.max_drawdown_percent = equity_drawdown(self.exits)
+        elif other.exits:
+            self.exits = list(other.exits)
+            self.max_drawdown_percent = other.max_drawdown_percent
+        self.checks += other.checks
+        for method, count in other.api_calls.items():
+            self.api_calls[method] = self.api_calls.get(method, 0) + count
+        for slot, count in other.take_profit_slots.items():
+            self.take_profit_slots[slot] = self.take_profit_slots.get(slot, 0) + count
+        self.api_calls["place_batch_order"] = take_profit_batches(self.take_profit_slots)
+        self.read_slots = self.read_slots + other.read_slots
+        self.order_slots = self.order_slots + other.order_slots
+        self.api_calls["get_positions"] = slot_count(self.read_slots)
+        self.api_calls["get_open_orders"] = slot_count(self.order_slots)
+
+
+def equity_drawdown(exits: Sequence[Tuple[float, float]]) -> float:
+    """Наибольшая просадка кривой equity, начатой с нуля, по сделкам в порядке выхода"""
+    equity = peak = max_drawdown = 0.0
+    for _, pnl in exits:
+        equity += pnl
+        if equity > peak:
+            peak = equity
+        elif peak - equity > max_drawdown:
+            max_drawdown = peak - equity
+    return max_drawdown
+
+
+def take_profit_batches(slots: Dict[int, int]) -> int:
+    """Число пакетных запросов: до BATCH_ORDER_LIMIT тейк-профитов одного прохода в пакете"""
+    return sum(-(-count // BATCH_ORDER_LIMIT) for count in slots.values())
+
+
+def slot_count(ranges: Sequence[Tuple[int, int]]) -> int:
+    """Число проходов в объединении диапазонов [first, last]"""
+    count = 0
+    end = None
+    for first, last in sorted(ranges):
+        if end is not None and first <= end:
+            if last > end:
+                count += last - end
+                end = last
+            continue
+        count += last - first + 1
+        end = last
+    return count
+
+
+@dataclass
+class TickSeries:
+    symbol: str
+    ts: Sequence[float]
+    last: Sequence[float]
+    bid: Sequence[float]
+    ask: Sequence[float]
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+
+def _resolve_columns(header: List[str]) -> Dict[str, int]:
+    columns = {}
+    for name, aliases in _COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in header:
+                columns[name] = header.index(alias)
+                break
+    missing = [name for name in ("ts", "last", "bid", "ask") if name not in columns]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+    return columns
+
+
+def load_csv(path: str, symbol: Optional[str] = None) -> Dict[str, TickSeries]:
+    """Читает CSV в ряды по символам; без колонки symbol берётся имя файла"""
+    default_symbol = symbol or os.path.basename(path).split(".")[0].split("-")[0]
+    rows: Dict[str, List[List[float]]] = {}
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        columns = _resolve_columns(next(reader))
+        i_ts, i_last, i_bid, i_ask = columns["ts"], columns["last"], columns["bid"], columns["ask"]
+        i_symbol = columns.get("symbol")
+        for row in reader:
+            if not row:
+                continue
+            sym = row[i_symbol] if i_symbol is not None else default_symbol
+            cols = rows.get(sym)
+            if cols is None:
+                cols = rows[sym] = [[], [], [], []]
+            cols[0].append(float(row[i_ts]))
+            cols[1].append(float(row[i_last]))
+            cols[2].append(float(row[i_bid]))
+            cols[3].append(float(row[i_ask]))
+
+    series = {}
+    for sym, (ts, last, bid, ask) in rows.items():
+        # Миллисекунды переводим в секунды
+        if ts and ts[0] > 1e11:
+            ts = [t / 1000 for t in ts]
+        series[sym] = TickSeries(sym, ts, last, bid, ask)
+    return series
+
+
+def _as_list(values: Sequence[float]) -> List[float]:
+    # Поэлементный доступ к массивам NumPy медленный, поэтому в цикле — только list
+    tolist = getattr(values, "tolist", None)
+    return tolist() if tolist else list(values)
+
+
+def stop_gate(is_buy: bool, entry: float, reference: float, start_percent: float, distance: float,
+              half_tick: float) -> float:
+    """Цена, начиная с которой trailing_stop может вернуть новый стоп;
+    ниже неё (выше для Sell) функция заведомо вернёт None и её можно не вызывать"""
+    if is_buy:
+        activation = entry * (1 + start_percent / 100)
+        improve = (reference - half_tick - 1e-6) / (1 - distance) if reference > 0 else 0.0
+        return max(activation, improve) * (1 - 1e-9)
+    activation = entry * (1 - start_percent / 100)
+    improve = (reference + half_tick + 1e-6) / (1 + distance) if reference > 0 else math.inf
+    return min(activation, improve) * (1 + 1e-9)
+
+
+def simulate(series: TickSeries, params: ReplayParams, options: ReplayOptions) -> ReplayStats:
+    """Прогоняет одну позицию (с повторными входами) по ряду тиков одного символа"""
+    stats = ReplayStats()
+    n = len(series)
+    stats.ticks = n
+    if n == 0:
+        return stats
+
+    ts = _as_list(series.ts)
+    last = _as_list(series.last)
+    bid = _as_list(series.bid)
+    ask = _as_list(series.ask)
+
+    side = options.side
+    is_buy = side == "Buy"
+    tick_mode = options.mode == "tick"
+    adaptive = options.mode == "adaptive"
+    check_min = options.check_min_interval
+    check_max = options.check_max_interval
+    seconds_per_percent = options.check_seconds_per_percent
+    private_stream = options.private_stream
+    poll_interval = options.poll_interval
+    read_interval = options.reconcile_interval if private_stream else poll_interval
+    min_interval = options.min_interval
+    reenter_after = options.reenter_after
+    slippage = options.slippage_bps / 10000
+    fees_percent = 2 * options.fee_bps / 100
+
+    tp_percent = params.take_profit_percent
+    sl_percent = params.stop_loss_percent
+    start_percent = params.trailing_start_percent
+    distance_percent = params.trailing_distance_percent
+    distance = distance_percent / 100
+    tick_size = options.tick_size
+    min_ticks = options.min_ticks
+    # Округление до тика сдвигает кандидата не больше чем на полтика
+    half_tick = tick_size / 2
+    trailing_stop = trailing.trailing_stop
+
+    calls_stop = checks = 0
+    # Опросы — по номеру прохода бота (t // интервал опроса), как и пакеты тейк-профитов
+    first_read_slot = last_read_slot = int(ts[0] // read_interval)
+    order_slots: List[Tuple[int, int]] = []
+    order_start = order_end = -1
+    take_profit_slots: Dict[int, int] = {}
+    trades = take_profits = stop_outs = trailed_stop_outs = 0
+    equity = peak = max_drawdown = 0.0
+    exits: List[Tuple[float, float]] = []
+
+    in_position = False
+    protected = False
+    trailed = False
+    entry = sl = tp = 0.0
+    pending = 0.0
+    last_sent_at = -math.inf
+    gate = 0.0
+    reenter_at: Optional[float] = ts[0]
+    next_eval = next_read = ts[0]
+
+    def make_gate(reference: float) -> float:
+        return stop_gate(is_buy, entry, reference, start_percent, distance, half_tick)
+
+    for i in range(n):
+        t = ts[i]
+        price = last[i]
+
+        if in_position:
+            # Исполнение на бирже: лимитный reduce-only TP и SL по LastPrice
+            exit_price = 0.0
+            if tp and (price >= tp if is_buy else price <= tp):
+                exit_price = tp
+                take_profits += 1
+            elif sl and (price <= sl if is_buy else price >= sl):
+                exit_price = bid[i] * (1 - slippage) if is_buy else ask[i] * (1 + slippage)
+                stop_outs += 1
+                if trailed:
+                    trailed_stop_outs += 1
+            if exit_price:
+                change = (exit_price - entry) / entry * 100
+                pnl = (change if is_buy else -change) - fees_percent
+                trades += 1
+                equity += pnl
+                exits.append((t, pnl))
+                if equity > peak:
+                    peak = equity
+                elif peak - equity > max_drawdown:
+                    max_drawdown = peak - equity
+                in_position = False
+                reenter_at = t + reenter_after if reenter_after is not None else None
+
+        if not in_position and reenter_at is not None and t >= reenter_at:
+            # Вход по рынку: Buy по ask, Sell по bid
+            entry = ask[i] if is_buy else bid[i]
+            in_position = True
+            protected = trailed = False
+            sl = tp = pending = 0.0
+            last_sent_at = -math.inf
+            gate = make_gate(0.0)
+            if adaptive:
+                # Новая позиция ставится в расписание сразу
+                next_eval = t
+            if private_stream:
+                # Приватный поток: защита сразу после исполнения
+                sl = trailing.stop_loss_price(side, entry, sl_percent, tick_size)
+                tp = trailing.take_profit_price(side, entry, tp_percent, tick_size)
+                calls_stop += 1
+                slot = int(t // poll_interval)
+                take_profit_slots[slot] = take_profit_slots.get(slot, 0) + 1
+                protected = True
+                gate = make_gate(sl)
+
+        # Бот сравнивает с ask для Buy и с bid для Sell
+        current = ask[i] if is_buy else bid[i]
+
+        if t >= next_read:
+            passes = int((t - next_read) // read_interval) + 1
+            next_read += passes * read_interval
+            last_read_slot = int(t // read_interval)
+            if in_position:
+                if order_start < 0:
+                    order_start = last_read_slot
+                order_end = last_read_slot
+                if not protected:
+                    sl = trailing.stop_loss_price(side, current, sl_percent, tick_size)
+                    tp = trailing.take_profit_price(side, current, tp_percent, tick_size)
+                    calls_stop += 1
+                    slot = int(t // poll_interval)
+                    take_profit_slots[slot] = take_profit_slots.get(slot, 0) + 1
+                    protected = True
+                    gate = make_gate(sl)
+            elif order_start >= 0:
+                order_slots.append((order_start, order_end))
+                order_start = -1
+
+        if not (in_position and protected):
+            continue
+
+        if tick_mode:
+            checks += 1
+            if current >= gate if is_buy else current <= gate:
+                new_sl = trailing_stop(
+                    side, entry, pending or sl, current, start_percent, distance_percent, tick_size, min_ticks
+                )
+                if new_sl is not None:
+                    pending = new_sl
+                    gate = make_gate(new_sl)
+            if pending and t - last_sent_at >= min_interval:
+                sl = pending
+                pending = 0.0
+                last_sent_at = t
+                calls_stop += 1
+                trailed = True
+        elif adaptive:
+            if t >= next_eval:
+                checks += 1
+                if current >= gate if is_buy else current <= gate:
+                    new_sl = trailing_stop(
+                        side, entry, pending or sl, current, start_percent, distance_percent, tick_size, min_ticks
+                    )
+                    if new_sl is not None:
+                        pending = new_sl
+                        gate = make_gate(new_sl)
+                gap = trailing.trigger_gap(
+                    side, entry, pending or sl, current, start_percent, distance_percent, tick_size, min_ticks
+                )
+                next_eval = t + check_interval(gap, check_min, check_max, seconds_per_percent)
+            if pending and t - last_sent_at >= min_interval:
+                sl = pending
+                pending = 0.0
+                last_sent_at = t
+                calls_stop += 1
+                trailed = True
+        elif t >= next_eval:
+            checks += 1
+            next_eval += (int((t - next_eval) // poll_interval) + 1) * poll_interval
+            if current >= gate if is_buy else current <= gate:
+                new_sl = trailing_stop(
+                    side, entry, sl, current, start_percent, distance_percent, tick_size, min_ticks
+                )
+                if new_sl is not None:
+                    sl = new_sl
+                    gate = make_gate(sl)
+                    calls_stop += 1
+                    trailed = True
+
+    if order_start >= 0:
+        order_slots.append((order_start, order_end))
+    if in_position:
+        change = (last[-1] - entry) / entry * 100
+        stats.open_pnl_percent = change if is_buy else -change
+
+    stats.trades = trades
+    stats.take_profits = take_profits
+    stats.stop_outs = stop_outs
+    stats.trailed_stop_outs = trailed_stop_outs
+    stats.pnl_percent = equity
+    stats.max_drawdown_percent = max_drawdown
+    stats.exits = exits
+    stats.checks = checks
+    stats.api_calls = {
+        "get_positions": last_read_slot - first_read_slot + 1,
+        "get_open_orders": slot_count(order_slots),
+        "set_trading_stop": calls_stop,
+        "place_batch_order": take_profit_batches(take_profit_slots),
+    }
+    stats.take_profit_slots = take_profit_slots
+    stats.read_slots = [(first_read_slot, last_read_slot)]
+    stats.order_slots = order_slots
+    return stats
+
+
+def load_tick_file(path: str) -> TickSeries:
+    """Читает файл recorder.py: через numpy.memmap, если NumPy есть, иначе через mmap"""
+    symbol = recorder.symbol_from_path(path)
+    try:
+        ticks = recorder.load_ticks(path)
+        return TickSeries(symbol, ticks["ts"], ticks["last"], ticks["bid"], ticks["ask"])
+    except ImportError:
+        ts: List[float] = []
+        last: List[float] = []
+        bid: List[float] = []
+        ask: List[float] = []
+        for row in recorder.iter_ticks(path):
+            ts.append(row[0])
+            last.append(row[1])
+            bid.append(row[2])
+            ask.append(row[3])
+        return TickSeries(symbol, ts, last, bid, ask)
+
+
+def join_series(symbol: str, parts: Sequence[TickSeries]) -> TickSeries:
+    """Склеивает файлы символа (recorder.py пишет файл на сутки) в один ряд по времени начала.
+
+    Позиция, equity и просадка не должны обнуляться в полночь UTC, поэтому
+    месяц прогоняется одним рядом, а не по дням.
+    """
+    parts = sorted((part for part in parts if len(part)), key=lambda part: part.ts[0])
+    if len(parts) == 1:
+        return parts[0]
+    columns = []
+    for name in ("ts", "last", "bid", "ask"):
+        values = [getattr(part, name) for part in parts]
+        if any(hasattr(value, "dtype") for value in values):
+            import numpy as np
+
+            columns.append(np.concatenate(values))
+        else:
+            columns.append([item for value in values for item in value])
+    return TickSeries(symbol, *columns)
+
+
+def load_series(paths: Sequence[str]) -> Dict[str, TickSeries]:
+    """Ряды по символам; файлы одного символа склеиваются в один ряд"""
+    by_symbol: Dict[str, List[TickSeries]] = {}
+    for path in paths:
+        if path.endswith(recorder.FILE_SUFFIX):
+            loaded = {recorder.symbol_from_path(path): load_tick_file(path)}
+        else:
+            loaded = load_csv(path)
+        for symbol, series in loaded.items():
+            by_symbol.setdefault(symbol, []).append(series)
+    return {symbol: join_series(symbol, parts) for symbol, parts in by_symbol.items()}
+
+
+def run(by_symbol: Dict[str, TickSeries], params: ReplayParams, options: ReplayOptions) -> Dict[str, ReplayStats]:
+    return {symbol: simulate(series, params, options) for symbol, series in by_symbol.items()}
+
+
+def format_report(results: Dict[str, ReplayStats], elapsed: float) -> str:
+    total = ReplayStats()
+    lines = [f"{'symbol':<14}{'ticks':>12}{'trades':>8}{'TP':>6}{'SL':>6}{'trail SL':>9}{'PnL %':>10}{'max DD %':>10}{'API calls':>11}"]
+    for symbol, stats in sorted(results.items()):
+        total.merge(stats)
+        lines.append(
+            f"{symbol:<14}{stats.ticks:>12}{stats.trades:>8}{stats.take_profits:>6}{stats.stop_outs:>6}"
+            f"{stats.trailed_stop_outs:>9}{stats.pnl_percent:>10.2f}{stats.max_drawdown_percent:>10.2f}"
+            f"{sum(stats.api_calls.values()):>11}"
+        )
+    lines.append("")
+    lines.append(
+        f"Total PnL: {total.pnl_percent:.2f}% over {total.trades} trades, max drawdown {total.max_drawdown_percent:.2f}% "
+        f"(open position PnL: {total.open_pnl_percent:.2f}%)"
+    )
+    lines.append(f"Take-profits: {total.take_profits}, stop-outs: {total.stop_outs} ({total.trailed_stop_outs} after trailing)")
+    lines.append("API calls: " + ", ".join(f"{m}={c}" for m, c in total.api_calls.items()))
+    lines.append(f"Stop evaluations: {total.checks}")
+    rate = total.ticks / elapsed if elapsed > 0 else 0.0
+    lines.append(f"Replayed {total.ticks} ticks in {elapsed:.2f}s ({rate * 60 / 1e6:.1f}M ticks/min)")
+    return "\n".join(lines)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name, "")
+    return float(value) if value else default
+
+
+def _env_mode() -> str:
+    # TRAILING_MODE бота может быть и exchange: такой режим не воспроизводится, а argparse
+    # не сверяет значение по умолчанию с choices
+    mode = os.getenv("TRAILING_MODE", "") or "poll"
+    if mode not in MODES:
+        print(f"TRAILING_MODE={mode} cannot be replayed, using poll", file=sys.stderr)
+        return "poll"
+    return mode
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Replay the trailing logic over recorded ticker data")
+    parser.add_argument("paths", nargs="+", help="Recorded tick files")
+    parser.add_argument("--side", choices=("Buy", "Sell"), default="Buy")
+    parser.add_argument("--mode", choices=MODES, default=_env_mode())
+    parser.add_argument("--take-profit", type=float, default=_env_float("TAKE_PROFIT_PERCENT", 5.0))
+    parser.add_argument("--stop-loss", type=float, default=_env_float("STOP_LOSS_PERCENT", -2.5))
+    parser.add_argument("--trailing-start", type=float, default=_env_float("TRAILING_START_PERCENT", 1.6))
+    parser.add_argument("--trailing-distance", type=float, default=_env_float("TRAILING_DISTANCE_PERCENT", 0.8))
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--min-interval", type=float, default=_env_float("STOP_UPDATE_MIN_INTERVAL", 0.5))
+    parser.add_argument("--private-stream", action="store_true")
+    parser.add_argument("--reconcile-interval", type=float, default=_env_float("RECONCILE_INTERVAL", 60.0))
+    parser.add_argument("--reenter-after", type=float, default=0.0, help="Seconds before re-entering; negative = single trade")
+    parser.add_argument("--slippage-bps", type=float, default=0.0, help="Stop-loss market fill slippage")
+    parser.add_argument("--fee-bps", type=float, default=0.0, help="Fee per side")
+    parser.add_argument("--tick-size", type=float, default=0.0, help="Price tick of the instrument (0 = 6 decimals)")
+    parser.add_argument(
+        "--min-ticks",
+        type=int,
+        default=int(_env_float("STOP_UPDATE_MIN_TICKS", 1)),
+        help="Skip stop moves smaller than this many ticks",
+    )
+    parser.add_argument("--check-min-interval", type=float, default=_env_float("CHECK_MIN_INTERVAL", 0.2))
+    parser.add_argument("--check-max-interval", type=float, default=_env_float("CHECK_MAX_INTERVAL", 10.0))
+    parser.add_argument(
+        "--check-seconds-per-percent", type=float, default=_env_float("CHECK_SECONDS_PER_PERCENT", 5.0)
+    )
+    return parser
+
+
+def params_from_args(args: argparse.Namespace) -> ReplayParams:
+    return ReplayParams(
+        take_profit_percent=args.take_profit,
+        stop_loss_percent=args.stop_loss,
+        trailing_start_percent=args.trailing_start,
+        trailing_distance_percent=args.trailing_distance,
+    )
+
+
+def options_from_args(args: argparse.Namespace) -> ReplayOptions:
+    return ReplayOptions(
+        side=args.side,
+        mode=args.mode,
+        poll_interval=args.poll_interval,
+        min_interval=args.min_interval,
+        private_stream=args.private_stream,
+        reconcile_interval=args.reconcile_interval,
+        reenter_after=args.reenter_after if args.reenter_after >= 0 else None,
+        slippage_bps=args.slippage_bps,
+        fee_bps=args.fee_bps,
+        tick_size=args.tick_size,
+        min_ticks=args.min_ticks,
+        check_min_interval=args.check_min_interval,
+        check_max_interval=args.check_max_interval,
+        check_seconds_per_percent=args.check_seconds_per_percent,
+    )
+
+
+def check_read_calls(symbols: int = 3, ticks: int = 20000, seed: int = 7) -> None:
+    """Проверка для CI: опросы позиций и ордеров не растут с числом символов.
+
+    Один и тот же случайный ряд прогоняется как один символ и как symbols
+    символов: бот читает позиции и ордера одним запросом на проход, поэтому
+    get_positions и get_open_orders должны совпасть, а place_batch_order —
+    тоже, пока тейк-профиты прохода помещаются в один пакет.
+    """
+    rng = random.Random(seed)
+    ts, last, bid, ask = [], [], [], []
+    price = 100.0
+    for i in range(ticks):
+        price *= 1 + rng.gauss(0, 0.001)
+        ts.append(1_700_000_000 + i * 0.1)
+        last.append(price)
+        bid.append(price * 0.9999)
+        ask.append(price * 1.0001)
+    params = ReplayParams(take_profit_percent=1.0, stop_loss_percent=-1.0)
+    for options in (ReplayOptions(), ReplayOptions(private_stream=True), ReplayOptions(mode="tick")):
+        single = ReplayStats()
+        single.merge(simulate(TickSeries("S0", ts, last, bid, ask), params, options))
+        several = ReplayStats()
+        for stats in run({f"S{k}": TickSeries(f"S{k}", ts, last, bid, ask) for k in range(symbols)},
+                         params, options).values():
+            several.merge(stats)
+        for method in ("get_positions", "get_open_orders", "place_batch_order"):
+            if single.api_calls[method] != several.api_calls[method]:
+                raise SystemExit(
+                    f"{method} grows with symbols ({options.mode}, private stream {options.private_stream}): "
+                    f"{single.api_calls[method]} for 1 symbol, {several.api_calls[method]} for {symbols}"
+                )
+    print("Replay read calls do not depend on the number of symbols")
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    by_symbol = load_series(args.paths)
+    started = time.perf_counter()
+    results = run(by_symbol, params_from_args(args), options_from_args(args))
+    print(format_report(results, time.perf_counter() - started))
+
+
+if __name__ == "__main__":
+    main()
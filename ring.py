@@ -0,0 +1,173 @@
+"""Кольцевой буфер цен в разделяемой памяти между процессами.
+
+Один писатель (процесс приёма цен) кладёт записи фиксированного размера:
+слот символа в PriceCache читателя и эпоху читателя, ts, last, bid, ask и время получения
+(time.monotonic — на Linux часы общие для всех процессов). После записи
+писатель увеличивает счётчик write_seq в заголовке. Читатель держит свою
+позицию и получает новые записи как представления NumPy прямо над
+разделяемой памятью, без сериализации и копирования. Отставший больше чем
+на ёмкость буфера читатель перескакивает вперёд: для цен важна последняя
+запись, а не каждая промежуточная.
+
+Эпоха растёт при каждом запуске читателя: слоты перезапущенного процесса
+аккаунтов другие, и записи под старые слоты он отбрасывает по эпохе.
+
+Заголовок (uint64): write_seq, поколение писателя (растёт при каждом
+перезапуске процесса приёма), число топиков и соединений публичного потока,
+эпоха читателя; и float64: время последнего heartbeat писателя.
+"""
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([
+    ("slot", "<i4"),
+    ("epoch", "<i4"),
+    ("ts", "<f8"),
+    ("last", "<f8"),
+    ("bid", "<f8"),
+    ("ask", "<f8"),
+    ("received", "<f8"),
+])
+HEADER_SIZE = 128
+# Индексы полей заголовка
+WRITE_SEQ = 0
+GENERATION = 1
+TOPICS = 2
+CONNECTIONS = 3
+EPOCH = 4
+HEARTBEAT = 0
+
+
+class PriceRing:
+    """Буфер над SharedMemory; create=True — создать (владелец — супервизор), иначе подключиться по имени"""
+
+    def __init__(self, name: Optional[str] = None, capacity: int = 65536, create: bool = False) -> None:
+        if create:
+            if capacity < 2 or capacity & (capacity - 1):
+                raise ValueError(f"Ring capacity must be a power of two, got: {capacity}")
+            self._shm = shared_memory.SharedMemory(
+                name=name, create=True, size=HEADER_SIZE + capacity * RECORD_DTYPE.itemsize
+            )
+            self._shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            capacity = (self._shm.size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+            # Размер сегмента округляется до страницы: ёмкость — наибольшая степень двойки
+            capacity = 1 << (capacity.bit_length() - 1)
+        self.name = self._shm.name
+        self.capacity = capacity
+        self._mask = capacity - 1
+        buf = self._shm.buf
+        self.header = np.ndarray((8,), dtype=np.uint64, buffer=buf, offset=0)
+        self.header_f = np.ndarray((8,), dtype=np.float64, buffer=buf, offset=64)
+        self.records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=buf, offset=HEADER_SIZE)
+
+    def close(self) -> None:
+        # Представления NumPy держат буфер: без их удаления SharedMemory.close() бросит BufferError
+        del self.header, self.header_f, self.records
+        self._shm.close()
+
+    def unlink(self) -> None:
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    @property
+    def generation(self) -> int:
+        return int(self.header[GENERATION])
+
+    def heartbeat_age(self, now: Optional[float] = None) -> float:
+        beat = float(self.header_f[HEARTBEAT])
+        if not beat:
+            return float("inf")
+        return (time.monotonic() if now is None else now) - beat
+
+
+class RingWriter:
+    """Писатель: ровно один процесс на буфер.
+
+    Вызывается из колбэков соединений WebSocket; записи разных соединений
+    разделяет блокировка, её держит только копирование шести чисел.
+    """
+
+    def __init__(self, ring: PriceRing) -> None:
+        self.ring = ring
+        self._lock = threading.Lock()
+        self._records = ring.records
+        self._mask = ring._mask
+        self._seq = int(ring.header[WRITE_SEQ])
+        self.generation = int(ring.header[GENERATION]) + 1
+        ring.header[GENERATION] = self.generation
+
+    def write(self, slot: int, epoch: int, ts: float, last: float, bid: float, ask: float) -> None:
+        received = time.monotonic()
+        with self._lock:
+            seq = self._seq
+            self._records[seq & self._mask] = (slot, epoch, ts, last, bid, ask, received)
+            self._seq = seq + 1
+            # Счётчик — после записи: читатель видит только заполненные записи
+            self.ring.header[WRITE_SEQ] = seq + 1
+
+    def heartbeat(self, topics: int, connections: int) -> None:
+        self.ring.header[TOPICS] = topics
+        self.ring.header[CONNECTIONS] = connections
+        self.ring.header_f[HEARTBEAT] = time.monotonic()
+
+
+class RingReader:
+    """Читатель: ровно один процесс на буфер, его записи помечены эпохой self.epoch"""
+
+    def __init__(self, ring: PriceRing) -> None:
+        self.ring = ring
+        self.epoch = int(ring.header[EPOCH]) % (1 << 31) + 1
+        ring.header[EPOCH] = self.epoch
+        # Старые записи (до подключения читателя) относятся к чужим слотам
+        self.cursor = int(ring.header[WRITE_SEQ])
+        self._read_from = self.cursor
+        self.overruns = 0
+
+    def read(self) -> List[np.ndarray]:
+        """Новые записи как представления буфера (до двух кусков при переходе через конец)"""
+        ring = self.ring
+        seq = int(ring.header[WRITE_SEQ])
+        if seq == self.cursor:
+            return []
+        if seq - self.cursor > ring.capacity:
+            self.overruns += seq - self.cursor - ring.capacity
+            self.cursor = seq - ring.capacity
+        start = self.cursor & ring._mask
+        end = start + (seq - self.cursor)
+        self._read_from = self.cursor
+        self.cursor = seq
+        if end <= ring.capacity:
+            return [ring.records[start:end]]
+        return [ring.records[start:], ring.records[:end - ring.capacity]]
+
+    def lapped(self) -> bool:
+        """Писатель обогнал читателя на круг, пока тот разбирал прочитанное: куски могли перезаписаться"""
+        return int(self.ring.header[WRITE_SEQ]) - self._read_from > self.ring.capacity
+
+
+def latest(chunks: List[np.ndarray], epoch: int) -> Tuple[np.ndarray, ...]:
+    """Последняя запись эпохи epoch по каждому слоту: (slots, ts, last, bid, ask, received)"""
+    records = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+    own = records["epoch"] == epoch
+    if not own.all():
+        records = records[own]
+    slots = records["slot"]
+    # Индекс последнего вхождения каждого слота: unique по развёрнутому массиву
+    unique, first_from_end = np.unique(slots[::-1], return_index=True)
+    index = len(slots) - 1 - first_from_end
+    return (
+        unique,
+        records["ts"][index],
+        records["last"][index],
+        records["bid"][index],
+        records["ask"][index],
+        records["received"][index],
+    )
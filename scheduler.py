@@ -0,0 +1,291 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, Hashable, List, Mapping, Optional, Tuple
+
+import logsetup
+import metrics
+
+# Приоритеты: меньше — важнее
+PRIORITY_STOP_LOSS = 0
+PRIORITY_TAKE_PROFIT = 1
+PRIORITY_READ = 2
+PRIORITIES = (PRIORITY_STOP_LOSS, PRIORITY_TAKE_PROFIT, PRIORITY_READ)
+
+RATE_LIMIT_RET_CODE = 10006
+
+# Лимиты v5 по умолчанию (запросов в секунду на UID) до первого ответа с заголовками
+DEFAULT_RATE_LIMITS = {
+    "set_trading_stop": 10,
+    "place_order": 10,
+    "amend_order": 10,
+    "cancel_order": 10,
+    "place_batch_order": 10,
+    "amend_batch_order": 10,
+    "get_positions": 50,
+    "get_open_orders": 50,
+    "get_wallet_balance": 50,
+    "get_instruments_info": 50,
+}
+DEFAULT_RATE_LIMIT = 10
+
+# Запросы, меняющие ордера и стопы: каждый попадает в журнал аудита
+AUDITED_METHODS = {
+    "set_trading_stop", "place_order", "amend_order", "cancel_order", "place_batch_order", "amend_batch_order"
+}
+
+REST_REQUESTS = metrics.counter("bytrailor_rest_requests", "REST requests sent to Bybit", ("account", "method"))
+REST_ERRORS = metrics.counter(
+    "bytrailor_rest_errors", "REST requests that raised or returned a nonzero retCode", ("account", "method")
+)
+REST_RATE_LIMITED = metrics.counter(
+    "bytrailor_rest_rate_limited", "Responses with retCode 10006", ("account", "method")
+)
+REST_LATENCY = metrics.histogram("bytrailor_rest_request_seconds", "REST request latency", ("account", "method"))
+
+
+class TokenBucket:
+    """Token bucket одного эндпоинта, подстраивается по заголовкам X-Bapi-Limit-*"""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = float(rate)
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Сколько секунд ждать до свободного токена (0 — можно отправлять)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def update_from_headers(self, headers: Mapping[str, Any], now: float) -> None:
+        try:
+            limit = headers.get("X-Bapi-Limit")
+            remaining = headers.get("X-Bapi-Limit-Status")
+            reset_ms = headers.get("X-Bapi-Limit-Reset-Timestamp")
+            if limit:
+                self.rate = self.capacity = max(1.0, float(limit))
+            if remaining is not None:
+                self._refill(now)
+                self.tokens = min(self.tokens, float(remaining))
+                if float(remaining) <= 0 and reset_ms:
+                    self.block_until_reset(int(reset_ms), now)
+        except (TypeError, ValueError):
+            pass
+
+    def block_until_reset(self, reset_ms: int, now: float) -> None:
+        # Заголовок содержит время по часам биржи (мс), переводим в monotonic
+        delay = max(0.0, reset_ms / 1000 - time.time())
+        self.blocked_until = max(self.blocked_until, now + delay)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Job:
+    __slots__ = ("priority", "method", "params", "coalesce_key", "futures", "attempts", "cancelled")
+
+    def __init__(
+        self,
+        priority: int,
+        method: str,
+        params: Dict[str, Any],
+        coalesce_key: Optional[Hashable],
+    ) -> None:
+        self.priority = priority
+        self.method = method
+        self.params = params
+        self.coalesce_key = coalesce_key
+        self.futures: List[Future] = [Future()]
+        self.attempts = 0
+        self.cancelled = False
+
+
+class RestScheduler:
+    """Единая очередь всех REST-запросов к Bybit.
+
+    Запросы разбираются по приоритету (стоп-лосс > тейк-профит > чтение) с
+    учётом token bucket каждого эндпоинта: заблокированный лимитом эндпоинт
+    не задерживает запросы к другим. Запрос с тем же coalesce_key заменяет
+    ещё не отправленный предыдущий; ожидающие старого получают ответ нового с
+    флагом "superseded". Ответ 10006 (лимит) возвращает запрос в начало очереди.
+    """
+
+    def __init__(
+        self, http: Any, workers: int = 4, max_rate_limit_retries: int = 5, name: str = "default"
+    ) -> None:
+        self.http = http
+        self.name = name
+        self.workers = workers
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self._cond = threading.Condition()
+        self._queues: Dict[int, Deque[_Job]] = {p: deque() for p in PRIORITIES}
+        self._queued_by_key: Dict[Hashable, _Job] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._started = False
+
+    def start(self) -> None:
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"rest-{self.name}-{i}", daemon=True).start()
+
+    def call(
+        self,
+        method: str,
+        priority: int = PRIORITY_READ,
+        coalesce_key: Optional[Hashable] = None,
+        **params: Any,
+    ) -> Dict[str, Any]:
+        return self.submit(method, priority, coalesce_key, **params).result()
+
+    def submit(
+        self,
+        method: str,
+        priority: int = PRIORITY_READ,
+        coalesce_key: Optional[Hashable] = None,
+        **params: Any,
+    ) -> Future:
+        job = _Job(priority, method, params, coalesce_key)
+        with self._cond:
+            if coalesce_key is not None:
+                previous = self._queued_by_key.get(coalesce_key)
+                if previous is not None:
+                    previous.cancelled = True
+                    job.futures.extend(previous.futures)
+                    logging.debug("Dropped queued %s superseded by a newer request (%s)", method, coalesce_key)
+                self._queued_by_key[coalesce_key] = job
+            self._queues[priority].append(job)
+            self._cond.notify()
+        return job.futures[0]
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(1 for q in self._queues.values() for job in q if not job.cancelled)
+
+    def _bucket(self, method: str) -> TokenBucket:
+        bucket = self._buckets.get(method)
+        if bucket is None:
+            bucket = TokenBucket(DEFAULT_RATE_LIMITS.get(method, DEFAULT_RATE_LIMIT))
+            self._buckets[method] = bucket
+        return bucket
+
+    def _next_job(self) -> Tuple[Optional[_Job], Optional[float]]:
+        """Первый по приоритету запрос, для которого есть токен; иначе — время ожидания"""
+        now = time.monotonic()
+        wait: Optional[float] = None
+        blocked = set()
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and queue[0].cancelled:
+                queue.popleft()
+            for job in queue:
+                if job.cancelled or job.method in blocked:
+                    continue
+                bucket = self._bucket(job.method)
+                job_wait = bucket.wait_time(now)
+                if job_wait <= 0:
+                    queue.remove(job)
+                    if job.coalesce_key is not None and self._queued_by_key.get(job.coalesce_key) is job:
+                        del self._queued_by_key[job.coalesce_key]
+                    bucket.take(now)
+                    return job, None
+                blocked.add(job.method)
+                if wait is None or job_wait < wait:
+                    wait = job_wait
+        return None, wait
+
+    def _requeue(self, job: _Job) -> None:
+        with self._cond:
+            if job.coalesce_key is not None:
+                newer = self._queued_by_key.get(job.coalesce_key)
+                if newer is not None:
+                    # Пока ждали лимит, пришёл более новый запрос — отдаём ему ожидающих
+                    newer.futures.extend(job.futures)
+                    return
+                self._queued_by_key[job.coalesce_key] = job
+            self._queues[job.priority].appendleft(job)
+            self._cond.notify()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    job, wait = self._next_job()
+                    if job is not None:
+                        break
+                    self._cond.wait(wait)
+
+            REST_REQUESTS.labels(self.name, job.method).inc()
+            started = time.perf_counter()
+            try:
+                result = getattr(self.http, job.method)(**job.params)
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                REST_LATENCY.labels(self.name, job.method).observe(elapsed)
+                REST_ERRORS.labels(self.name, job.method).inc()
+                if job.method in AUDITED_METHODS:
+                    logsetup.audit(self.name, job.method, job.params, elapsed, error=e)
+                for future in job.futures:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+            REST_LATENCY.labels(self.name, job.method).observe(elapsed)
+
+            # При return_response_headers=True pybit отдаёт (json, elapsed, headers)
+            headers: Mapping[str, Any] = {}
+            response = result
+            if isinstance(result, tuple):
+                response, headers = result[0], result[-1] or {}
+            if job.method in AUDITED_METHODS:
+                logsetup.audit(self.name, job.method, job.params, elapsed, response)
+
+            ret_code = response.get("retCode")
+            if ret_code == RATE_LIMIT_RET_CODE:
+                REST_RATE_LIMITED.labels(self.name, job.method).inc()
+            elif ret_code != 0:
+                REST_ERRORS.labels(self.name, job.method).inc()
+
+            with self._cond:
+                bucket = self._bucket(job.method)
+                now = time.monotonic()
+                bucket.update_from_headers(headers, now)
+                if ret_code == RATE_LIMIT_RET_CODE:
+                    reset_ms = headers.get("X-Bapi-Limit-Reset-Timestamp")
+                    if reset_ms:
+                        bucket.block_until_reset(int(reset_ms), now)
+                    else:
+                        bucket.blocked_until = max(bucket.blocked_until, now + 1.0)
+
+            if ret_code == RATE_LIMIT_RET_CODE and job.attempts < self.max_rate_limit_retries:
+                job.attempts += 1
+                logging.warning(
+                    "Rate limit hit on %s, retrying (attempt %d/%d)",
+                    job.method,
+                    job.attempts,
+                    self.max_rate_limit_retries,
+                )
+                self._requeue(job)
+                continue
+
+            job.futures[0].set_result(response)
+            for future in job.futures[1:]:
+                superseded = dict(response)
+                superseded["superseded"] = True
+                future.set_result(superseded)
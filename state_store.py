@@ -0,0 +1,122 @@
+"""Снимок состояния бота в SQLite для тёплого перезапуска.
+
+По каждой защищённой позиции хранится сторона, размер, цена входа,
+последний принятый биржей стоп и наличие тейк-профита. При старте снимок
+сверяется с одним ответом get_positions: позиция с той же стороной и
+стопом на бирже считается уже защищённой, и начальный SL для неё не
+отправляется повторно. Пропавший тейк-профит ставится заново, а размер и
+цена входа из снимка становятся основанием TP для его подгонки.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from positions import PositionKey
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    account TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    position_idx INTEGER NOT NULL,
+    side TEXT NOT NULL,
+    qty REAL NOT NULL,
+    entry_price REAL NOT NULL,
+    stop_loss REAL NOT NULL,
+    has_take_profit INTEGER NOT NULL,
+    saved_at REAL NOT NULL,
+    PRIMARY KEY (account, symbol, position_idx)
+)
+"""
+
+
+class SavedPosition(NamedTuple):
+    side: str
+    qty: float
+    entry_price: float
+    stop_loss: float
+    has_take_profit: bool
+    saved_at: float
+
+
+class StateStore:
+    """Одно соединение на процесс; запись — целиком по аккаунту в одной транзакции"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Запись идёт из потоков трейлинга разных аккаунтов, поэтому соединение общее под блокировкой
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL: процессы аккаунтов (ACCOUNT_PROCESSES) пишут в один файл, не блокируя чтение
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(SCHEMA)
+
+    def load(self, account: str) -> Dict[PositionKey, SavedPosition]:
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT symbol, position_idx, side, qty, entry_price, stop_loss, has_take_profit, saved_at "
+                    "FROM positions WHERE account = ?",
+                    (account,),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logging.warning("Could not read saved state from %s: %s", self.path, e)
+            return {}
+        return {
+            (symbol, int(position_idx)): SavedPosition(side, qty, entry_price, stop_loss, bool(has_tp), saved_at)
+            for symbol, position_idx, side, qty, entry_price, stop_loss, has_tp, saved_at in rows
+        }
+
+    def save(self, account: str, positions: Dict[PositionKey, SavedPosition]) -> bool:
+        rows = [
+            (account, symbol, position_idx, p.side, p.qty, p.entry_price, p.stop_loss, int(p.has_take_profit),
+             p.saved_at)
+            for (symbol, position_idx), p in positions.items()
+        ]
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    self._conn.execute("DELETE FROM positions WHERE account = ?", (account,))
+                    self._conn.executemany("INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                except sqlite3.Error:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
+            return True
+        except sqlite3.Error as e:
+            logging.warning("Could not save state to %s: %s", self.path, e)
+            return False
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_store(path: str) -> Optional[StateStore]:
+    """StateStore или None, если путь не задан или файл не открывается"""
+    if not path:
+        return None
+    try:
+        return StateStore(path)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning("State snapshot disabled, could not open %s: %s", path, e)
+        return None
+
+
+def saved_position(record: Dict, now: Optional[float] = None) -> SavedPosition:
+    return SavedPosition(
+        side=record["side"],
+        qty=record["qty"],
+        entry_price=record["entry_price"],
+        stop_loss=record["stop_loss"],
+        has_take_profit=bool(record["has_take_profit"]),
+        saved_at=time.time() if now is None else now,
+    )
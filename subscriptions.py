@@ -0,0 +1,322 @@
+"""Менеджер подписок публичного потока тикеров.
+
+Подписки и отписки копятся и отправляются пачками из отдельного потока.
+Символ подписывается сразу на все топики менеджера (tickers, orderbook.1).
+Символ, который больше никому не нужен, отписывается после задержки (чтобы
+закрытие и повторное открытие позиции не гоняли подписку туда-обратно).
+Топики распределяются по нескольким соединениям, если в одном их больше
+лимита. Сообщения подписки хранятся в pybit в актуальном виде, поэтому после
+переподключения pybit восстанавливает ровно текущий набор топиков; соединение,
+которое pybit не смог восстановить сам, пересоздаётся.
+"""
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set
+from uuid import uuid4
+
+from pybit.unified_trading import WebSocket
+
+TICKER_TOPIC = "tickers.{symbol}"
+ORDERBOOK_TOPIC = "orderbook.1.{symbol}"
+# Топиков в одном сообщении subscribe/unsubscribe
+SUBSCRIBE_BATCH_SIZE = 10
+# Сколько ждать следующих запросов подписки, чтобы отправить их одним сообщением
+SUBSCRIBE_COALESCE = 0.05
+STALE_AFTER = 30.0
+WATCHDOG_INTERVAL = 5.0
+
+
+class EndpointWebSocket(WebSocket):
+    """pybit WebSocket с явным адресом (url), например локальной биржи mockexchange.py"""
+
+    def __init__(self, *args: Any, url: str = "", **kwargs: Any) -> None:
+        self._url = url
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, url: str) -> None:
+        # pybit вызывает _connect и при переподключении, поэтому адрес подменяется здесь
+        super()._connect(self._url or url)
+
+
+class TickerSocket(EndpointWebSocket):
+    """pybit WebSocket, подписками которого управляет SubscriptionManager.
+
+    pybit ищет ответ на subscribe по req_id и бросает исключение (а с ним
+    закрывает соединение) на незнакомый req_id или на сообщение топика, с
+    которого уже отписались. Здесь такие случаи только логируются.
+    """
+
+    def _process_subscription_message(self, message: Dict[str, Any]) -> None:
+        if message.get("success") is False:
+            logging.error("Ticker subscription rejected: %s", message.get("ret_msg"))
+
+    def _process_unsubscription_message(self, message: Dict[str, Any]) -> None:
+        if message.get("success") is False:
+            logging.warning("Ticker unsubscription rejected: %s", message.get("ret_msg"))
+
+    def _process_normal_message(self, message: Dict[str, Any]) -> None:
+        topic = message.get("topic")
+        if topic not in self.callback_directory:
+            return
+        if topic.startswith("orderbook."):
+            # Стакан ведёт PublicFeed: pybit собирал бы полный стакан и копировал его на каждое сообщение
+            self.callback_directory[topic](message)
+            return
+        super()._process_normal_message(message)
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class _Shard:
+    """Одно соединение и его топики; методы вызываются только из потока менеджера"""
+
+    def __init__(
+        self,
+        index: int,
+        socket_factory: Callable[[], Any],
+        callback: Callable,
+        batch_size: int,
+        templates: Sequence[str] = (TICKER_TOPIC,),
+    ) -> None:
+        self.index = index
+        self._socket_factory = socket_factory
+        self._callback = callback
+        self._batch_size = batch_size
+        self._templates = templates
+        self.symbols: Set[str] = set()
+        self.disconnected_since: Optional[float] = None
+        self.ws = socket_factory()
+
+    def _send(self, op: str, topics: List[str]) -> Dict[str, str]:
+        """Отправляет пачки; возвращает сообщения subscribe по req_id для повторной подписки pybit"""
+        messages = {}
+        for chunk in _chunks(topics, self._batch_size):
+            payload: Dict[str, Any] = {"op": op, "args": chunk}
+            if op == "subscribe":
+                req_id = str(uuid4())
+                payload["req_id"] = req_id
+                messages[req_id] = json.dumps(payload)
+            if self.ws.is_connected():
+                try:
+                    self.ws.ws.send(json.dumps(payload))
+                except Exception as e:
+                    # Соединение упало между проверкой и отправкой: подписку восстановит pybit
+                    logging.warning("Ticker connection %d: %s failed: %s", self.index, op, e)
+        return messages
+
+    def _topics(self, symbols: Iterable[str]) -> List[str]:
+        return [template.format(symbol=s) for s in symbols for template in self._templates]
+
+    def _rebuild_subscriptions(self) -> None:
+        # Одна замена словаря: pybit при переподключении перебирает его из своего потока
+        topics = self._topics(sorted(self.symbols))
+        messages = {}
+        for chunk in _chunks(topics, self._batch_size):
+            req_id = str(uuid4())
+            messages[req_id] = json.dumps({"op": "subscribe", "req_id": req_id, "args": chunk})
+        self.ws.subscriptions = messages
+
+    def subscribe(self, symbols: List[str]) -> None:
+        topics = self._topics(symbols)
+        # Колбэк регистрируется до отправки, чтобы первый снимок тикера не потерялся
+        for topic in topics:
+            self.ws._set_callback(topic, self._callback)
+        self.symbols.update(symbols)
+        messages = self._send("subscribe", topics)
+        self.ws.subscriptions = dict(self.ws.subscriptions, **messages)
+
+    def unsubscribe(self, symbols: List[str]) -> None:
+        topics = self._topics(symbols)
+        self.symbols.difference_update(symbols)
+        self._rebuild_subscriptions()
+        self._send("unsubscribe", topics)
+        for topic in topics:
+            self.ws.callback_directory.pop(topic, None)
+            self.ws.data.pop(topic, None)
+
+    def check(self, now: float) -> None:
+        """Пересоздаёт соединение, которое не восстановилось за STALE_AFTER секунд"""
+        if self.ws.is_connected():
+            if self.disconnected_since is not None:
+                logging.info("Ticker connection %d reconnected", self.index)
+                self.disconnected_since = None
+            return
+        if self.disconnected_since is None:
+            self.disconnected_since = now
+            logging.warning("Ticker connection %d disconnected, waiting for reconnect...", self.index)
+            return
+        if now - self.disconnected_since < STALE_AFTER:
+            return
+        logging.warning("Ticker connection %d is down for %.0fs, recreating it", self.index, STALE_AFTER)
+        try:
+            self.ws.exit()
+        except Exception:
+            pass
+        self.ws = self._socket_factory()
+        self.disconnected_since = None
+        symbols = sorted(self.symbols)
+        self.symbols = set()
+        if symbols:
+            self.subscribe(symbols)
+
+    def exit(self) -> None:
+        try:
+            self.ws.exit()
+        except Exception:
+            pass
+
+
+class SubscriptionManager:
+    def __init__(
+        self,
+        testnet: bool,
+        callback: Callable[[Dict[str, Any]], None],
+        max_topics_per_connection: int = 500,
+        unsubscribe_delay: float = 30.0,
+        batch_size: int = SUBSCRIBE_BATCH_SIZE,
+        socket_factory: Optional[Callable[[], Any]] = None,
+        url: str = "",
+        templates: Sequence[str] = (TICKER_TOPIC,),
+    ) -> None:
+        self.max_topics_per_connection = max_topics_per_connection
+        self.templates = tuple(templates)
+        # Все топики символа держатся в одном соединении
+        self.symbols_per_connection = max(1, max_topics_per_connection // len(self.templates))
+        self.unsubscribe_delay = unsubscribe_delay
+        self.batch_size = batch_size
+        self._callback = callback
+        self._socket_factory = socket_factory or (
+            lambda: TickerSocket(testnet=testnet, channel_type="linear", url=url)
+        )
+        self._cond = threading.Condition()
+        self._wanted: Set[str] = set()
+        # Символ -> когда он перестал быть нужен (time.monotonic)
+        self._released: Dict[str, float] = {}
+        # Символ -> соединение; меняется только потоком менеджера, под _cond
+        self._placement: Dict[str, _Shard] = {}
+        self._shards: List[_Shard] = []
+        self._started = False
+        self._stopped = False
+
+    def start(self) -> None:
+        """Открывает первое соединение и запускает поток менеджера"""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        self._shards.append(_Shard(0, self._socket_factory, self._callback, self.batch_size, self.templates))
+        threading.Thread(target=self._run, name="ticker-subscriptions", daemon=True).start()
+
+    def exit(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for shard in self._shards:
+            shard.exit()
+
+    def add(self, symbols: Iterable[str]) -> None:
+        with self._cond:
+            for symbol in symbols:
+                self._released.pop(symbol, None)
+                self._wanted.add(symbol)
+            self._cond.notify_all()
+
+    def remove(self, symbols: Iterable[str]) -> None:
+        now = time.monotonic()
+        with self._cond:
+            for symbol in symbols:
+                if symbol in self._wanted:
+                    self._wanted.discard(symbol)
+                    self._released[symbol] = now
+            self._cond.notify_all()
+
+    def topics(self) -> int:
+        return len(self._placement) * len(self.templates)
+
+    def connections(self) -> int:
+        return len(self._shards)
+
+    def _pending(self, now: float) -> tuple:
+        to_subscribe = sorted(s for s in self._wanted if s not in self._placement)
+        to_unsubscribe = []
+        next_due = None
+        for symbol, released_at in list(self._released.items()):
+            if symbol not in self._placement:
+                del self._released[symbol]
+            elif now - released_at >= self.unsubscribe_delay:
+                to_unsubscribe.append(symbol)
+                del self._released[symbol]
+            else:
+                due = released_at + self.unsubscribe_delay - now
+                next_due = due if next_due is None else min(next_due, due)
+        return to_subscribe, to_unsubscribe, next_due
+
+    def _run(self) -> None:
+        last_check = time.monotonic()
+        while True:
+            try:
+                with self._cond:
+                    while True:
+                        if self._stopped:
+                            return
+                        now = time.monotonic()
+                        to_subscribe, to_unsubscribe, next_due = self._pending(now)
+                        if to_unsubscribe:
+                            break
+                        if to_subscribe:
+                            # Даём накопиться подпискам, пришедшим почти одновременно
+                            self._cond.wait(SUBSCRIBE_COALESCE)
+                            to_subscribe, to_unsubscribe, _ = self._pending(time.monotonic())
+                            break
+                        if now - last_check >= WATCHDOG_INTERVAL:
+                            break
+                        timeout = WATCHDOG_INTERVAL - (now - last_check)
+                        self._cond.wait(timeout if next_due is None else min(timeout, next_due))
+
+                if to_unsubscribe:
+                    self._unsubscribe(to_unsubscribe)
+                if to_subscribe:
+                    self._subscribe(to_subscribe)
+                now = time.monotonic()
+                if now - last_check >= WATCHDOG_INTERVAL:
+                    last_check = now
+                    for shard in self._shards:
+                        shard.check(now)
+            except Exception as e:
+                logging.error("Error in ticker subscription manager: %s", e)
+                time.sleep(1)
+
+    def _subscribe(self, symbols: List[str]) -> None:
+        remaining = list(symbols)
+        while remaining:
+            shard = next((s for s in self._shards if len(s.symbols) < self.symbols_per_connection), None)
+            if shard is None:
+                shard = _Shard(len(self._shards), self._socket_factory, self._callback, self.batch_size, self.templates)
+                self._shards.append(shard)
+                logging.info("Opened ticker connection %d (%d topics per connection)",
+                             shard.index, self.max_topics_per_connection)
+            free = self.symbols_per_connection - len(shard.symbols)
+            batch, remaining = remaining[:free], remaining[free:]
+            shard.subscribe(batch)
+            with self._cond:
+                for symbol in batch:
+                    self._placement[symbol] = shard
+            logging.info("Subscribed to tickers for %s", ", ".join(batch))
+
+    def _unsubscribe(self, symbols: List[str]) -> None:
+        by_shard: Dict[int, List[str]] = {}
+        for symbol in symbols:
+            shard = self._placement.get(symbol)
+            if shard is not None:
+                by_shard.setdefault(shard.index, []).append(symbol)
+        for index, batch in by_shard.items():
+            self._shards[index].unsubscribe(batch)
+            with self._cond:
+                for symbol in batch:
+                    self._placement.pop(symbol, None)
+            logging.info("Unsubscribed from tickers for %s", ", ".join(batch))
@@ -0,0 +1,612 @@
+"""Перебор настроек TP/SL/трейлинга по записанным тикам на всех ядрах.
+
+Сетка задаётся диапазонами start:stop:step или списками через запятую
+для take_profit, stop_loss, trailing_start и trailing_distance; с --samples
+из сетки берётся случайная выборка точек. Каждая точка — прогон правил
+replay.py (trailing.py) по всем рядам тиков.
+
+Ряды один раз копируются в общий блок SharedMemory, процессы пула
+подключаются к нему по имени и работают с представлениями NumPy — массивы
+не сериализуются ни в процессы, ни в задачи. В режиме poll без приватного
+потока прогон идёт не по каждому тику, а от события к событию: опрос
+позиций, проверка стопа, срабатывание TP/SL (ищется по максимуму и минимуму
+цены между опросами), повторный вход. Результат совпадает с
+replay.simulate; остальные режимы прогоняются им самим.
+
+    python sweep.py data/ticks/*.ticks --grid trailing_start=0.5:3:0.1 trailing_distance=0.2:1.5:0.1
+    python sweep.py data/ticks/*.ticks --grid take_profit=2:10:0.5 stop_loss=-5:-1:0.25 \\
+        trailing_start=0.5:3:0.1 trailing_distance=0.2:1.5:0.1 --samples 5000 --env-out sweep.env
+
+Результаты ранжируются по score = PnL - DRAWDOWN_WEIGHT * просадка -
+CALL_COST * API-запросы / 1000 (или по одной метрике, --rank), лучшая
+точка печатается фрагментом .env.
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from multiprocessing import get_context, shared_memory
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import replay
+import trailing
+from replay import ReplayOptions, ReplayParams, ReplayStats, TickSeries, slot_count
+
+# Имя в --grid -> поле ReplayParams и переменная окружения бота
+PARAMETERS = {
+    "take_profit": ("take_profit_percent", "TAKE_PROFIT_PERCENT"),
+    "stop_loss": ("stop_loss_percent", "STOP_LOSS_PERCENT"),
+    "trailing_start": ("trailing_start_percent", "TRAILING_START_PERCENT"),
+    "trailing_distance": ("trailing_distance_percent", "TRAILING_DISTANCE_PERCENT"),
+}
+RANKS = ("score", "pnl", "drawdown", "calls")
+# Полную сетку больше этого без --samples не перебираем
+MAX_GRID = 1_000_000
+# Задач на процесс пула: мельче — ровнее загрузка к концу, крупнее — меньше пересылок
+TASKS_PER_WORKER = 8
+
+
+class _Part(NamedTuple):
+    """Ряд тиков в общем блоке; смещение и длины — в 8-байтовых словах"""
+
+    symbol: str
+    offset: int
+    ticks: int
+    # Число опросов позиций в ряду; -1 — прогон по событиям недоступен
+    buckets: int
+
+
+@dataclass
+class _SharedSeries:
+    symbol: str
+    ts: np.ndarray
+    last: np.ndarray
+    bid: np.ndarray
+    ask: np.ndarray
+    # Индексы тиков опроса и максимум/минимум last от опроса до следующего
+    reads: Optional[np.ndarray]
+    high: Optional[np.ndarray]
+    low: Optional[np.ndarray]
+
+
+@dataclass
+class SweepResult:
+    params: ReplayParams
+    stats: ReplayStats
+    score: float = 0.0
+
+    @property
+    def api_calls(self) -> int:
+        return sum(self.stats.api_calls.values())
+
+
+def parse_axis(spec: str) -> List[float]:
+    """start:stop:step (stop включительно) или список значений через запятую"""
+    if ":" in spec:
+        parts = spec.split(":")
+        if len(parts) != 3:
+            raise ValueError(f"Range must be start:stop:step, got: {spec}")
+        start, stop, step = (float(part) for part in parts)
+        if step <= 0 or stop < start:
+            raise ValueError(f"Range needs step > 0 and stop >= start, got: {spec}")
+        decimals = max(trailing.step_decimals(step), trailing.step_decimals(start))
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, decimals) for i in range(count)]
+    return [float(value) for value in spec.split(",") if value.strip()]
+
+
+def parse_grid(specs: Sequence[str]) -> List[Tuple[str, List[float]]]:
+    axes: Dict[str, List[float]] = {}
+    for spec in specs:
+        name, sep, values = spec.partition("=")
+        name = name.strip().replace("-", "_")
+        if not sep or name not in PARAMETERS:
+            raise ValueError(f"Grid axis must be NAME=VALUES with NAME one of {', '.join(PARAMETERS)}, got: {spec}")
+        axes[name] = parse_axis(values)
+        if not axes[name]:
+            raise ValueError(f"Grid axis {name} has no values")
+    return list(axes.items())
+
+
+def grid_points(
+    axes: List[Tuple[str, List[float]]], base: ReplayParams, samples: int = 0, seed: Optional[int] = None
+) -> List[ReplayParams]:
+    """Все точки сетки или samples разных случайных точек (по номеру точки, без построения сетки целиком)"""
+    sizes = [len(values) for _, values in axes]
+    total = math.prod(sizes)
+    if samples and samples < total:
+        indices = sorted(random.Random(seed).sample(range(total), samples))
+    elif total > MAX_GRID:
+        raise ValueError(f"Grid has {total} points; use --samples to draw a random subset")
+    else:
+        indices = range(total)
+    points = []
+    for index in indices:
+        changes = {}
+        for (name, values), size in zip(reversed(axes), reversed(sizes)):
+            index, position = divmod(index, size)
+            changes[PARAMETERS[name][0]] = values[position]
+        points.append(replace(base, **changes))
+    return points
+
+
+def fast_path(options: ReplayOptions) -> bool:
+    return options.mode == "poll" and not options.private_stream
+
+
+def poll_reads(ts: np.ndarray, interval: float) -> np.ndarray:
+    """Индексы тиков, на которых replay.simulate опрашивает позиции: та же арифметика next_read"""
+    reads = []
+    n = len(ts)
+    next_read = float(ts[0])
+    while True:
+        i = int(ts.searchsorted(next_read, "left"))
+        if i >= n:
+            break
+        reads.append(i)
+        next_read += (int((float(ts[i]) - next_read) // interval) + 1) * interval
+    return np.array(reads, dtype=np.int64)
+
+
+def _views(buf: memoryview, part: _Part) -> _SharedSeries:
+    n = part.ticks
+    b = max(part.buckets, 0)
+    floats = np.ndarray((4 * n + 2 * b,), dtype=np.float64, buffer=buf, offset=part.offset * 8)
+    reads = np.ndarray((b,), dtype=np.int64, buffer=buf, offset=(part.offset + 4 * n + 2 * b) * 8)
+    has_buckets = part.buckets >= 0
+    return _SharedSeries(
+        part.symbol,
+        floats[:n],
+        floats[n:2 * n],
+        floats[2 * n:3 * n],
+        floats[3 * n:4 * n],
+        reads if has_buckets else None,
+        floats[4 * n:4 * n + b] if has_buckets else None,
+        floats[4 * n + b:] if has_buckets else None,
+    )
+
+
+def share_series(
+    by_symbol: Dict[str, TickSeries], options: ReplayOptions
+) -> Tuple[shared_memory.SharedMemory, List[_Part]]:
+    """Копирует ряды в один блок SharedMemory и готовит опросы для прогона по событиям"""
+    prepared = []
+    for symbol in sorted(by_symbol):
+        series = by_symbol[symbol]
+        if not len(series):
+            continue
+        ts = np.asarray(series.ts, dtype=np.float64)
+        last = np.asarray(series.last, dtype=np.float64)
+        reads = None
+        # Прогон по событиям ищет тики бинарным поиском: время в ряду не должно убывать
+        if fast_path(options) and bool(np.all(ts[1:] >= ts[:-1])):
+            reads = poll_reads(ts, options.poll_interval)
+        prepared.append((symbol, series, ts, last, reads))
+
+    parts = []
+    offset = 0
+    for symbol, series, ts, _, reads in prepared:
+        buckets = len(reads) if reads is not None else -1
+        parts.append(_Part(symbol, offset, len(ts), buckets))
+        offset += 4 * len(ts) + 3 * max(buckets, 0)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1) * 8)
+    try:
+        for part, (_, series, ts, last, reads) in zip(parts, prepared):
+            view = _views(shm.buf, part)
+            view.ts[:] = ts
+            view.last[:] = last
+            view.bid[:] = np.asarray(series.bid, dtype=np.float64)
+            view.ask[:] = np.asarray(series.ask, dtype=np.float64)
+            if reads is not None:
+                view.reads[:] = reads
+                view.high[:] = np.maximum.reduceat(last, reads)
+                view.low[:] = np.minimum.reduceat(last, reads)
+            # Представления держат буфер: без их удаления SharedMemory.close() бросит BufferError
+            del view
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, parts
+
+
+def _first_exit(last: np.ndarray, begin: int, stop: int, is_buy: bool, tp: float, sl: float) -> int:
+    """Первый тик в [begin, stop), где срабатывает TP или SL; -1 — такого нет"""
+    if begin >= stop:
+        return -1
+    prices = last[begin:stop]
+    hits = np.zeros(len(prices), dtype=bool)
+    if tp:
+        hits |= prices >= tp if is_buy else prices <= tp
+    if sl:
+        hits |= prices <= sl if is_buy else prices >= sl
+    j = int(hits.argmax())
+    return begin + j if hits[j] else -1
+
+
+def simulate_polled(series: _SharedSeries, params: ReplayParams, options: ReplayOptions) -> ReplayStats:
+    """replay.simulate для режима poll без приватного потока, но только по тикам, где что-то происходит.
+
+    Тело цикла — то же, что у replay.simulate; следующий обрабатываемый тик —
+    ближайший из: опрос позиций, проверка стопа по next_eval, повторный вход,
+    срабатывание TP/SL. Последнее ищется в срезе цен только если максимум или
+    минимум цены до следующего опроса вообще достают до TP или SL.
+    """
+    stats = ReplayStats()
+    n = len(series.ts)
+    stats.ticks = n
+    if n == 0:
+        return stats
+
+    ts_array = series.ts
+    last_array = series.last
+    # Элемент memoryview — сразу float, без скаляра NumPy
+    ts = memoryview(series.ts)
+    last = memoryview(series.last)
+    bid = memoryview(series.bid)
+    ask = memoryview(series.ask)
+    reads = memoryview(series.reads)
+    high = memoryview(series.high)
+    low = memoryview(series.low)
+    buckets = len(reads)
+
+    side = options.side
+    is_buy = side == "Buy"
+    poll_interval = options.poll_interval
+    reenter_after = options.reenter_after
+    slippage = options.slippage_bps / 10000
+    fees_percent = 2 * options.fee_bps / 100
+
+    tp_percent = params.take_profit_percent
+    sl_percent = params.stop_loss_percent
+    start_percent = params.trailing_start_percent
+    distance_percent = params.trailing_distance_percent
+    distance = distance_percent / 100
+    tick_size = options.tick_size
+    min_ticks = options.min_ticks
+    half_tick = tick_size / 2
+    trailing_stop = trailing.trailing_stop
+    stop_gate = replay.stop_gate
+
+    calls_stop = checks = 0
+    # Опросы — по номеру прохода бота (t // интервал опроса), как и пакеты тейк-профитов
+    first_read_slot = last_read_slot = int(ts[0] // poll_interval)
+    order_slots: List[Tuple[int, int]] = []
+    order_start = order_end = -1
+    take_profit_slots: Dict[int, int] = {}
+    trades = take_profits = stop_outs = trailed_stop_outs = 0
+    equity = peak = max_drawdown = 0.0
+    exits: List[Tuple[float, float]] = []
+
+    in_position = False
+    protected = False
+    trailed = False
+    entry = sl = tp = 0.0
+    gate = 0.0
+    reenter_at: Optional[float] = ts[0]
+    next_eval = next_read = ts[0]
+    # Номер следующего опроса в reads
+    k = 0
+
+    i = 0
+    while i < n:
+        t = ts[i]
+        price = last[i]
+
+        if in_position:
+            exit_price = 0.0
+            if tp and (price >= tp if is_buy else price <= tp):
+                exit_price = tp
+                take_profits += 1
+            elif sl and (price <= sl if is_buy else price >= sl):
+                exit_price = bid[i] * (1 - slippage) if is_buy else ask[i] * (1 + slippage)
+                stop_outs += 1
+                if trailed:
+                    trailed_stop_outs += 1
+            if exit_price:
+                change = (exit_price - entry) / entry * 100
+                pnl = (change if is_buy else -change) - fees_percent
+                trades += 1
+                equity += pnl
+                exits.append((t, pnl))
+                if equity > peak:
+                    peak = equity
+                elif peak - equity > max_drawdown:
+                    max_drawdown = peak - equity
+                in_position = False
+                reenter_at = t + reenter_after if reenter_after is not None else None
+
+        if not in_position and reenter_at is not None and t >= reenter_at:
+            entry = ask[i] if is_buy else bid[i]
+            in_position = True
+            protected = trailed = False
+            sl = tp = 0.0
+            gate = stop_gate(is_buy, entry, 0.0, start_percent, distance, half_tick)
+
+        current = ask[i] if is_buy else bid[i]
+
+        if k < buckets and reads[k] == i:
+            k += 1
+            passes = int((t - next_read) // poll_interval) + 1
+            next_read += passes * poll_interval
+            last_read_slot = int(t // poll_interval)
+            if in_position:
+                if order_start < 0:
+                    order_start = last_read_slot
+                order_end = last_read_slot
+                if not protected:
+                    sl = trailing.stop_loss_price(side, current, sl_percent, tick_size)
+                    tp = trailing.take_profit_price(side, current, tp_percent, tick_size)
+                    calls_stop += 1
+                    slot = int(t // poll_interval)
+                    take_profit_slots[slot] = take_profit_slots.get(slot, 0) + 1
+                    protected = True
+                    gate = stop_gate(is_buy, entry, sl, start_percent, distance, half_tick)
+            elif order_start >= 0:
+                order_slots.append((order_start, order_end))
+                order_start = -1
+
+        if in_position and protected and t >= next_eval:
+            checks += 1
+            next_eval += (int((t - next_eval) // poll_interval) + 1) * poll_interval
+            if current >= gate if is_buy else current <= gate:
+                new_sl = trailing_stop(side, entry, sl, current, start_percent, distance_percent, tick_size, min_ticks)
+                if new_sl is not None:
+                    sl = new_sl
+                    gate = stop_gate(is_buy, entry, sl, start_percent, distance, half_tick)
+                    calls_stop += 1
+                    trailed = True
+
+        # Следующий тик, на котором что-то произойдёт; до опроса k — не дальше него
+        following = reads[k] if k < buckets else n
+        if in_position:
+            if protected:
+                if next_eval <= ts[following - 1]:
+                    following = min(following, max(i + 1, int(ts_array.searchsorted(next_eval, "left"))))
+                # Тик i лежит между опросами k-1 и k: их максимум и минимум отсекают срез без срабатываний
+                if is_buy:
+                    reachable = (tp and high[k - 1] >= tp) or (sl and low[k - 1] <= sl)
+                else:
+                    reachable = (tp and low[k - 1] <= tp) or (sl and high[k - 1] >= sl)
+                if reachable:
+                    j = _first_exit(last_array, i + 1, following, is_buy, tp, sl)
+                    if j >= 0:
+                        following = j
+        elif reenter_at is not None and reenter_at <= ts[following - 1]:
+            following = min(following, max(i + 1, int(ts_array.searchsorted(reenter_at, "left"))))
+        i = following
+
+    if order_start >= 0:
+        order_slots.append((order_start, order_end))
+    if in_position:
+        change = (last[n - 1] - entry) / entry * 100
+        stats.open_pnl_percent = change if is_buy else -change
+
+    stats.trades = trades
+    stats.take_profits = take_profits
+    stats.stop_outs = stop_outs
+    stats.trailed_stop_outs = trailed_stop_outs
+    stats.pnl_percent = equity
+    stats.max_drawdown_percent = max_drawdown
+    stats.exits = exits
+    stats.checks = checks
+    stats.api_calls = {
+        "get_positions": last_read_slot - first_read_slot + 1,
+        "get_open_orders": slot_count(order_slots),
+        "set_trading_stop": calls_stop,
+        "place_batch_order": replay.take_profit_batches(take_profit_slots),
+    }
+    stats.take_profit_slots = take_profit_slots
+    stats.read_slots = [(first_read_slot, last_read_slot)]
+    stats.order_slots = order_slots
+    return stats
+
+
+# Состояние процесса пула: подключение к общему блоку и представления рядов
+_shm: Optional[shared_memory.SharedMemory] = None
+_series: List[_SharedSeries] = []
+_options = ReplayOptions()
+
+
+def _init_worker(name: str, parts: List[_Part], options: ReplayOptions) -> None:
+    global _shm, _series, _options
+    _shm = shared_memory.SharedMemory(name=name)
+    _series = [_views(_shm.buf, part) for part in parts]
+    _options = options
+
+
+def simulate_shared(series: _SharedSeries, params: ReplayParams, options: ReplayOptions) -> ReplayStats:
+    if series.reads is not None:
+        return simulate_polled(series, params, options)
+    return replay.simulate(TickSeries(series.symbol, series.ts, series.last, series.bid, series.ask), params, options)
+
+
+def _run_batch(batch: List[Tuple[int, ReplayParams]]) -> List[Tuple[int, ReplayStats]]:
+    results = []
+    for index, params in batch:
+        stats = ReplayStats()
+        for series in _series:
+            stats.merge(simulate_shared(series, params, _options))
+        # Пакеты и просадка уже посчитаны по всем рядам; проходы и сделки в родителя не пересылаются
+        stats.take_profit_slots = {}
+        stats.exits = []
+        stats.read_slots = stats.order_slots = []
+        results.append((index, stats))
+    return results
+
+
+def sweep(
+    by_symbol: Dict[str, TickSeries],
+    points: List[ReplayParams],
+    options: ReplayOptions,
+    workers: int = 0,
+    progress: bool = False,
+) -> List[SweepResult]:
+    """Прогоняет все точки в пуле процессов; порядок результатов — порядок точек"""
+    workers = workers or os.cpu_count() or 1
+    shm, parts = share_series(by_symbol, options)
+    try:
+        indexed = list(enumerate(points))
+        size = max(1, min(64, len(indexed) // (workers * TASKS_PER_WORKER)))
+        batches = [indexed[i:i + size] for i in range(0, len(indexed), size)]
+        results: List[Optional[SweepResult]] = [None] * len(points)
+        done = 0
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(shm.name, parts, options),
+        ) as pool:
+            for future in as_completed([pool.submit(_run_batch, batch) for batch in batches]):
+                for index, stats in future.result():
+                    results[index] = SweepResult(points[index], stats)
+                done += 1
+                if progress:
+                    print(f"\r{done}/{len(batches)} batches", end="", file=sys.stderr, flush=True)
+        if progress:
+            print(file=sys.stderr)
+    finally:
+        shm.close()
+        shm.unlink()
+    return [result for result in results if result is not None]
+
+
+def rank(
+    results: List[SweepResult], by: str = "score", drawdown_weight: float = 1.0, call_cost: float = 0.0
+) -> List[SweepResult]:
+    """Сортирует по убыванию качества; при равенстве выше точка с меньшим числом API-запросов"""
+    for result in results:
+        stats = result.stats
+        result.score = (
+            stats.pnl_percent - drawdown_weight * stats.max_drawdown_percent - call_cost * result.api_calls / 1000
+        )
+    keys = {
+        "score": lambda r: (-r.score, r.api_calls),
+        "pnl": lambda r: (-r.stats.pnl_percent, r.stats.max_drawdown_percent, r.api_calls),
+        "drawdown": lambda r: (r.stats.max_drawdown_percent, -r.stats.pnl_percent, r.api_calls),
+        "calls": lambda r: (r.api_calls, -r.stats.pnl_percent),
+    }
+    return sorted(results, key=keys[by])
+
+
+def format_table(results: List[SweepResult]) -> str:
+    lines = [
+        f"{'#':>4}{'TP %':>8}{'SL %':>8}{'start %':>9}{'dist %':>8}{'trades':>8}{'PnL %':>10}{'max DD %':>10}"
+        f"{'API calls':>11}{'score':>10}"
+    ]
+    for place, result in enumerate(results, 1):
+        p = result.params
+        stats = result.stats
+        lines.append(
+            f"{place:>4}{p.take_profit_percent:>8g}{p.stop_loss_percent:>8g}{p.trailing_start_percent:>9g}"
+            f"{p.trailing_distance_percent:>8g}{stats.trades:>8}{stats.pnl_percent:>10.2f}"
+            f"{stats.max_drawdown_percent:>10.2f}{result.api_calls:>11}{result.score:>10.2f}"
+        )
+    return "\n".join(lines)
+
+
+def env_fragment(best: SweepResult, swept: int, symbols: Sequence[str], options: ReplayOptions, by: str) -> str:
+    stats = best.stats
+    lines = [
+        f"# sweep.py: best of {swept} parameter sets by {by}, {options.side} positions, TRAILING_MODE={options.mode}",
+        f"# symbols: {', '.join(symbols)}",
+        f"# PnL {stats.pnl_percent:.2f}% over {stats.trades} trades, max drawdown {stats.max_drawdown_percent:.2f}%, "
+        f"{best.api_calls} API calls",
+    ]
+    for field_name, env_name in PARAMETERS.values():
+        lines.append(f"{env_name}={getattr(best.params, field_name):g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_csv(path: str, results: List[SweepResult]) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [env_name for _, env_name in PARAMETERS.values()]
+            + ["trades", "take_profits", "stop_outs", "pnl_percent", "max_drawdown_percent", "checks"]
+            + list(replay.API_METHODS)
+            + ["score"]
+        )
+        for result in results:
+            stats = result.stats
+            writer.writerow(
+                [getattr(result.params, field_name) for field_name, _ in PARAMETERS.values()]
+                + [stats.trades, stats.take_profits, stats.stop_outs, round(stats.pnl_percent, 6),
+                   round(stats.max_drawdown_percent, 6), stats.checks]
+                + [stats.api_calls.get(method, 0) for method in replay.API_METHODS]
+                + [round(result.score, 6)]
+            )
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = replay.build_arg_parser()
+    parser.description = "Sweep trailing settings over recorded ticker data in parallel"
+    parser.add_argument(
+        "--grid",
+        nargs="+",
+        action="extend",
+        default=[],
+        metavar="NAME=VALUES",
+        help=f"Axis as start:stop:step or a comma list; NAME is one of {', '.join(PARAMETERS)}",
+    )
+    parser.add_argument("--samples", type=int, default=0, help="Random distinct grid points instead of the full grid")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (0 = CPU count)")
+    parser.add_argument("--rank", choices=RANKS, default="score")
+    parser.add_argument("--drawdown-weight", type=float, default=1.0, help="Score penalty per percent of drawdown")
+    parser.add_argument("--call-cost", type=float, default=0.0, help="Score penalty per 1000 API calls")
+    parser.add_argument("--top", type=int, default=20, help="Rows to print")
+    parser.add_argument("--env-out", default="", help="Write the best settings as a .env fragment to this file")
+    parser.add_argument("--csv", default="", help="Write all ranked results to this CSV file")
+    return parser
+
+
+def main() -> None:
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    if not args.grid:
+        parser.error("at least one --grid axis is required")
+    try:
+        axes = parse_grid(args.grid)
+        points = grid_points(axes, replay.params_from_args(args), args.samples, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    options = replay.options_from_args(args)
+    by_symbol = replay.load_series(args.paths)
+    ticks = sum(len(series) for series in by_symbol.values())
+    if not fast_path(options):
+        print(f"Mode {options.mode} is replayed tick by tick; --mode poll is much faster", file=sys.stderr)
+
+    started = time.perf_counter()
+    results = sweep(by_symbol, points, options, args.workers, progress=sys.stderr.isatty())
+    elapsed = time.perf_counter() - started
+    ranked = rank(results, args.rank, args.drawdown_weight, args.call_cost)
+
+    print(format_table(ranked[:args.top]))
+    print()
+    rate = ticks * len(points) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Swept {len(points)} parameter sets over {ticks} ticks of {len(by_symbol)} symbols in {elapsed:.1f}s "
+        f"({rate * 60 / 1e6:.0f}M ticks/min)"
+    )
+    if args.csv:
+        write_csv(args.csv, ranked)
+    if ranked:
+        fragment = env_fragment(ranked[0], len(points), sorted(by_symbol), options, args.rank)
+        print()
+        print(fragment, end="")
+        if args.env_out:
+            with open(args.env_out, "w") as f:
+                f.write(fragment)
+
+
+if __name__ == "__main__":
+    main()
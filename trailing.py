@@ -0,0 +1,149 @@
+"""Правила SL/TP/трейлинга без побочных эффектов.
+
+Используются ботом (main.py) и офлайн-движком воспроизведения (replay.py),
+чтобы в бэктесте работала ровно та же логика, что и в бою.
+"""
+import math
+from decimal import Decimal
+from typing import Optional, Tuple
+
+
+def step_decimals(step: float) -> int:
+    """Число знаков после запятой у шага цены/количества (0.0005 -> 4)"""
+    return max(0, -Decimal(str(step)).normalize().as_tuple().exponent)
+
+
+def snap_to_step(value: float, step: float) -> float:
+    """Ближайшее кратное шагу; при step <= 0 — прежнее округление до 6 знаков"""
+    if step <= 0:
+        return round(value, 6)
+    return round(round(value / step) * step, step_decimals(step))
+
+
+def floor_to_step(value: float, step: float) -> float:
+    if step <= 0:
+        return value
+    # Небольшой допуск, чтобы 0.3 / 0.1 = 2.9999999999999996 не округлялось вниз
+    return round(int(value / step + 1e-9) * step, step_decimals(step))
+
+
+def stop_loss_price(side: str, current_price: float, stop_loss_percent: float, tick_size: float = 0.0) -> float:
+    """Начальный стоп-лосс; stop_loss_percent отрицательный (например, -2.5)"""
+    if side == "Buy":
+        return snap_to_step(current_price * (1 + stop_loss_percent / 100), tick_size)
+    return snap_to_step(current_price * (1 - stop_loss_percent / 100), tick_size)
+
+
+def take_profit_price(side: str, current_price: float, take_profit_percent: float, tick_size: float = 0.0) -> float:
+    if side == "Buy":
+        return snap_to_step(current_price * (1 + take_profit_percent / 100), tick_size)
+    return snap_to_step(current_price * (1 - take_profit_percent / 100), tick_size)
+
+
+def price_change_percent(side: str, entry_price: float, current_price: float) -> float:
+    if side == "Buy":
+        return ((current_price - entry_price) / entry_price) * 100
+    return ((entry_price - current_price) / entry_price) * 100
+
+
+def is_better_stop(side: str, new_stop_loss: float, current_stop_loss: float) -> bool:
+    if side == "Buy":
+        return new_stop_loss > current_stop_loss
+    return current_stop_loss == 0.0 or new_stop_loss < current_stop_loss
+
+
+def trailing_stop(
+    side: str,
+    entry_price: float,
+    current_stop_loss: float,
+    current_price: float,
+    trailing_start_percent: float,
+    trailing_distance_percent: float,
+    tick_size: float = 0.0,
+    min_ticks: int = 0,
+) -> Optional[float]:
+    """Новый уровень трейлинг-стопа или None, если стоп двигать не нужно.
+
+    С tick_size уровень кладётся на сетку цены инструмента, а сдвиг меньше
+    min_ticks тиков от текущего стопа считается ненужным.
+    """
+    if entry_price <= 0 or current_price <= 0:
+        return None
+
+    if price_change_percent(side, entry_price, current_price) < trailing_start_percent:
+        return None
+
+    if side == "Buy":
+        sl_candidate = snap_to_step(current_price * (1 - trailing_distance_percent / 100), tick_size)
+    else:
+        sl_candidate = snap_to_step(current_price * (1 + trailing_distance_percent / 100), tick_size)
+    if not is_better_stop(side, sl_candidate, current_stop_loss):
+        return None
+    if tick_size > 0 and min_ticks > 0 and current_stop_loss != 0.0:
+        # Допуск на погрешность float: сдвиг ровно в 2 тика не должен стать 1.999...
+        if abs(sl_candidate - current_stop_loss) < (min_ticks - 1e-6) * tick_size:
+            return None
+    return sl_candidate
+
+
+def trigger_gap(
+    side: str,
+    entry_price: float,
+    current_stop_loss: float,
+    current_price: float,
+    trailing_start_percent: float,
+    trailing_distance_percent: float,
+    tick_size: float = 0.0,
+    min_ticks: int = 0,
+) -> float:
+    """Сколько процентов цены осталось до ближайшего события, меняющего стоп.
+
+    До активации трейлинга — до уровня активации, после — до цены, при которой
+    trailing_stop вернёт стоп на min_ticks тиков лучше текущего; в обоих
+    случаях и до самого стопа. 0 — событие уже наступило, NaN — нет цены.
+    """
+    if entry_price <= 0 or current_price <= 0:
+        return math.nan
+    sign = 1 if side == "Buy" else -1
+    factor = 1 - sign * trailing_distance_percent / 100
+    change = price_change_percent(side, entry_price, current_price)
+    if change < trailing_start_percent:
+        gap = trailing_start_percent - change
+    elif side == "Sell" and current_stop_loss == 0:
+        gap = 0.0
+    else:
+        required = min_ticks * tick_size if current_stop_loss > 0 else 0.0
+        shortfall = required - sign * (current_price * factor - current_stop_loss)
+        gap = max(shortfall, 0.0) / (current_price * factor) * 100
+    if current_stop_loss > 0:
+        gap = min(gap, sign * (current_price - current_stop_loss) / current_price * 100)
+    return max(gap, 0.0)
+
+
+def exchange_trailing_stop(
+    side: str,
+    entry_price: float,
+    current_price: float,
+    trailing_start_percent: float,
+    trailing_distance_percent: float,
+    tick_size: float = 0.0,
+) -> Optional[Tuple[float, float]]:
+    """Параметры нативного трейлинга Bybit: (trailingStop, activePrice).
+
+    Активация — цена входа плюс trailing_start_percent в сторону прибыли,
+    дистанция — trailing_distance_percent от цены активации, но не меньше
+    одного тика. Если цена уже прошла активацию, activePrice = 0: биржа
+    начинает вести стоп сразу. None — если цены ещё нет.
+    """
+    if entry_price <= 0:
+        return None
+    if side == "Buy":
+        active_price = snap_to_step(entry_price * (1 + trailing_start_percent / 100), tick_size)
+        reached = current_price >= active_price
+    else:
+        active_price = snap_to_step(entry_price * (1 - trailing_start_percent / 100), tick_size)
+        reached = 0 < current_price <= active_price
+    distance = snap_to_step(active_price * trailing_distance_percent / 100, tick_size)
+    if tick_size > 0:
+        distance = max(distance, tick_size)
+    return distance, 0.0 if reached else active_price